@@ -6,14 +6,14 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import user_passes_test
 from django.http import JsonResponse
 from django.contrib import messages
-from django.db.models import Prefetch, Count, Q
+from django.db.models import Case, CharField, Prefetch, Count, Q, Value, When
 from django.utils import timezone
-from django.core.paginator import Paginator
 from datetime import timedelta
 
 from main.models import Product, NotificationEvent, ErrorLog, User, Category
 from admin_app.models import CommonCategory, NotificationLog
-from main.utils.pagination_helper import paginate_queryset
+from main.utils.pagination_helper import keyset_paginate
+from main.utils.product_search import search_product_ids
 
 
 # =============================
@@ -82,7 +82,6 @@ def admin_user_list(request):
         User.objects
         .annotate(product_count=Count("products"))
         .select_related("profile")
-        .order_by("id")
     )
 
     if query:
@@ -106,12 +105,11 @@ def admin_user_list(request):
     if end_date:
         users = users.filter(**{f"{date_field}__date__lte": end_date})
 
-    page_obj, paginator = paginate_queryset(request, users, per_page=20)
+    page_obj = keyset_paginate(request, users, ["id"], per_page=20)
 
     context = {
         "users": page_obj,
         "page_obj": page_obj,
-        "paginator": paginator,
         "query": query,
         "role": role,
         "is_active": is_active,
@@ -160,15 +158,19 @@ def admin_product_list(request):
         Product.objects.all_with_deleted()
         .select_related("user")
         .prefetch_related("categories")
-        .order_by("-created_at")
     )
 
     if query:
+        # 商品名・ショップ名は n-gram 索引、ユーザー名・カテゴリ名は小さい表を先に引いて
+        # ID のサブクエリにする（カテゴリの JOIN と distinct を使わない）
+        category_product_ids = Product.categories.through.objects.filter(
+            category__category_name__icontains=query
+        ).values("product_id")
         products = products.filter(
-            Q(product_name__icontains=query)
-            | Q(user__username__icontains=query)
-            | Q(categories__category_name__icontains=query)
-        ).distinct()
+            Q(id__in=search_product_ids(query, products))
+            | Q(user__in=User.objects.filter(username__icontains=query).values("id"))
+            | Q(id__in=category_product_ids)
+        )
 
     if is_deleted == "true":
         products = products.filter(is_deleted=True)
@@ -186,12 +188,11 @@ def admin_product_list(request):
     if end_date:
         products = products.filter(created_at__date__lte=end_date)
 
-    page_obj, paginator = paginate_queryset(request, products, per_page=20)
+    page_obj = keyset_paginate(request, products, ["-created_at"], per_page=20)
 
     context = {
         "products": page_obj,
         "page_obj": page_obj,
-        "paginator": paginator,
         "query": query,
         "flag_type": flag_type,
         "priority": priority,
@@ -278,9 +279,7 @@ def admin_notification_list(request):
     method = request.GET.get("method", "").strip()
     ntype = request.GET.get("type", "").strip()
 
-    logs = NotificationEvent.objects.select_related(
-        "user", "product"
-    ).order_by("-occurred_at")
+    logs = NotificationEvent.objects.select_related("user", "product")
 
     if query:
         logs = logs.filter(
@@ -312,11 +311,17 @@ def admin_notification_list(request):
     if end_date:
         logs = logs.filter(occurred_at__date__lte=end_date)
 
-    for log in logs:
-        log.method = "email" if log.event_type.startswith("mail_") else "app"
+    # 通知方法の表示ラベルは SQL 側で付ける（全件を Python に読み込まない）
+    logs = logs.annotate(
+        method=Case(
+            When(event_type__startswith="mail_", then=Value("email")),
+            default=Value("app"),
+            output_field=CharField(),
+        )
+    )
 
-    per_page = int(request.GET.get("per_page", 20))
-    page_obj, paginator = paginate_queryset(request, logs, per_page=per_page)
+    # ?per_page= は keyset_paginate 側で読み取り、上限（100件）で頭打ちにする
+    page_obj = keyset_paginate(request, logs, ["-occurred_at"], per_page=20)
 
     type_list = [
         "mail_buy_timing",
@@ -331,7 +336,6 @@ def admin_notification_list(request):
     context = {
         "logs": page_obj,
         "page_obj": page_obj,
-        "paginator": paginator,
         "query": query,
         "start_date": start_date,
         "end_date": end_date,
@@ -383,17 +387,13 @@ def admin_error_logs(request):
     type_list = ErrorLog.objects.values_list(
         "type_name", flat=True).distinct().order_by("type_name")
 
-    per_page = int(request.GET.get("per_page", 20))
-    paginator = Paginator(logs, per_page)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = keyset_paginate(request, logs, ["-created_at"], per_page=20)
 
     return render(
         request,
         "admin_app/admin_error_logs.html",
         {
             "logs": page_obj,
-            "paginator": paginator,
             "page_obj": page_obj,
             "query": query,
             "status": status,
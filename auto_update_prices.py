@@ -5,11 +5,10 @@ import time
 import random
 import schedule
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import django
 from django.utils import timezone
-from django.db.models import Min
 
 # === プロジェクトルートをパスに追加 ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -20,8 +19,12 @@ if BASE_DIR not in sys.path:
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kaidoki.settings")
 django.setup()
 
-from main.models import Product, PriceHistory, NotificationEvent, Flag
+from main.models import Product, PriceHistory
+from main.utils.flag_checker import evaluate_flags_bulk
+from main.utils.notify_events import EventCollector
 from main.tasks_send_notifications import send_notifications
+from main.utils.price_rollup import record_rollups
+from main.utils.price_stats import get_stats, record_samples
 
 
 # ==============================
@@ -77,107 +80,78 @@ def update_prices():
             log_info("⚠ 商品データが存在しません。")
             return
 
+        # 通知イベントはループ後に重複判定（1クエリ）して一括作成
+        events = EventCollector()
+
         for product in products:
             base_price = float(product.initial_price or product.regular_price or 1000)
             new_price = int(base_price * random.uniform(0.8, 1.2))
 
             # === 価格履歴登録 ===
+            # 最安値判定は追加前の統計（過去最安値）と比べる
+            stats = get_stats(product)
+            previous_min = stats.min_price if stats else None
             PriceHistory.objects.create(
                 product=product,
                 price=new_price,
                 checked_at=timezone.now(),
             )
+            record_samples([(product.id, new_price, True)])
+            record_rollups([(product.id, new_price, None)])
             log_info(f"✅ {product.product_name} に ¥{new_price} を追加")
 
             # === 買い時価格通知 ===
             threshold = product.threshold_price
             if threshold and new_price <= float(threshold):
                 message = f"💡『{product.product_name}』が買い時価格（¥{int(threshold)}）を下回りました！（現在¥{new_price}）"
-                since = timezone.now() - timedelta(hours=24)
-                exists = NotificationEvent.objects.filter(
-                    user=product.user,
-                    product=product,
-                    event_type=NotificationEvent.EventType.THRESHOLD_HIT,
-                    occurred_at__gte=since,
-                ).exists()
-
-                if not exists:
-                    NotificationEvent.objects.create(
-                        user=product.user,
-                        product=product,
-                        event_type=NotificationEvent.EventType.THRESHOLD_HIT,
-                        message=message,
-                    )
-                    log_info(f"🧭 イベント記録: {message}")
-                else:
-                    log_info(f"⏩ 重複通知スキップ: {product.product_name}")
+                # 24時間以内の重複はループ後にまとめて判定する
+                events.add(product, "threshold_hit", message)
 
             # === 最安値通知 ===
             try:
-                lowest_flag = Flag.objects.filter(
-                    product=product, flag_type="LOWEST_PRICE", is_active=True
-                ).first()
-
-                if lowest_flag:
-                    min_price = PriceHistory.objects.filter(
-                        product=product
-                    ).aggregate(Min("price"))["price__min"]
+                # 通知条件は商品の flag_type で判定（商品ごとの追加クエリなし）
+                if product.flag_type == "lowest_price":
+                    min_price = new_price if previous_min is None else min(
+                        int(previous_min), new_price)
 
-                    if min_price is not None and new_price == min_price:
+                    if new_price == min_price:
                         message = f"🏷️『{product.product_name}』が過去最安値（¥{min_price:,}）を更新しました！"
-                        NotificationEvent.objects.create(
-                            user=product.user,
-                            product=product,
-                            event_type=NotificationEvent.EventType.LOWEST_PRICE,
-                            message=message,
-                        )
+                        events.add(product, "lowest_price", message)
                         log_info(f"✅ 最安値通知: {message}")
             except Exception as e:
                 log_error(f"[最安値判定エラー] {product.product_name}: {e}")
 
             # === 割引率通知 ===
             try:
-                discount_flag = Flag.objects.filter(
-                    product=product, flag_type="DISCOUNT_OVER", is_active=True
-                ).first()
-
-                if discount_flag and product.regular_price:
+                if (product.flag_type == "percent_off"
+                        and product.flag_value and product.initial_price):
                     discount_rate = (
-                        (float(product.regular_price) - new_price)
-                        / float(product.regular_price)
+                        (float(product.initial_price) - new_price)
+                        / float(product.initial_price)
                     ) * 100
-                    threshold_rate = float(discount_flag.value or 0)
+                    threshold_rate = float(product.flag_value)
 
                     if discount_rate >= threshold_rate:
                         message = (
                             f"💰『{product.product_name}』が{threshold_rate:.0f}%以上の割引になりました！"
                             f"（現在 {discount_rate:.1f}% OFF, ¥{new_price}）"
                         )
-                        since = timezone.now() - timedelta(hours=24)
-                        exists = NotificationEvent.objects.filter(
-                            user=product.user,
-                            product=product,
-                            event_type=NotificationEvent.EventType.DISCOUNT_OVER,
-                            occurred_at__gte=since,
-                        ).exists()
-
-                        if not exists:
-                            NotificationEvent.objects.create(
-                                user=product.user,
-                                product=product,
-                                event_type=NotificationEvent.EventType.DISCOUNT_OVER,
-                                message=message,
-                            )
-                            log_info(f"🎯 割引率イベント記録: {message}")
-                        else:
-                            log_info(f"⏩ 割引率通知スキップ: {product.product_name}")
+                        events.add(product, "discount_over", message)
+                        log_info(f"🎯 割引率イベント登録: {message}")
 
             except Exception as e:
                 log_error(f"[割引率判定エラー] {product.product_name}: {e}")
 
+        created_events = events.flush()
+        log_info(f"🧭 通知イベント記録: {len(created_events)}件")
+
+        # === 買い時フラグを全商品まとめて再判定（1パス＋変化した行だけ UPDATE） ===
+        changed, triggered = evaluate_flags_bulk(products)
+        log_info(f"🚩 買い時フラグ更新: {changed}件（新たに買い時 {len(triggered)}件）")
+
         log_info(f"💾 全商品の価格履歴を更新しました ({datetime.now().strftime('%H:%M:%S')})\n")
 
-        # === 通知処理呼び出し ===
+        # === 通知処理呼び出し（送信待ちに登録するだけ。SMTP送信は drain_email_outbox） ===
         log_info("💌 通知処理を実行中...")
         send_notifications()
         log_info("💌 通知処理が完了しました。\n")
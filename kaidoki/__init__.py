@@ -0,0 +1,4 @@
+# Celery アプリを Django 起動時に読み込み、@shared_task が登録されるようにする
+from .celery import app as celery_app
+
+__all__ = ("celery_app",)
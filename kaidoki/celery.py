@@ -0,0 +1,25 @@
+"""
+Celery config for kaidoki project.
+
+価格更新を「スケジュール → 取得 → 通知」の3段に分け、キューごとに
+ワーカー数を増減できるようにする。
+
+起動例:
+    celery -A kaidoki beat                          # スケジューラ（1プロセスのみ）
+    celery -A kaidoki worker -Q schedule -c 1       # 対象商品の抽出・ジョブ投入
+    celery -A kaidoki worker -Q fetch -c 4          # 楽天API取得・DB反映（複数可）
+    celery -A kaidoki worker -Q notify -c 1         # 通知メール送信
+
+ブローカーは既定で SQLite（sqla+）を使うため Redis なしで動く。
+本番は CELERY_BROKER_URL に redis:// や sqla+mysql:// を指定する。
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kaidoki.settings")
+
+app = Celery("kaidoki")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
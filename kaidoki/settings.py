@@ -123,6 +123,42 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# ===== キャッシュ =====
+# REDIS_URL を設定するとプロセス間で共有される Redis を使う（redis パッケージが必要）。
+# 未設定時はプロセスごとのメモリキャッシュ（開発用）。
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# 未読通知数キャッシュの有効期限（秒）。切れたら実件数で数え直す。
+# 価格バッチ・Celery での増加や他ワーカーでの減少はプロセス間で共有するキャッシュでないと
+# 届かないため、REDIS_URL 未設定（メモリキャッシュ）時は既定で 0（毎回 COUNT する）
+UNREAD_COUNT_CACHE_SECONDS = int(
+    os.getenv("UNREAD_COUNT_CACHE_SECONDS", "300" if REDIS_URL else "0"))
+
+# 商品一覧の結果キャッシュの有効期限（秒）。商品・カテゴリの変更時は版番号で即時に無効化する。
+# 価格バッチ（Celery・管理コマンド）が上げた版番号はプロセス間で共有するキャッシュでないと
+# Web プロセスに届かないため、REDIS_URL 未設定（メモリキャッシュ）時は既定で 0（キャッシュしない）
+PRODUCT_LIST_CACHE_SECONDS = int(
+    os.getenv("PRODUCT_LIST_CACHE_SECONDS", "600" if REDIS_URL else "0"))
+
+# 通知のプッシュ配信（SSE）：無通信時のキープアライブ間隔・1接続の最大時間（秒）・接続ごとの送信待ち上限
+# （ASGI サーバー上でのみ配信。WSGI では 503 を返し、ブラウザ側は30秒ポーリングに切り替わる）
+NOTIFY_STREAM_HEARTBEAT_SECONDS = int(os.getenv("NOTIFY_STREAM_HEARTBEAT_SECONDS", "25"))
+NOTIFY_STREAM_MAX_SECONDS = int(os.getenv("NOTIFY_STREAM_MAX_SECONDS", "600"))
+NOTIFY_STREAM_QUEUE_SIZE = 100
+
 # ===== 認証・遷移 =====
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/main/product/list/"
@@ -201,3 +237,96 @@ else:
 RAKUTEN_APP_ID = os.getenv("RAKUTEN_APP_ID", "1016082687225252652")
 RAKUTEN_BASE_URL = os.getenv(
     "RAKUTEN_BASE_URL", "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601")
+
+# 楽天APIのレート制限（アプリIDあたりのクォータ。既定: 1リクエスト/秒）
+RAKUTEN_RATE_LIMIT_PER_SEC = float(
+    os.getenv("RAKUTEN_RATE_LIMIT_PER_SEC", "1"))
+
+# 価格更新バッチの同時実行数（API待ち時間を重ねるためのスレッド数）
+PRICE_FETCH_WORKERS = int(os.getenv("PRICE_FETCH_WORKERS", "4"))
+
+# 楽天API通信設定（接続／読み込みタイムアウト秒・429/5xx リトライ）
+RAKUTEN_CONNECT_TIMEOUT = float(os.getenv("RAKUTEN_CONNECT_TIMEOUT", "3.05"))
+RAKUTEN_READ_TIMEOUT = float(os.getenv("RAKUTEN_READ_TIMEOUT", "10"))
+RAKUTEN_MAX_RETRIES = int(os.getenv("RAKUTEN_MAX_RETRIES", "3"))
+RAKUTEN_BACKOFF_FACTOR = float(os.getenv("RAKUTEN_BACKOFF_FACTOR", "0.5"))
+
+# 価格更新バッチのDB書き込み単位（この件数ごとに bulk_create / bulk_update を1トランザクションで実行）
+PRICE_WRITE_CHUNK_SIZE = int(os.getenv("PRICE_WRITE_CHUNK_SIZE", "200"))
+
+# 適応型価格チェック間隔（分）：優先度・価格変動・買い時価格との距離で伸縮
+POLL_BASE_INTERVAL_MINUTES = int(os.getenv("POLL_BASE_INTERVAL_MINUTES", "120"))
+POLL_MIN_INTERVAL_MINUTES = int(os.getenv("POLL_MIN_INTERVAL_MINUTES", "15"))
+POLL_MAX_INTERVAL_MINUTES = int(os.getenv("POLL_MAX_INTERVAL_MINUTES", "1440"))
+POLL_VOLATILITY_DAYS = int(os.getenv("POLL_VOLATILITY_DAYS", "7"))
+POLL_TICK_MINUTES = int(os.getenv("POLL_TICK_MINUTES", "5"))
+
+# =============================
+# 価格グラフ
+# =============================
+# 1回のレスポンスで返す点数の上限（超える期間は時間足・日足にまとめる）
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+
+# =============================
+# メール送信（アウトボックス）
+# =============================
+# 通知処理は EmailOutbox に書き込むだけにし、drain_email_outbox が送信する
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "100"))
+EMAIL_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "4"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_BACKOFF_SECONDS = int(os.getenv("EMAIL_OUTBOX_BACKOFF_SECONDS", "60"))
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = int(os.getenv("EMAIL_OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+# 送信中のまま処理期限を過ぎたメールは別のワーカーが取り直す
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", "300"))
+
+# =============================
+# Celery（価格更新ジョブキュー）
+# =============================
+# 既定は SQLite ファイルをブローカーにする（Redis 不要）。本番は環境変数で切り替え。
+from celery.schedules import crontab  # noqa: E402
+CELERY_BROKER_URL = os.getenv(
+    "CELERY_BROKER_URL", f"sqla+sqlite:///{BASE_DIR / 'celery_broker.sqlite3'}")
+CELERY_RESULT_BACKEND = None
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# ステージごとにキューを分け、ワーカー数を個別に増減できるようにする
+CELERY_TASK_ROUTES = {
+    "main.tasks.schedule_due_items": {"queue": "schedule"},
+    "main.tasks.refresh_item": {"queue": "fetch"},
+    "main.tasks.dispatch_notifications": {"queue": "notify"},
+    "main.tasks.rebuild_price_stats": {"queue": "schedule"},
+    "main.tasks.drain_email_outbox": {"queue": "mail"},
+    "main.tasks.apply_notification_retention": {"queue": "schedule"},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    "schedule-due-items": {
+        "task": "main.tasks.schedule_due_items",
+        "schedule": timedelta(minutes=POLL_TICK_MINUTES),
+    },
+    "dispatch-notifications": {
+        "task": "main.tasks.dispatch_notifications",
+        "schedule": timedelta(minutes=1),
+    },
+    "drain-email-outbox": {
+        "task": "main.tasks.drain_email_outbox",
+        "schedule": timedelta(seconds=30),
+    },
+    "rebuild-price-stats": {
+        "task": "main.tasks.rebuild_price_stats",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "apply-notification-retention": {
+        "task": "main.tasks.apply_notification_retention",
+        "schedule": crontab(hour=4, minute=0),
+    },
+}
+
+# 取得ワーカー1プロセスあたりのレート（楽天APIクォータ ÷ fetch ワーカー数 を目安に設定）
+CELERY_FETCH_RATE_LIMIT = os.getenv("CELERY_FETCH_RATE_LIMIT", "1/s")
+
+# ジョブ投入後、ワーカーが処理するまで同じ商品を再投入しないための猶予（分）
+PRICE_JOB_LEASE_MINUTES = int(os.getenv("PRICE_JOB_LEASE_MINUTES", "30"))
@@ -1,19 +1,26 @@
-
 from .models import Product
-from .price_logic import update_stock_status
-import requests, time
+from .price_logic import fetch_rakuten_product_data, update_stock_status
+from .utils.notify_events import EventCollector
+from .utils.price_updater import group_by_item
+from .utils.rakuten_api import parse_item_code
+import time
 
 def update_all_stock_from_api():
-    """全商品に対して在庫情報をAPI経由で更新"""
-    products = Product.objects.all()
-    for product in products:
+    """全商品に対して在庫情報をAPI経由で更新（共通クライアント経由・商品コード単位で1回取得）"""
+    products = Product.objects.select_related("user")
+    events = EventCollector()
+    for products_in_group in group_by_item(products).values():
+        head = products_in_group[0]
         try:
-            # 仮APIエンドポイント例
-            api_url = f"https://api.rakuten.co.jp/item?url={product.product_url}"
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                api_data = response.json()
-                update_stock_status(product, api_data)
+            try:
+                item_code = parse_item_code(head.product_url)
+            except ValueError:
+                item_code = None
+            api_data = fetch_rakuten_product_data(
+                head.product_name, user=head.user, item_code=item_code)
+            for product in products_in_group:
+                update_stock_status(product, api_data, events=events)
             time.sleep(0.5)  # API負荷対策
         except Exception as e:
-            print(f"[Error] {product.product_name}: {e}")
+            print(f"[Error] {head.product_name}: {e}")
+    events.flush()
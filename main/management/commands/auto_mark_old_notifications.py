@@ -1,13 +1,12 @@
 # main/management/commands/auto_mark_old_notifications.py
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from main.models import NotificationEvent, UserNotificationSetting
+from main.utils.notification_retention import mark_expired_as_read
 
 
 class Command(BaseCommand):
     """
     ✅ 古い通知を自動既読にするバッチ
+    保持期間（7日／30日）ごとに UPDATE を1文ずつ実行する（無制限のユーザーは対象外）。
     実行例: python manage.py auto_mark_old_notifications
     """
 
@@ -16,37 +15,12 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.NOTICE("🔄 古い通知の自動既読処理を開始します..."))
 
-        settings = UserNotificationSetting.objects.all()
-        total_marked = 0
-
-        for setting in settings:
-            user = setting.user
-            retention_days = setting.notification_retention_days
-
-            # 無制限（365日）の場合はスキップ
-            if retention_days >= 365:
-                continue
-
-            # 保持期間を過ぎた日時を計算
-            cutoff_date = timezone.now() - timedelta(days=retention_days)
-
-            # 対象の通知を取得
-            old_notifications = NotificationEvent.objects.filter(
-                user=user,
-                is_read=False,
-                occurred_at__lt=cutoff_date
+        result = mark_expired_as_read()
+        for days, count in result.items():
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ 保持期間 {days}日: {count}件の通知を既読にしました")
             )
 
-            count = old_notifications.count()
-            if count > 0:
-                # 一括で既読にする
-                old_notifications.update(is_read=True)
-                total_marked += count
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"✅ {user.username}: {count}件の通知を既読にしました")
-                )
-
         self.stdout.write(
-            self.style.SUCCESS(f"\n完了: 合計 {total_marked}件の通知を既読にしました")
+            self.style.SUCCESS(f"\n完了: 合計 {sum(result.values())}件の通知を既読にしました")
         )
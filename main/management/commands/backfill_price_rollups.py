@@ -0,0 +1,37 @@
+# main/management/commands/backfill_price_rollups.py
+from django.core.management.base import BaseCommand
+from main.utils.price_rollup import backfill_rollups
+
+
+class Command(BaseCommand):
+    """
+    ✅ 既存の価格履歴からグラフ用の時間足・日足（PriceRollup）を作成する
+    導入時に1回実行すれば、以降は価格取得バッチが差分更新する。
+    実行例: python manage.py backfill_price_rollups
+    実行例（商品指定）: python manage.py backfill_price_rollups --product=12
+    """
+
+    help = "価格履歴からグラフ用の時間足・日足を作成"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            default=None,
+            help="対象の商品ID（複数指定可。省略時は全商品）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="一括書き込みの件数",
+        )
+
+    def handle(self, *args, **options):
+        count = backfill_rollups(
+            product_ids=options["product"],
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 時間足・日足を作成しました（{count}件）"))
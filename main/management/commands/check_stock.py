@@ -4,6 +4,9 @@ from django.utils import timezone
 from django.contrib.auth import get_user_model
 from main.models import Product, ErrorLog
 from main import price_logic
+from main.utils.notify_events import EventCollector
+from main.utils.price_updater import group_by_item
+from main.utils.rakuten_api import parse_item_code
 import logging
 import time
 
@@ -19,50 +22,66 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(
             f"[{start_time:%Y-%m-%d %H:%M:%S}] 在庫チェック開始"))
 
-        total_products = Product.objects.count()
         total_users = User.objects.count()
         success_count, fail_count, skipped_count = 0, 0, 0
 
-        for user in User.objects.all():
-            self.stdout.write(self.style.HTTP_INFO(
-                f"--- ユーザー: {user.username} ---"))
-            products = Product.objects.filter(user=user)
-            total_user_products = products.count()
+        # 🔸 検索文字数チェック（英数字1文字の場合はスキップ）
+        targets = []
+        for product in Product.objects.select_related("user"):
+            if not product.product_name or len(product.product_name.strip()) < 2:
+                self.stdout.write(
+                    f"[{product.user.username}] {product.product_name} → スキップ（検索語が短すぎ）"
+                )
+                skipped_count += 1
+                continue
+            targets.append(product)
 
-            for idx, product in enumerate(products, start=1):
+        # ✅ 同じ shopCode:itemCode の商品はユーザーをまたいで1回だけ取得
+        groups = group_by_item(targets)
+        # 通知イベントは最後にまとめて重複判定・一括作成
+        events = EventCollector()
+        total_products = len(targets) + skipped_count
+        self.stdout.write(self.style.HTTP_INFO(
+            f"--- 対象 {len(targets)}商品 / API取得 {len(groups)}件 ---"))
+
+        for idx, (key, products) in enumerate(groups.items(), start=1):
+            head = products[0]
+            try:
+                item_code = parse_item_code(head.product_url)
+            except ValueError:
+                item_code = None
+
+            api_data = price_logic.fetch_rakuten_product_data(
+                head.product_name, user=head.user, item_code=item_code)
+
+            for product in products:
                 try:
-                    # 🔸 検索文字数チェック（英数字1文字の場合はスキップ）
-                    if not product.product_name or len(product.product_name.strip()) < 2:
-                        self.stdout.write(
-                            f"({idx}/{total_user_products}) {product.product_name} → スキップ（検索語が短すぎ）"
-                        )
-                        skipped_count += 1
-                        continue
-
-                    api_data = price_logic.mock_fetch_rakuten_product_data(
-                        product.product_name, user=user)
-                    price_logic.update_stock_status(product, api_data)
+                    price_logic.update_stock_status(product, api_data, events=events)
                     success_count += 1
                     self.stdout.write(
-                        f"({idx}/{total_user_products}) {product.product_name} 更新完了")
-                    time.sleep(1)  # API呼び出し間隔（レート制限対策）
+                        f"({idx}/{len(groups)}) [{product.user.username}] {product.product_name} 更新完了")
 
                 except Exception as e:
                     fail_count += 1
                     msg = f"[BatchStockError] {product.id}: {e}"
                     logger.error(msg)
                     ErrorLog.objects.create(
-                        user=user,
+                        user=product.user,
                         type_name="BatchStockError",
                         source="check_stock_command",
-                        detail=str(e),
+                        message=str(e),
                     )
 
+            time.sleep(1)  # API呼び出し間隔（レート制限対策）
+
+        created_events = events.flush()
+        self.stdout.write(f"🔔 通知イベント作成: {len(created_events)} 件")
+
         end_time = timezone.now()
         elapsed = (end_time - start_time).total_seconds()
 
         summary = (
-            f"\n[完了] 全{total_users}ユーザー / {total_products}商品 を処理\n"
+            f"\n[完了] 全{total_users}ユーザー / {total_products}商品 を処理（API呼び出し {len(groups)}回）\n"
             f"成功: {success_count} 件 / 失敗: {fail_count} 件 / スキップ: {skipped_count} 件\n"
             f"処理時間: {elapsed:.1f} 秒"
         )
@@ -1,15 +1,35 @@
 from django.core.management.base import BaseCommand
-from main.models import NotificationEvent
-from django.utils import timezone
-from datetime import timedelta
+from main.utils.notification_retention import (
+    DELETE_AFTER_DAYS,
+    DELETE_CHUNK_SIZE,
+    delete_old_events,
+)
 
 
 class Command(BaseCommand):
-    help = "古い通知（30日以上）を削除します。"
+    """
+    ✅ 既読のまま一定期間（既定30日）を過ぎた通知を削除する
+    主キーの範囲ごとに分けて削除するため、1回の DELETE のロック時間は一定に収まる。
+    実行例: python manage.py cleanup_notifications --days=30 --chunk-size=5000
+    """
 
-    def handle(self, *args, **kwargs):
-        expiration_date = timezone.now() - timedelta(days=30)
-        deleted_count, _ = NotificationEvent.objects.filter(
-            created_at__lt=expiration_date
-        ).delete()
+    help = "古い既読通知（30日以上）を削除します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=DELETE_AFTER_DAYS,
+            help="この日数より前の既読通知を削除",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DELETE_CHUNK_SIZE,
+            help="1回の DELETE で対象にする主キーの範囲",
+        )
+
+    def handle(self, *args, **options):
+        deleted_count = delete_old_events(
+            days=options["days"], chunk_size=options["chunk_size"])
         self.stdout.write(self.style.SUCCESS(f"{deleted_count} 件の通知を削除しました。"))
@@ -0,0 +1,68 @@
+# main/management/commands/drain_email_outbox.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.utils.outbox import drain_outbox, pending_count
+
+
+class Command(BaseCommand):
+    """
+    ✅ メール送信ワーカー：EmailOutbox に溜まったメールを送信する
+    通知処理や価格更新とは別プロセスで常駐させる（Gmail 障害時もバッチは止まらない）。
+    失敗したメールは指数バックオフで再送し、上限回数を超えたら「送信失敗」にする。
+    実行例: python manage.py drain_email_outbox
+    実行例（1回だけ）: python manage.py drain_email_outbox --once
+    実行例（並列数指定）: python manage.py drain_email_outbox --workers=8 --batch-size=200
+    """
+
+    help = "メール送信待ち（EmailOutbox）を送信するワーカー"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="送信待ちが無くなるまで処理したら終了する",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="送信待ちが無いときの待機秒数",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="同時に開く SMTP 接続数（既定: settings.EMAIL_OUTBOX_WORKERS）",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="1回に確保する件数（既定: settings.EMAIL_OUTBOX_BATCH_SIZE）",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE(
+            f"📮 メール送信ワーカー起動（送信待ち {pending_count()}件）"))
+
+        try:
+            while True:
+                result = drain_outbox(
+                    batch_size=options["batch_size"],
+                    workers=options["workers"],
+                )
+                if result["claimed"]:
+                    self.stdout.write(
+                        f"[{timezone.localtime():%H:%M:%S}] 送信 {result['sent']}件 / 失敗 {result['failed']}件")
+                    continue
+
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("🛑 メール送信ワーカーを停止しました。"))
+            return
+
+        self.stdout.write(self.style.SUCCESS("✅ 送信待ちのメールはありません。"))
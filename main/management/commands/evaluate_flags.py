@@ -0,0 +1,57 @@
+# main/management/commands/evaluate_flags.py
+import time
+
+from django.core.management.base import BaseCommand
+from main.models import Product
+from main.utils.flag_checker import evaluate_flags_bulk, recompute_flags_sql
+
+
+class Command(BaseCommand):
+    """
+    ✅ 全商品の買い時フラグ（flag_reached）を一括で再判定する
+    判定ルールや閾値を変更したあとに実行する。
+    実行例: python manage.py evaluate_flags
+    実行例（ユーザー指定）: python manage.py evaluate_flags --user=3
+    実行例（SQLのみで再計算）: python manage.py evaluate_flags --sql --chunk-size=20000
+    """
+
+    help = "全商品の買い時フラグを一括で再判定"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            default=None,
+            help="対象ユーザーID（省略時は全ユーザー）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="1回に処理する商品数（--sql の場合は主キーの範囲幅）",
+        )
+        parser.add_argument(
+            "--sql",
+            action="store_true",
+            help="商品を読み込まず UPDATE ... CASE で再計算（全件の一斉再計算向け）",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.all()
+        if options["user"]:
+            queryset = queryset.filter(user_id=options["user"])
+
+        started = time.monotonic()
+        if options["sql"]:
+            changed = recompute_flags_sql(
+                queryset, chunk_size=options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ SQL再計算完了: 更新 {changed}件 / {time.monotonic() - started:.1f}秒"))
+            return
+
+        changed, triggered = evaluate_flags_bulk(
+            queryset, chunk_size=options["chunk_size"])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 再判定完了: 更新 {changed}件（うち新たに買い時 {len(triggered)}件） / {elapsed:.1f}秒"))
@@ -0,0 +1,37 @@
+# main/management/commands/rebuild_price_stats.py
+from django.core.management.base import BaseCommand
+from main.utils.price_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    """
+    ✅ 価格履歴から ProductPriceStats（最安値・7/30/90日平均）を作り直す
+    取得のたびに加算している期間集計から、期間外のサンプルを落とすため日次で実行する。
+    実行例: python manage.py rebuild_price_stats
+    実行例（商品指定）: python manage.py rebuild_price_stats --product=12 --product=34
+    """
+
+    help = "価格履歴から商品ごとの価格統計を再計算"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            default=None,
+            help="再計算する商品ID（複数指定可。省略時は全商品）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="一括書き込みの件数",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_stats(
+            product_ids=options["product"],
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 価格統計を再計算しました（{count}商品）"))
@@ -0,0 +1,26 @@
+# main/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from main.utils.product_search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    ✅ 商品キーワード検索の n-gram 索引（ProductSearchGram）を作り直す
+    商品保存時はシグナルで更新されるため、導入時と bulk 更新で名前を変えた後に実行する。
+    実行例: python manage.py rebuild_search_index
+    """
+
+    help = "商品名・ショップ名の検索索引を作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="1回に処理する商品数",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_index(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 検索索引を作り直しました（{count}商品）"))
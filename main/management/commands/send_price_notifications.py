@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.db import models   # ✅ ← これを追加！
 from main.models import Product, NotificationLog
+from main.utils.email_render import EmailRenderer
 from main.utils.notifications import send_price_drop_email
 from django.utils.timezone import now
 
@@ -17,6 +18,8 @@ class Command(BaseCommand):
         fail_cnt = 0
 
         users = User.objects.filter(is_active=True)
+        # テンプレートと商品ごとの本文はバッチ全体で使い回す
+        renderer = EmailRenderer()
 
         for user in users:
             try:
@@ -42,7 +45,7 @@ class Command(BaseCommand):
                     for p in flagged_items
                 ]
 
-                send_price_drop_email(user, items)
+                send_price_drop_email(user, items, renderer=renderer)
                 success_cnt += 1
 
                 # ✅ 通知ログ記録
@@ -2,30 +2,69 @@
 from django.core.management.base import BaseCommand
 from apscheduler.schedulers.blocking import BlockingScheduler  # ✅ 本番用スケジューラ
 from django.core.management import call_command
-from django.utils import timezone
+from django.conf import settings
 
 
 class Command(BaseCommand):
     """
     ✅ APScheduler による本番スケジューラ
-    毎朝9時に send_daily_notifications を実行
+    毎分、通知時刻が来たユーザーへメール送信（send_notifications：next_notify_at で対象を絞る）
+    毎分、メール送信待ち（EmailOutbox）を送信（drain_email_outbox --once）
+    数分おきに「チェック時期が来た商品」だけ価格更新（update_prices --due）
+    毎晩3時に価格統計を再計算（rebuild_price_stats）
+    毎晩4時に古い通知を自動既読・削除（auto_mark_old_notifications / cleanup_notifications）
     """
 
-    help = "本番スケジューラ：毎朝9時に通知メール送信処理を実行します。"
+    help = "本番スケジューラ：ユーザーごとの通知時刻に通知メール送信処理を実行します。"
 
     def handle(self, *args, **options):
         scheduler = BlockingScheduler(timezone="Asia/Tokyo")
 
         def job():
-            self.stdout.write(self.style.HTTP_INFO(
-                f"[{timezone.localtime()}] 🕒 通知メールバッチ開始"))
-            call_command("send_daily_notifications")
-            self.stdout.write(self.style.SUCCESS(
-                f"[{timezone.localtime()}] ✅ 通知メールバッチ完了"))
-
-        # === 毎朝9時に実行 ===
-        scheduler.add_job(job, "cron", hour=9, minute=0)
-        self.stdout.write(self.style.NOTICE("⏰ スケジューラ起動中...（毎朝9時に実行）"))
+            from main.tasks_send_notifications import send_notifications
+
+            send_notifications()
+
+        def outbox_job():
+            call_command("drain_email_outbox", once=True)
+
+        def price_job():
+            call_command("update_prices", due=True)
+
+        def stats_job():
+            call_command("rebuild_price_stats")
+
+        def retention_job():
+            call_command("auto_mark_old_notifications")
+            call_command("cleanup_notifications")
+
+        # === 通知メール（毎分。ユーザーごとの通知時刻に到達した分だけ送信） ===
+        scheduler.add_job(
+            job, "interval", minutes=1,
+            max_instances=1, coalesce=True,
+        )
+
+        # === メール送信（通知処理は送信待ちに登録するだけなので、ここで SMTP へ送る） ===
+        scheduler.add_job(
+            outbox_job, "interval", minutes=1,
+            max_instances=1, coalesce=True,
+        )
+
+        # === 価格チェック（商品ごとの next_check_at に従って対象を絞る） ===
+        scheduler.add_job(
+            price_job, "interval",
+            minutes=settings.POLL_TICK_MINUTES,
+            max_instances=1, coalesce=True,
+        )
+
+        # === 価格統計の期間集計を引き直す（毎晩3時） ===
+        scheduler.add_job(stats_job, "cron", hour=3, minute=0)
+
+        # === 通知の保持期間処理（毎晩4時） ===
+        scheduler.add_job(retention_job, "cron", hour=4, minute=0)
+
+        self.stdout.write(self.style.NOTICE(
+            f"⏰ スケジューラ起動中...（毎分 通知時刻チェック・メール送信 / {settings.POLL_TICK_MINUTES}分ごとに価格チェック）"))
 
         try:
             scheduler.start()
@@ -61,4 +61,5 @@ class Command(BaseCommand):
         send_notification_summary(
             user, NotificationEvent.objects.filter(pk=event.pk), category)
 
-        self.stdout.write(self.style.SUCCESS("✅ テストメール送信完了"))
+        self.stdout.write(self.style.SUCCESS(
+            "✅ テストメールを送信待ちに登録しました（drain_email_outbox で送信されます）"))
@@ -1,11 +1,13 @@
 # main/management/commands/update_prices.py
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from main.models import Product, PriceHistory
-from main.utils.rakuten_api import fetch_rakuten_item
-from main.utils.flag_checker import update_flag_status
-from main.utils.notify_events import create_restock_event
-import time
+from main.models import Product
+from main.utils.poll_scheduler import due_products
+from main.utils.price_updater import (
+    PriceBatchWriter,
+    fetch_concurrently,
+    group_by_item,
+    is_test_product,
+)
 
 
 class Command(BaseCommand):
@@ -13,6 +15,8 @@ class Command(BaseCommand):
     ✅ 楽天APIから実際の価格・在庫を取得して更新
     実行例: python manage.py update_prices
     実行例（優先度指定）: python manage.py update_prices --priority=高
+    実行例（並列数・レート指定）: python manage.py update_prices --workers=8 --rate=1
+    実行例（チェック時期が来た商品のみ）: python manage.py update_prices --due
     """
 
     help = "楽天APIから最新価格・在庫を取得してDBに保存"
@@ -25,6 +29,29 @@ class Command(BaseCommand):
             choices=["高", "普通", "all"],
             help="更新対象の優先度（高/普通/all）",
         )
+        parser.add_argument(
+            "--due",
+            action="store_true",
+            help="次回チェック日時（next_check_at）を過ぎた商品のみ更新",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="API取得の同時実行数（既定: settings.PRICE_FETCH_WORKERS）",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="1秒あたりのAPIリクエスト上限（既定: settings.RAKUTEN_RATE_LIMIT_PER_SEC）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=None,
+            help="DBへまとめて書き込む件数（既定: settings.PRICE_WRITE_CHUNK_SIZE）",
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.NOTICE("🔄 価格更新バッチを開始します..."))
@@ -32,9 +59,12 @@ class Command(BaseCommand):
         priority = options["priority"]
 
         # 対象商品を取得
-        queryset = Product.objects.filter(is_deleted=False)
+        queryset = Product.objects.filter(
+            is_deleted=False).select_related("user")
         if priority != "all":
             queryset = queryset.filter(priority=priority)
+        if options["due"]:
+            queryset = due_products(queryset)
 
         total_count = queryset.count()
         self.stdout.write(f"📊 対象商品数: {total_count}件")
@@ -44,96 +74,66 @@ class Command(BaseCommand):
             return
 
         success_count = 0
+        unchanged_count = 0
         error_count = 0
 
-        for index, product in enumerate(queryset, 1):
-            try:
+        # ✅ テストデータは API を呼ばずにスキップ
+        targets = []
+        for product in queryset:
+            if is_test_product(product):
                 self.stdout.write(
-                    f"\n[{index}/{total_count}] {product.product_name}")
-
-                # ✅ テストデータをスキップ
-                if "example.com" in product.product_url or "test" in product.product_url.lower():
-                    self.stdout.write(
-                        self.style.WARNING(f"  ⚠️ テストデータのためスキップ"))
-                    continue
-
-                # ✅ レート制限対策（2秒待機）
-                if index > 1:
-                    time.sleep(2)
-
-                # 楽天APIから取得
-                data = fetch_rakuten_item(product.product_url)
-
-                if data.get("error"):
+                    self.style.WARNING(f"  ⚠️ テストデータのためスキップ: {product.product_name}"))
+                continue
+            targets.append(product)
+
+        self.stdout.write(
+            f"🔗 API取得対象: {len(group_by_item(targets))}商品コード（重複を集約）")
+
+        # ✅ 並列取得（レート制限はトークンバケットで共有）
+        #    → DB反映はこのスレッドでチャンク単位にまとめて実行
+        fetched = fetch_concurrently(
+            targets, workers=options["workers"], rate=options["rate"])
+        writer = PriceBatchWriter(chunk_size=options["chunk_size"])
+
+        def report(settled):
+            nonlocal success_count, unchanged_count, error_count
+            for product, result in settled:
+                if result["status"] == "error":
                     self.stdout.write(self.style.ERROR(
-                        f"  ❌ API取得失敗: {data['error']}"))
-                    error_count += 1
-                    continue
-
-                # 価格・在庫の取得
-                new_price = data.get("initial_price", 0)
-                new_stock = self._parse_stock(data.get("stock_status", "在庫あり"))
-
-                if not new_price or new_price == 0:
-                    self.stdout.write(self.style.WARNING(
-                        f"  ⚠️ 価格情報が取得できませんでした"))
+                        f"  ❌ {product.product_name}: {result['message']}"))
                     error_count += 1
-                    continue
-
-                # 前回の在庫状態を取得
-                previous_history = PriceHistory.objects.filter(
-                    product=product).order_by("-checked_at").first()
-                previous_stock = previous_history.stock_count if previous_history else 0
-
-                # PriceHistoryに保存
-                PriceHistory.objects.create(
-                    product=product,
-                    price=new_price,
-                    stock_count=new_stock,
-                    checked_at=timezone.now()
-                )
-
-                # 最新価格・在庫を更新
-                product.latest_price = new_price
-                product.latest_stock_count = new_stock
-                product.is_in_stock = new_stock > 0
-                product.save(update_fields=[
-                             "latest_price", "latest_stock_count", "is_in_stock"])
-
-                # 買い時フラグ更新
-                update_flag_status(product)
-
-                # 在庫復活通知（優先度「高」のみ）
-                if product.priority == "高" and previous_stock == 0 and new_stock > 0:
-                    create_restock_event(product, product.user)
-                    self.stdout.write(self.style.SUCCESS(f"  🔔 在庫復活通知を作成しました"))
-
+                elif result["status"] == "unchanged":
+                    self.stdout.write(
+                        f"  ⏩ 変化なし: {product.product_name} ¥{result['price']:,} / 在庫 {result['stock']}個")
+                    unchanged_count += 1
+                else:
+                    if result["restocked"]:
+                        self.stdout.write(self.style.SUCCESS(
+                            f"  🔔 在庫復活通知を作成しました: {product.product_name}"))
+                    self.stdout.write(self.style.SUCCESS(
+                        f"  ✅ 更新完了: {product.product_name} ¥{result['price']:,} / 在庫 {result['stock']}個"))
+                    success_count += 1
+
+        for index, (product, data) in enumerate(fetched, 1):
+            try:
                 self.stdout.write(
-                    self.style.SUCCESS(
-                        f"  ✅ 更新完了: ¥{new_price:,} / 在庫 {new_stock}個")
-                )
-                success_count += 1
+                    f"[{index}/{len(targets)}] 取得: {product.product_name}")
+                report(writer.add(product, data))
 
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"  ❌ エラー: {e}"))
                 error_count += 1
 
+        try:
+            report(writer.flush())
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"  ❌ エラー: {e}"))
+            error_count += 1
+
         # 結果サマリー
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS(f"✅ 成功: {success_count}件"))
+        self.stdout.write(f"⏩ 変化なし: {unchanged_count}件")
         if error_count > 0:
             self.stdout.write(self.style.ERROR(f"❌ エラー: {error_count}件"))
         self.stdout.write("="*50)
-
-    def _parse_stock(self, stock_status):
-        """在庫状態のテキストを数値に変換"""
-        stock_status = str(stock_status).lower()
-
-        if "売り切れ" in stock_status or "在庫なし" in stock_status:
-            return 0
-        elif "わずか" in stock_status or "残り少" in stock_status:
-            return 2
-        elif "在庫あり" in stock_status:
-            return 10
-        else:
-            return 5  # デフォルト
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0040_remove_usernotificationsetting_notify_buy_time_only_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pricehistory",
+            name="last_checked_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="最終確認日時"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricehistory",
+            name="sample_count",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="同じ価格・在庫で確認された回数（ハートビート）",
+                verbose_name="取得回数",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0041_pricehistory_sample_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="next_check_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="価格変動・優先度・買い時価格との距離から自動計算",
+                null=True,
+                verbose_name="次回価格チェック日時",
+            ),
+        ),
+    ]
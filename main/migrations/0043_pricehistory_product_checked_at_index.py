@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0042_product_next_check_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pricehistory",
+            index=models.Index(
+                fields=["product", "checked_at"], name="pricehistory_product_chk_idx"
+            ),
+        ),
+    ]
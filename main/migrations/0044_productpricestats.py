@@ -0,0 +1,118 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0043_pricehistory_product_checked_at_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductPriceStats",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="price_stats",
+                        serialize=False,
+                        to="main.product",
+                    ),
+                ),
+                (
+                    "min_price",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=0,
+                        max_digits=10,
+                        null=True,
+                        verbose_name="最安値",
+                    ),
+                ),
+                (
+                    "max_price",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=0,
+                        max_digits=10,
+                        null=True,
+                        verbose_name="最高値",
+                    ),
+                ),
+                (
+                    "last_price",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=0,
+                        max_digits=10,
+                        null=True,
+                        verbose_name="最終価格",
+                    ),
+                ),
+                (
+                    "last_changed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="最終価格変動日時"
+                    ),
+                ),
+                (
+                    "sum_7d",
+                    models.DecimalField(
+                        decimal_places=0,
+                        default=0,
+                        max_digits=16,
+                        verbose_name="7日合計",
+                    ),
+                ),
+                (
+                    "count_7d",
+                    models.PositiveIntegerField(default=0, verbose_name="7日件数"),
+                ),
+                (
+                    "sum_30d",
+                    models.DecimalField(
+                        decimal_places=0,
+                        default=0,
+                        max_digits=16,
+                        verbose_name="30日合計",
+                    ),
+                ),
+                (
+                    "count_30d",
+                    models.PositiveIntegerField(default=0, verbose_name="30日件数"),
+                ),
+                (
+                    "sum_90d",
+                    models.DecimalField(
+                        decimal_places=0,
+                        default=0,
+                        max_digits=16,
+                        verbose_name="90日合計",
+                    ),
+                ),
+                (
+                    "count_90d",
+                    models.PositiveIntegerField(default=0, verbose_name="90日件数"),
+                ),
+                (
+                    "rebuilt_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="期間集計の再計算日時"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新日時"),
+                ),
+            ],
+            options={
+                "verbose_name": "価格統計",
+                "verbose_name_plural": "価格統計",
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0044_productpricestats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("hour", "1時間"), ("day", "1日")],
+                        max_length=4,
+                        verbose_name="粒度",
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField(verbose_name="集計開始日時")),
+                (
+                    "open_price",
+                    models.DecimalField(
+                        decimal_places=0, max_digits=10, verbose_name="始値"
+                    ),
+                ),
+                (
+                    "high_price",
+                    models.DecimalField(
+                        decimal_places=0, max_digits=10, verbose_name="高値"
+                    ),
+                ),
+                (
+                    "low_price",
+                    models.DecimalField(
+                        decimal_places=0, max_digits=10, verbose_name="安値"
+                    ),
+                ),
+                (
+                    "close_price",
+                    models.DecimalField(
+                        decimal_places=0, max_digits=10, verbose_name="終値"
+                    ),
+                ),
+                (
+                    "close_stock",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="終了時点の在庫数"
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.PositiveIntegerField(default=0, verbose_name="取得回数"),
+                ),
+                ("last_sampled_at", models.DateTimeField(verbose_name="最終取得日時")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_rollups",
+                        to="main.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "価格ロールアップ",
+                "verbose_name_plural": "価格ロールアップ",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="pricerollup",
+            constraint=models.UniqueConstraint(
+                fields=("product", "resolution", "bucket_start"),
+                name="uq_pricerollup_bucket",
+            ),
+        ),
+    ]
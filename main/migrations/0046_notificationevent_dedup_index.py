@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0045_pricerollup"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notificationevent",
+            index=models.Index(
+                fields=["product", "event_type", "occurred_at"],
+                name="notifevent_prod_type_occ_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:39
+
+from django.db import migrations, models
+
+
+def mark_existing_events_sent(apps, schema_editor):
+    # 既存のイベントは送信済み扱いにする（導入直後に過去分をまとめて送らないため）
+    NotificationEvent = apps.get_model("main", "NotificationEvent")
+    NotificationEvent.objects.update(sent_flag=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0046_notificationevent_dedup_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationevent",
+            name="sent_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="メール送信日時"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationevent",
+            name="sent_flag",
+            field=models.BooleanField(default=False, verbose_name="メール送信済み"),
+        ),
+        migrations.RunPython(mark_existing_events_sent, migrations.RunPython.noop),
+    ]
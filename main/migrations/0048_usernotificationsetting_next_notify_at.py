@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:40
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_next_notify_at(apps, schema_editor):
+    # 既存の通知設定に次回通知予定日時を設定する
+    UserNotificationSetting = apps.get_model("main", "UserNotificationSetting")
+    now = timezone.localtime()
+    rows = []
+    for setting in UserNotificationSetting.objects.all():
+        slot = now.replace(
+            hour=setting.notify_hour, minute=setting.notify_minute,
+            second=0, microsecond=0)
+        if slot <= now:
+            slot += timedelta(days=1)
+        setting.next_notify_at = slot
+        rows.append(setting)
+    UserNotificationSetting.objects.bulk_update(rows, ["next_notify_at"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0047_notificationevent_sent_flag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usernotificationsetting",
+            name="next_notify_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="次回通知予定日時"
+            ),
+        ),
+        migrations.RunPython(fill_next_notify_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0048_usernotificationsetting_next_notify_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "idempotency_key",
+                    models.CharField(
+                        help_text="同じメールを二重に登録しないためのキー",
+                        max_length=200,
+                        unique=True,
+                        verbose_name="冪等キー",
+                    ),
+                ),
+                ("to_email", models.EmailField(max_length=254, verbose_name="宛先")),
+                (
+                    "from_email",
+                    models.CharField(blank=True, max_length=255, verbose_name="差出人"),
+                ),
+                ("subject", models.CharField(max_length=255, verbose_name="件名")),
+                ("body", models.TextField(verbose_name="本文（テキスト）")),
+                (
+                    "html_body",
+                    models.TextField(blank=True, verbose_name="本文（HTML）"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "送信待ち"),
+                            ("sending", "送信中"),
+                            ("sent", "送信済み"),
+                            ("failed", "送信失敗"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="状態",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="送信試行回数"),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="送信中の場合はワーカーの処理期限（過ぎたら再取得される）",
+                        verbose_name="次回送信日時",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="最後のエラー"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="登録日時"),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="送信日時"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="email_outbox",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "メール送信待ち",
+                "verbose_name_plural": "メール送信待ち",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="emailoutbox_status_next_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0049_emailoutbox"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notificationevent",
+            index=models.Index(
+                fields=["is_read", "occurred_at"], name="notifevent_read_occ_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 00:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0050_notificationevent_read_occ_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchGram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "field",
+                    models.CharField(
+                        choices=[("n", "商品名"), ("s", "ショップ名")],
+                        max_length=1,
+                        verbose_name="対象項目",
+                    ),
+                ),
+                ("gram", models.CharField(max_length=2, verbose_name="文字列")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_grams",
+                        to="main.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "商品検索索引",
+                "verbose_name_plural": "商品検索索引",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="productsearchgram",
+            constraint=models.UniqueConstraint(
+                fields=("gram", "field", "product"), name="uq_productsearchgram"
+            ),
+        ),
+    ]
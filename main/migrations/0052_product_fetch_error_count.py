@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0051_productsearchgram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="fetch_error_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="取得に失敗するたびに次回チェックまでの間隔を延ばす（成功で0に戻る）",
+                verbose_name="連続取得失敗回数",
+            ),
+        ),
+    ]
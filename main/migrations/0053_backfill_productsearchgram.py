@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:20
+
+import unicodedata
+
+from django.db import migrations
+
+
+def normalize(text):
+    # main.utils.product_search.normalize と同じ（マイグレーション時点の定義を固定する）
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def make_grams(text):
+    # main.utils.product_search.make_grams と同じ（マイグレーション時点の定義を固定する）
+    if not text:
+        return set()
+    grams = {text[i:i + 2] for i in range(len(text) - 1)}
+    grams.add(text[-1])
+    return grams
+
+
+def fill_search_grams(apps, schema_editor):
+    # 既存の商品（論理削除分を含む）の検索索引を作成する
+    Product = apps.get_model("main", "Product")
+    ProductSearchGram = apps.get_model("main", "ProductSearchGram")
+    products = Product.objects.order_by("id").only("id", "product_name", "shop_name")
+    last_id = 0
+    while True:
+        chunk = list(products.filter(id__gt=last_id)[:1000])
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        rows = [
+            ProductSearchGram(product_id=product.id, field=field, gram=gram)
+            for product in chunk
+            for field, value in (("n", product.product_name), ("s", product.shop_name))
+            for gram in make_grams(normalize(value))
+        ]
+        ProductSearchGram.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0052_product_fetch_error_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_grams, migrations.RunPython.noop),
+    ]
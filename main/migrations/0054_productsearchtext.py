@@ -0,0 +1,72 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:14
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize(text):
+    # main.utils.product_search.normalize と同じ（マイグレーション時点の定義を固定する）
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def fill_search_texts(apps, schema_editor):
+    # 既存の商品（論理削除分を含む）の正規化済み文字列を作成する
+    Product = apps.get_model("main", "Product")
+    ProductSearchText = apps.get_model("main", "ProductSearchText")
+    products = Product.objects.order_by("id").only("id", "product_name", "shop_name")
+    last_id = 0
+    while True:
+        chunk = list(products.filter(id__gt=last_id)[:1000])
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        ProductSearchText.objects.bulk_create([
+            ProductSearchText(
+                product_id=product.id,
+                product_name=normalize(product.product_name),
+                shop_name=normalize(product.shop_name),
+            )
+            for product in chunk
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0053_backfill_productsearchgram"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchText",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_text",
+                        serialize=False,
+                        to="main.product",
+                    ),
+                ),
+                (
+                    "product_name",
+                    models.TextField(blank=True, verbose_name="商品名（正規化済み）"),
+                ),
+                (
+                    "shop_name",
+                    models.TextField(
+                        blank=True, verbose_name="ショップ名（正規化済み）"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "商品検索用文字列",
+                "verbose_name_plural": "商品検索用文字列",
+            },
+        ),
+        migrations.RunPython(fill_search_texts, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,8 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from datetime import timedelta
 
 User = get_user_model()
 
@@ -174,6 +176,18 @@ class Product(models.Model):
         choices=PRIORITY_CHOICES,
         default="普通",
     )
+    next_check_at = models.DateTimeField(
+        "次回価格チェック日時",
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="価格変動・優先度・買い時価格との距離から自動計算",
+    )
+    fetch_error_count = models.PositiveIntegerField(
+        "連続取得失敗回数",
+        default=0,
+        help_text="取得に失敗するたびに次回チェックまでの間隔を延ばす（成功で0に戻る）",
+    )
 
     # カテゴリ（共通＋独自）
     categories = models.ManyToManyField(
@@ -233,15 +247,170 @@ class PriceHistory(models.Model):
     stock_count = models.IntegerField("在庫数", null=True, blank=True)
     checked_at = models.DateTimeField("取得日時")
 
+    # ✅ 価格・在庫が変わらなかった取得は新しい行を作らず、この行に加算する
+    sample_count = models.PositiveIntegerField(
+        "取得回数", default=1, help_text="同じ価格・在庫で確認された回数（ハートビート）")
+    last_checked_at = models.DateTimeField("最終確認日時", null=True, blank=True)
+
     class Meta:
         verbose_name = "価格履歴"
         verbose_name_plural = "価格履歴"
         ordering = ["-checked_at"]
+        indexes = [
+            # 商品ごとの履歴を日時順に読む（グラフ・平均価格・前回在庫）ためのインデックス
+            models.Index(fields=["product", "checked_at"],
+                         name="pricehistory_product_chk_idx"),
+        ]
 
     def __str__(self):
         return f"{self.product.product_name} - ¥{self.price}"
 
 
+# ======================================================
+# 価格統計（商品ごとに1行・価格取得のたびに差分更新）
+# ======================================================
+class ProductPriceStats(models.Model):
+    """
+    価格履歴を毎回集計しないための非正規化テーブル。
+    - 最安値・最高値・最終価格変動日時は取得のたびに更新
+    - 7/30/90日の合計・件数は取得のたびに加算し、
+      期間外になったサンプルは rebuild_price_stats（日次）で引き直す
+    """
+    WINDOWS = (7, 30, 90)
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name="price_stats",
+        primary_key=True)
+    min_price = models.DecimalField(
+        "最安値", max_digits=10, decimal_places=0, null=True, blank=True)
+    max_price = models.DecimalField(
+        "最高値", max_digits=10, decimal_places=0, null=True, blank=True)
+    last_price = models.DecimalField(
+        "最終価格", max_digits=10, decimal_places=0, null=True, blank=True)
+    last_changed_at = models.DateTimeField("最終価格変動日時", null=True, blank=True)
+
+    sum_7d = models.DecimalField("7日合計", max_digits=16, decimal_places=0, default=0)
+    count_7d = models.PositiveIntegerField("7日件数", default=0)
+    sum_30d = models.DecimalField("30日合計", max_digits=16, decimal_places=0, default=0)
+    count_30d = models.PositiveIntegerField("30日件数", default=0)
+    sum_90d = models.DecimalField("90日合計", max_digits=16, decimal_places=0, default=0)
+    count_90d = models.PositiveIntegerField("90日件数", default=0)
+
+    rebuilt_at = models.DateTimeField("期間集計の再計算日時", null=True, blank=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        verbose_name = "価格統計"
+        verbose_name_plural = "価格統計"
+
+    def __str__(self):
+        return f"{self.product_id} 価格統計"
+
+    def average(self, days):
+        """days 日平均（7/30/90 のみ）。サンプルがなければ None"""
+        count = getattr(self, f"count_{days}d")
+        if not count:
+            return None
+        return getattr(self, f"sum_{days}d") / count
+
+
+# ======================================================
+# 価格履歴のロールアップ（グラフ用：1時間／1日ごとの始値・高値・安値・終値）
+# ======================================================
+class PriceRollup(models.Model):
+    """
+    長期間のグラフ表示用に価格履歴を時間足・日足にまとめたもの。
+    価格取得バッチが取得のたびに更新し、既存の履歴は backfill_price_rollups で作成する。
+    """
+    RESOLUTION_HOUR = "hour"
+    RESOLUTION_DAY = "day"
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_HOUR, "1時間"),
+        (RESOLUTION_DAY, "1日"),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="price_rollups")
+    resolution = models.CharField("粒度", max_length=4, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField("集計開始日時")
+
+    open_price = models.DecimalField("始値", max_digits=10, decimal_places=0)
+    high_price = models.DecimalField("高値", max_digits=10, decimal_places=0)
+    low_price = models.DecimalField("安値", max_digits=10, decimal_places=0)
+    close_price = models.DecimalField("終値", max_digits=10, decimal_places=0)
+    close_stock = models.IntegerField("終了時点の在庫数", null=True, blank=True)
+    sample_count = models.PositiveIntegerField("取得回数", default=0)
+    last_sampled_at = models.DateTimeField("最終取得日時")
+
+    class Meta:
+        verbose_name = "価格ロールアップ"
+        verbose_name_plural = "価格ロールアップ"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "resolution", "bucket_start"],
+                name="uq_pricerollup_bucket",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.resolution} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+# ======================================================
+# 商品キーワード検索用の n-gram 索引
+# ======================================================
+class ProductSearchGram(models.Model):
+    """
+    商品名・ショップ名を正規化して2文字ずつに区切った索引（末尾の1文字も1件として持つ）。
+    キーワード検索は LIKE '%…%' の全件走査ではなく、この表の gram で候補を絞ってから確認する。
+    商品保存時にシグナルで更新する。既存分はマイグレーション 0053 で作成し、
+    作り直す場合は rebuild_search_index を使う。
+    """
+    FIELD_PRODUCT_NAME = "n"
+    FIELD_SHOP_NAME = "s"
+    FIELD_CHOICES = [
+        (FIELD_PRODUCT_NAME, "商品名"),
+        (FIELD_SHOP_NAME, "ショップ名"),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="search_grams")
+    field = models.CharField("対象項目", max_length=1, choices=FIELD_CHOICES)
+    gram = models.CharField("文字列", max_length=2)
+
+    class Meta:
+        verbose_name = "商品検索索引"
+        verbose_name_plural = "商品検索索引"
+        constraints = [
+            # gram を先頭にして検索時の絞り込みにも使う
+            models.UniqueConstraint(
+                fields=["gram", "field", "product"], name="uq_productsearchgram"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}:{self.field}:{self.gram}"
+
+
+class ProductSearchText(models.Model):
+    """
+    商品名・ショップ名を正規化した文字列（ProductSearchGram と同じ正規化）。
+    gram で絞り込んだ候補が本当にキーワードを含むかを SQL で確認するために使う。
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name="search_text",
+        primary_key=True)
+    product_name = models.TextField("商品名（正規化済み）", blank=True)
+    shop_name = models.TextField("ショップ名（正規化済み）", blank=True)
+
+    class Meta:
+        verbose_name = "商品検索用文字列"
+        verbose_name_plural = "商品検索用文字列"
+
+    def __str__(self):
+        return f"{self.product_id}:{self.product_name}"
+
+
 # ======================================================
 # 通知イベント
 # ======================================================
@@ -265,10 +434,22 @@ class NotificationEvent(models.Model):
     occurred_at = models.DateTimeField("発生日時", auto_now_add=True)
     is_read = models.BooleanField("既読", default=False)
 
+    # メール送信済み管理（ダイジェスト送信でまとめて更新）
+    sent_flag = models.BooleanField("メール送信済み", default=False)
+    sent_at = models.DateTimeField("メール送信日時", null=True, blank=True)
+
     class Meta:
         verbose_name = "通知イベント"
         verbose_name_plural = "通知イベント"
         ordering = ["-occurred_at"]
+        indexes = [
+            # 重複判定（商品・種別ごとに直近のイベントがあるか）用
+            models.Index(fields=["product", "event_type", "occurred_at"],
+                         name="notifevent_prod_type_occ_idx"),
+            # 保持期間処理（自動既読・古い既読通知の削除）用
+            models.Index(fields=["is_read", "occurred_at"],
+                         name="notifevent_read_occ_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username}:{self.product.product_name}:{self.event_type}"
@@ -328,6 +509,10 @@ class UserNotificationSetting(models.Model):
         help_text="指定日数を過ぎた通知は自動的に既読になります"
     )
 
+    # ✅ 次回のメール通知予定日時（毎分の送信処理はこれが到来したユーザーだけを読む）
+    next_notify_at = models.DateTimeField(
+        "次回通知予定日時", null=True, blank=True, db_index=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -337,6 +522,86 @@ class UserNotificationSetting(models.Model):
 
     def __str__(self):
         return f"{self.user.username} 通知設定"
+
+    def next_slot_after(self, after):
+        """after より後で最初に来る通知時刻（日本時間の notify_hour:notify_minute）"""
+        local = timezone.localtime(after)
+        slot = local.replace(
+            hour=int(self.notify_hour), minute=int(self.notify_minute),
+            second=0, microsecond=0)
+        if slot <= local:
+            slot += timedelta(days=1)
+        return slot
+
+    def save(self, *args, **kwargs):
+        # 通知時刻が変わった（または未設定の）場合は次回予定を引き直す
+        current = self.next_notify_at and timezone.localtime(self.next_notify_at)
+        if not current or (current.hour, current.minute) != (
+                int(self.notify_hour), int(self.notify_minute)):
+            self.next_notify_at = self.next_slot_after(timezone.now())
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"next_notify_at"}
+        super().save(*args, **kwargs)
+
+
+# ======================================================
+# メール送信待ち（アウトボックス）
+# ======================================================
+class EmailOutbox(models.Model):
+    """
+    送信するメールをいったん保存するテーブル。
+    通知処理は SMTP を待たずにここへ書き込むだけにし、
+    drain_email_outbox ワーカーが別プロセスで送信・リトライする。
+    """
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "送信待ち"),
+        (STATUS_SENDING, "送信中"),
+        (STATUS_SENT, "送信済み"),
+        (STATUS_FAILED, "送信失敗"),
+    ]
+
+    idempotency_key = models.CharField(
+        "冪等キー", max_length=200, unique=True,
+        help_text="同じメールを二重に登録しないためのキー")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True,
+        related_name="email_outbox")
+    to_email = models.EmailField("宛先")
+    from_email = models.CharField("差出人", max_length=255, blank=True)
+    subject = models.CharField("件名", max_length=255)
+    body = models.TextField("本文（テキスト）")
+    html_body = models.TextField("本文（HTML）", blank=True)
+
+    status = models.CharField(
+        "状態", max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField("送信試行回数", default=0)
+    next_attempt_at = models.DateTimeField(
+        "次回送信日時", default=timezone.now,
+        help_text="送信中の場合はワーカーの処理期限（過ぎたら再取得される）")
+    last_error = models.TextField("最後のエラー", blank=True)
+
+    created_at = models.DateTimeField("登録日時", auto_now_add=True)
+    sent_at = models.DateTimeField("送信日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "メール送信待ち"
+        verbose_name_plural = "メール送信待ち"
+        ordering = ["id"]
+        indexes = [
+            # ワーカーが「送信できるもの」を古い順に取り出すためのインデックス
+            models.Index(fields=["status", "next_attempt_at"],
+                         name="emailoutbox_status_next_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email}: {self.subject} ({self.status})"
+
+
 # ======================================================
 # 管理者　ユーザー画面用
 # ======================================================
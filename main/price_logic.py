@@ -5,10 +5,14 @@ from django.conf import settings
 from .models import (
     PriceHistory,
     Product,
-    Notification,
+    NotificationEvent,
     UserNotificationSetting,
     ErrorLog,
+    ProductPriceStats,
 )
+from .utils.notify_events import EventCollector
+from .utils.price_stats import get_stats
+from .utils.rakuten_client import search_items
 import requests
 import logging
 
@@ -19,17 +23,21 @@ logger = logging.getLogger(__name__)
 # ============================================================
 
 
-def fetch_rakuten_product_data(product_name, user=None):
-    url = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
+def fetch_rakuten_product_data(product_name, user=None, item_code=None):
+    """
+    楽天APIから在庫・価格情報を取得する。
+    item_code（"shopCode:itemCode"）があれば商品コードで、なければ商品名キーワードで検索。
+    """
     params = {
-        "applicationId": settings.RAKUTEN_APP_ID,
-        "keyword": product_name,
         "hits": 1,
-        "format": "json",
     }
+    if item_code:
+        params["itemCode"] = item_code
+    else:
+        params["keyword"] = product_name
 
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = search_items(params)
         response.raise_for_status()
         data = response.json()
 
@@ -39,9 +47,9 @@ def fetch_rakuten_product_data(product_name, user=None):
             if user:
                 ErrorLog.objects.create(
                     user=user,
-                    type="RakutenAPIWarning",
+                    type_name="RakutenAPIWarning",
                     source="fetch_rakuten_product_data",
-                    detail=msg,
+                    message=msg,
                 )
             return {
                 "availability": None,
@@ -91,9 +99,9 @@ def fetch_rakuten_product_data(product_name, user=None):
     if user:
         ErrorLog.objects.create(
             user=user,
-            type="RakutenAPIError",
+            type_name="RakutenAPIError",
             source="fetch_rakuten_product_data",
-            detail=msg,
+            message=msg,
         )
 
     return {
@@ -109,7 +117,13 @@ def fetch_rakuten_product_data(product_name, user=None):
 # ============================================================
 
 
-def update_stock_status(product, api_data):
+def update_stock_status(product, api_data, events=None):
+    """
+    在庫情報を更新し、再入荷・在庫少イベントを登録する。
+    events: EventCollector を渡すと重複判定と作成を呼び出し側でまとめて行う
+            （省略時はこの商品の分だけその場で作成）
+    """
+    collector = events if events is not None else EventCollector()
     try:
         availability = api_data.get("availability")
         stock_count = api_data.get("stock_count")
@@ -125,53 +139,38 @@ def update_stock_status(product, api_data):
 
         product.save(update_fields=["is_in_stock", "latest_stock_count"])
 
-        # 再入荷通知
+        # 再入荷通知（24時間以内の重複は EventCollector で除外）
         if new_stock and product.flag_type == "restock":
-            recent_time = timezone.now() - timedelta(hours=24)
-            if not Notification.objects.filter(
-                user=product.user,
-                product=product,
-                type="restock",
-                created_at__gte=recent_time,
-            ).exists():
-                Notification.objects.create(
-                    user=product.user,
-                    product=product,
-                    message=f"{product.product_name} が再入荷しました！ 🛒",
-                    type="restock",
-                )
-                logger.info(
-                    f"[RestockNotify] {product.product_name} に再入荷通知を送信")
+            collector.add(
+                product,
+                "stock_restore",
+                f"{product.product_name} が再入荷しました！ 🛒",
+            )
+            logger.info(
+                f"[RestockNotify] {product.product_name} に再入荷通知を登録")
 
-        # 在庫少通知
+        # 在庫少通知（1時間以内の重複は EventCollector で除外）
         if product.priority == "高" and stock_count is not None and stock_count > 0:
             threshold = 3
             if stock_count <= threshold:
-                recent_time = timezone.now() - timedelta(hours=1)
-                already_sent = Notification.objects.filter(
-                    user=product.user,
-                    product=product,
-                    type="stock_low",
-                    created_at__gte=recent_time,
-                ).exists()
-
-                if not already_sent:
-                    Notification.objects.create(
-                        user=product.user,
-                        product=product,
-                        message=f"{product.product_name} の在庫が残りわずかです（{stock_count}個）⚠️",
-                        type="stock_low",
-                    )
-                    logger.info(
-                        f"[StockLowNotify] {product.product_name} 残り {stock_count} 個")
+                collector.add(
+                    product,
+                    "stock_few",
+                    f"{product.product_name} の在庫が残りわずかです（{stock_count}個）⚠️",
+                )
+                logger.info(
+                    f"[StockLowNotify] {product.product_name} 残り {stock_count} 個")
+
+        if events is None:
+            collector.flush()
 
     except Exception as e:
         logger.error(f"[StockUpdateError] {product.id}: {e}")
         ErrorLog.objects.create(
             user=product.user,
-            type="StockUpdateError",
+            type_name="StockUpdateError",
             source="update_stock_status",
-            detail=str(e),
+            message=str(e),
         )
 
 # ============================================================
@@ -194,9 +193,9 @@ def should_notify(product, latest_price):
         if getattr(product, "user", None):
             ErrorLog.objects.create(
                 user=product.user,
-                type="LogicError",
+                type_name="LogicError",
                 source="should_notify",
-                detail=msg,
+                message=msg,
             )
         return False
 
@@ -212,10 +211,10 @@ def can_send_notification(user, product):
             return False
 
         one_hour_ago = timezone.now() - timezone.timedelta(hours=1)
-        recent_exists = Notification.objects.filter(
+        recent_exists = NotificationEvent.objects.filter(
             user=user,
             product=product,
-            created_at__gte=one_hour_ago
+            occurred_at__gte=one_hour_ago
         ).exists()
 
         return not recent_exists
@@ -223,9 +222,9 @@ def can_send_notification(user, product):
     except Exception as e:
         ErrorLog.objects.create(
             user=user,
-            type="LogicError",
+            type_name="LogicError",
             source="can_send_notification",
-            detail=str(e)
+            message=str(e)
         )
         return False
 
@@ -241,10 +240,21 @@ def calc_price_change_rate(old_price: int, new_price: int) -> float:
 
 
 def get_average_price(product: Product, days: int = 30) -> float:
-    cutoff = datetime.now().date() - timedelta(days=days)
-    records = PriceHistory.objects.filter(
-        product=product, checked_at__date__gte=cutoff)
-    prices = [r.price for r in records if r.price is not None]
+    # 7/30/90日は ProductPriceStats の集計値を読む（履歴を走査しない）
+    stats = get_stats(product)
+    if stats and days in ProductPriceStats.WINDOWS:
+        avg = stats.average(days)
+        return round(float(avg), 2) if avg is not None else 0
+
+    # checked_at__date だと (product, checked_at) インデックスが効かないため日時で比較
+    cutoff = timezone.localtime().replace(
+        hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    prices = [
+        p for p in PriceHistory.objects.filter(
+            product=product, checked_at__gte=cutoff
+        ).values_list("price", flat=True)
+        if p is not None
+    ]
     return round(mean(prices), 2) if prices else 0
 
 
@@ -252,11 +262,15 @@ def get_price_deviation(product: Product) -> float:
     avg = get_average_price(product, 30)
     if avg == 0:
         return 0.0
-    latest = PriceHistory.objects.filter(
-        product=product).order_by('-checked_at').first()
-    if not latest:
+    stats = get_stats(product)
+    if stats and stats.last_price is not None:
+        latest_price = stats.last_price
+    else:
+        latest_price = PriceHistory.objects.filter(
+            product=product).order_by('-checked_at').values_list("price", flat=True).first()
+    if latest_price is None:
         return 0.0
-    return round(((float(latest.price) - float(avg)) / float(avg)) * 100, 2)
+    return round(((float(latest_price) - float(avg)) / float(avg)) * 100, 2)
 
 # ============================================================
 # 🔹 グラフ描画用データ生成（価格＋在庫数）
@@ -270,15 +284,15 @@ def get_price_trend_data(product: Product):
     """
     price_histories = PriceHistory.objects.filter(
         product=product
-    ).order_by("checked_at")
+    ).order_by("checked_at").values_list("checked_at", "price", "stock_count")
 
     result = []
-    for p in price_histories:
-        price_val = float(p.price) if p.price is not None else 0.0
-        stock_val = int(p.stock_count) if p.stock_count is not None else 0
+    for checked_at, price, stock_count in price_histories:
+        price_val = float(price) if price is not None else 0.0
+        stock_val = int(stock_count) if stock_count is not None else 0
 
         result.append({
-            "date": p.checked_at.strftime("%Y-%m-%d %H:%M"),
+            "date": checked_at.strftime("%Y-%m-%d %H:%M"),
             "price": price_val,
             "stock": stock_val,
         })
@@ -307,6 +321,11 @@ def get_trend_lines(product: Product):
         avg_price = get_average_price(product, 30)
         threshold = float(
             product.threshold_price) if product.threshold_price else None
+        # 最安値フラグで閾値未設定なら過去最安値をラインにする
+        if threshold is None and product.flag_type == "lowest_price":
+            stats = get_stats(product)
+            if stats and stats.min_price is not None:
+                threshold = float(stats.min_price)
         return {"average": avg_price, "threshold": threshold}
     except Exception:
         return {"average": 0, "threshold": None}
@@ -1,8 +1,9 @@
 # 実行ディレクトリ: I:\school\kaidoki-desse\main\signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Category
+from django.db import transaction
+from .models import Category, NotificationEvent, Product
 
 User = get_user_model()
 
@@ -18,3 +19,70 @@ def create_default_category(sender, instance, created, **kwargs):
             category_name="未分類",
             defaults={"is_global": False}
         )
+
+
+@receiver(post_save, sender=NotificationEvent)
+def count_new_notification(sender, instance, created, **kwargs):
+    """
+    未読の通知が1件作成されたら未読件数キャッシュを増やす
+    （bulk_create ではシグナルが出ないため、呼び出し側で record_new_events を使う）
+    """
+    if created:
+        from main.utils.unread_counter import record_new_events
+
+        record_new_events([instance])
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """
+    商品名・ショップ名が保存されたら検索索引を作り直す
+    （価格更新など名前に関係しない update_fields 指定の保存では何もしない）
+    """
+    if update_fields is not None and not {"product_name", "shop_name"} & set(update_fields):
+        return
+    from main.utils.product_search import index_products
+
+    transaction.on_commit(lambda: index_products([instance]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_list_on_product(sender, instance, update_fields=None, **kwargs):
+    """
+    商品の保存・削除で所有ユーザーの一覧キャッシュを無効にする
+    （買い時フラグ・次回チェック日時など一覧の絞り込みに関係しない項目だけの保存は除く）
+    """
+    from main.utils.product_list_cache import LIST_FIELDS, bump_list_version
+
+    if update_fields is not None and not LIST_FIELDS & set(update_fields):
+        return
+    bump_list_version([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def invalidate_product_list_on_categories(sender, instance, action, reverse, **kwargs):
+    """商品とカテゴリの紐づけが変わったら一覧キャッシュを無効にする"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    from main.utils.product_list_cache import bump_global_version, bump_list_version
+
+    if not reverse:
+        bump_list_version([instance.user_id])
+    elif instance.user_id:
+        bump_list_version([instance.user_id])
+    else:
+        # 共通カテゴリ側から変更された場合は誰の商品か分からないため全体を無効にする
+        bump_global_version()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_product_list_on_category(sender, instance, **kwargs):
+    """カテゴリの追加・変更・削除で一覧キャッシュ（サイドバー・絞り込み結果）を無効にする"""
+    from main.utils.product_list_cache import bump_global_version, bump_list_version
+
+    if instance.user_id:
+        bump_list_version([instance.user_id])
+    else:
+        bump_global_version()
@@ -0,0 +1,129 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\tasks.py
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from main.models import Product
+from main.utils.poll_scheduler import due_products
+from main.utils.price_stats import rebuild_stats
+from main.utils.price_updater import (
+    PriceBatchWriter,
+    group_by_item,
+    is_test_product,
+)
+from main.utils.rakuten_api import fetch_rakuten_item
+
+logger = logging.getLogger(__name__)
+
+
+# ======================================================
+# ① スケジュール：チェック時期が来た商品をジョブに分割して投入
+# ======================================================
+@shared_task
+def schedule_due_items():
+    """
+    next_check_at を過ぎた商品を商品コード（shopCode:itemCode）単位のジョブにして
+    fetch キューへ投入する。処理待ちの間に再投入されないよう next_check_at を猶予分進める。
+    """
+    now = timezone.now()
+    products = [
+        p for p in due_products(Product.objects.filter(is_deleted=False), now=now)
+        .only("id", "product_url")
+        if not is_test_product(p)
+    ]
+    if not products:
+        return 0
+
+    # 先に猶予を書き込んでから投入する（ワーカーが先に処理を終えても上書きしないように）
+    lease_until = now + timedelta(minutes=settings.PRICE_JOB_LEASE_MINUTES)
+    Product.objects.filter(id__in=[p.id for p in products]).update(
+        next_check_at=lease_until)
+
+    groups = group_by_item(products)
+    for group in groups.values():
+        refresh_item.delay([p.id for p in group])
+
+    logger.info(
+        f"[schedule_due_items] {len(products)}商品 → {len(groups)}ジョブを投入")
+    return len(groups)
+
+
+# ======================================================
+# ② 取得：1商品コードを楽天APIで取得し、追跡している全商品に反映
+# ======================================================
+@shared_task(
+    rate_limit=settings.CELERY_FETCH_RATE_LIMIT,
+    soft_time_limit=60,
+    time_limit=90,
+)
+def refresh_item(product_ids):
+    """同じ楽天商品を追跡している商品IDのリストを受け取り、1回の取得結果を全件に反映"""
+    products = list(
+        Product.objects.filter(id__in=product_ids).select_related("user"))
+    if not products:
+        return
+
+    data = fetch_rakuten_item(products[0].product_url)
+
+    writer = PriceBatchWriter(chunk_size=len(products))
+    results = []
+    for product in products:
+        results.extend(writer.add(product, data))
+    results.extend(writer.flush())
+
+    for product, result in results:
+        if result["status"] == "error":
+            logger.warning(
+                f"[refresh_item] {product.product_name}: {result['message']}")
+
+
+# ======================================================
+# ③ 通知：ユーザーの通知時刻に合わせてメール送信
+# ======================================================
+@shared_task(soft_time_limit=300)
+def dispatch_notifications():
+    """通知メール送信（取得処理とは別キューで実行）"""
+    from main.tasks_send_notifications import send_notifications
+
+    send_notifications()
+
+
+# ======================================================
+# ④ 集計：価格統計の期間集計を引き直す（日次）
+# ======================================================
+@shared_task(soft_time_limit=1800)
+def rebuild_price_stats():
+    """ProductPriceStats を価格履歴から再計算（期間外のサンプルを落とす）"""
+    count = rebuild_stats()
+    logger.info(f"[rebuild_price_stats] {count}商品の価格統計を再計算")
+    return count
+
+
+# ======================================================
+# ⑤ メール送信：アウトボックスに溜まったメールを送る
+# ======================================================
+@shared_task(soft_time_limit=240, time_limit=300)
+def drain_email_outbox():
+    """EmailOutbox を1バッチ分送信（SMTP が遅くても価格取得のキューには影響しない）"""
+    from main.utils.outbox import drain_outbox
+
+    result = drain_outbox()
+    if result["claimed"]:
+        logger.info(f"[drain_email_outbox] {result}")
+    return result
+
+
+# ======================================================
+# ⑥ 保持期間：古い通知の自動既読・削除（日次）
+# ======================================================
+@shared_task(soft_time_limit=1800)
+def apply_notification_retention():
+    """保持期間を過ぎた通知を既読にし、古い既読通知を範囲ごとに削除"""
+    from main.utils.notification_retention import apply_retention
+
+    result = apply_retention()
+    logger.info(f"[apply_notification_retention] {result}")
+    return result
@@ -4,7 +4,7 @@ import sys
 import django
 from datetime import datetime
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 
 # === プロジェクトルートをパスに追加 ===
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -17,77 +17,66 @@ django.setup()
 
 # === モデルimport ===
 from main.models import NotificationEvent, UserNotificationSetting
+from main.utils.mailer import dispatch_digests
+
+
+def build_event_digest(user, to, events):
+    """未送信の通知イベントを1通のメールにまとめる"""
+    subject = f"【買い時でっせ】{len(events)}件の通知があります"
+    body_lines = [f"{ev.message}\n（{ev.occurred_at.strftime('%Y-%m-%d %H:%M:%S')}）"
+                  for ev in events]
+    return EmailMessage(
+        subject=subject,
+        body="\n\n".join(body_lines),
+        from_email=None,  # settings.DEFAULT_FROM_EMAIL を使用
+        to=[to],
+    )
+
+
+def advance_notify_schedule(settings_chunk, failed_user_ids):
+    """
+    処理したユーザーの次回通知予定日時を次の通知時刻へ進める（1チャンク1回の bulk_update）。
+    送信に失敗したユーザーは据え置き、次の実行で再送する。
+    """
+    now = timezone.now()
+    rows = []
+    for setting in settings_chunk:
+        if setting.user_id in failed_user_ids:
+            continue
+        setting.next_notify_at = setting.next_slot_after(now)
+        rows.append(setting)
+    UserNotificationSetting.objects.bulk_update(rows, ["next_notify_at"])
 
 
 def send_notifications():
-    """ユーザー通知設定を考慮してGmail経由でメール送信"""
-    events = NotificationEvent.objects.filter(sent_flag=False).select_related("user", "product")
-    if not events.exists():
-        print("📭 新しい通知はありません。")
-        return
-
-    # 現在時刻（JSTベース）
-    now = timezone.localtime()
-    current_hour = now.hour
-    current_minute = now.minute
-
-    print(f"🕒 現在時刻: {current_hour:02}:{current_minute:02}")
+    """
+    ユーザー通知設定を考慮して通知メールを送信待ち（EmailOutbox）に登録する。
+    実際の送信は drain_email_outbox ワーカーが行う。
+    次回通知予定日時（next_notify_at）が到来したユーザーだけをインデックスで取得するため、
+    毎分の処理量は全ユーザー数ではなく送信対象のユーザー数に比例する。
+    停止していた間に過ぎた通知時刻の分も、次の実行でまとめて送る。
+    """
+    now = timezone.now()
+    print(f"🕒 現在時刻: {timezone.localtime(now):%H:%M}")
     print("===============================================")
 
-    user_settings = {s.user_id: s for s in UserNotificationSetting.objects.all()}
-    grouped = {}
-    for e in events:
-        grouped.setdefault(e.user, []).append(e)
-
-    sent_total = 0
-    skipped_users = []
-
-    for user, user_events in grouped.items():
-        setting = user_settings.get(user.id)
-        if not setting or not setting.enabled:
-            skipped_users.append(user.username)
-            continue
-
-        # 時刻外の通知はスキップ
-        if setting.notify_hour != current_hour or setting.notify_minute != current_minute:
-            skipped_users.append(f"{user.username}（時刻外）")
-            continue
-
-        # メールアドレス未設定時はスキップ
-        if not setting.email:
-            skipped_users.append(f"{user.username}（メール未設定）")
-            continue
-
-        # === メール送信内容作成 ===
-        subject = f"【買い時でっせ】{len(user_events)}件の通知があります"
-        body_lines = [f"{ev.message}\n（{ev.occurred_at.strftime('%Y-%m-%d %H:%M:%S')}）"
-                      for ev in user_events]
-        body = "\n\n".join(body_lines)
-
-        try:
-            send_mail(
-                subject=subject,
-                message=body,
-                from_email=None,  # settings.DEFAULT_FROM_EMAIL を使用
-                recipient_list=[setting.email],
-                fail_silently=False,
-            )
-            print(f"📨 {user.username} さんへメール送信成功 → {setting.email}")
-        except Exception as e:
-            print(f"⚠️ {user.username} さんへの送信エラー: {e}")
-            continue
+    # 通知時刻が来ていて、メール通知ON・メールアドレス設定済みのユーザーのみ
+    due_settings = UserNotificationSetting.objects.filter(
+        enabled=True,
+        next_notify_at__lte=now,
+    ).exclude(email__isnull=True).exclude(email="")
 
-        # === 通知済みに更新 ===
-        NotificationEvent.objects.filter(id__in=[e.id for e in user_events]).update(
-            sent_flag=True, sent_at=timezone.now()
-        )
-        sent_total += len(user_events)
-        print(f"✅ {user.username} さんの通知を送信済みに更新しました。\n")
+    result = dispatch_digests(
+        due_settings,
+        NotificationEvent.objects.filter(sent_flag=False),
+        build_event_digest,
+        after_chunk=advance_notify_schedule,
+    )
 
     print("===============================================")
-    print(f"✨ 全{sent_total}件の通知メール送信が完了しました。({datetime.now().strftime('%H:%M:%S')})")
-    if skipped_users:
-        print(f"⏩ スキップ対象: {', '.join(skipped_users)}")
+    print(f"✨ {result['users']}人・全{result['events']}件の通知メールを送信待ちに登録しました。({datetime.now().strftime('%H:%M:%S')})")
+    if result["failed"]:
+        print(f"⚠️ メール作成エラー: {', '.join(result['failed'])}")
 
 
 if __name__ == "__main__":
@@ -1,3 +1,594 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.models import (
+    EmailOutbox, NotificationEvent, PriceHistory, PriceRollup, Product, ProductPriceStats,
+    UserNotificationSetting,
+)
+from main.utils.flag_checker import recompute_flags_sql, update_flag_status
+from main.utils.mailer import send_notification_summary
+from main.utils.notification_hub import LocalHub, format_sse
+from main.utils.outbox import claim_batch
+from main.utils.pagination_helper import keyset_paginate
+from main.utils.price_rollup import _merge_points, backfill_rollups, bucket_start, get_chart_points
+from main.utils.price_stats import rebuild_stats
+from main.utils.price_updater import PriceBatchWriter
+from main.utils.product_list_cache import cache_keys
+from main.utils.product_search import filter_by_keyword, index_products, search_product_ids
+from main.utils.rakuten_client import RETRY_STATUS_CODES, search_items
+from main.utils.unread_counter import adjust_unread_count, get_unread_count, record_new_events
+
+
+class RecomputeFlagsSqlParityTest(TestCase):
+    """SQL版の一括再計算が update_flag_status と同じ結果になることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username="parity", email="parity@example.com", password="x")
+
+        prices = [None, Decimal("0"), Decimal("670"), Decimal("900"), Decimal("1000")]
+        thresholds = [None, Decimal("0"), Decimal("900")]
+        flag_types = [None, "buy_price", "percent_off", "lowest_price"]
+        flag_values = [None, Decimal("0"), Decimal("10"), Decimal("33")]
+        initials = [None, Decimal("1000")]
+        minimums = [None, Decimal("0"), Decimal("670"), Decimal("950")]
+
+        products = []
+        stats_minimums = []
+        combos = itertools.product(
+            prices, thresholds, flag_types, flag_values, initials, minimums)
+        for i, (latest, threshold, flag_type, flag_value, initial, minimum) in enumerate(combos):
+            products.append(Product(
+                user=user,
+                product_name=f"parity-{i}",
+                product_url=f"https://item.rakuten.co.jp/parity/{i}/",
+                latest_price=latest,
+                threshold_price=threshold,
+                flag_type=flag_type,
+                flag_value=flag_value,
+                initial_price=initial,
+                # 再計算で値が変わる行・変わらない行の両方ができるよう交互に
+                flag_reached=bool(i % 2),
+            ))
+            stats_minimums.append(minimum)
+
+        Product.objects.bulk_create(products)
+        ProductPriceStats.objects.bulk_create([
+            ProductPriceStats(product=product, min_price=minimum)
+            for product, minimum in zip(products, stats_minimums)
+            if minimum is not None
+        ])
+
+    def test_sql_matches_python(self):
+        before = dict(Product.objects.values_list("id", "flag_reached"))
+
+        for product in Product.objects.all():
+            update_flag_status(product)
+        expected = dict(Product.objects.values_list("id", "flag_reached"))
+
+        # 元の状態に戻してから SQL 版で再計算
+        for product_id, flag in before.items():
+            Product.objects.filter(id=product_id).update(flag_reached=flag)
+
+        changed = recompute_flags_sql(chunk_size=97)
+        actual = dict(Product.objects.values_list("id", "flag_reached"))
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(
+            changed, sum(1 for pid in before if before[pid] != expected[pid]))
+        self.assertTrue(any(expected.values()))
+
+
+class ProductFormPageTest(TestCase):
+    """商品登録・編集・一覧ページが表示できることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="pages", email="pages@example.com", password="x")
+        cls.product = Product.objects.create(
+            user=cls.user,
+            product_name="表示確認",
+            product_url="https://item.rakuten.co.jp/pages/1/",
+            initial_price=Decimal("1000"),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_create_page(self):
+        response = self.client.get(reverse("main:product_create"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_page(self):
+        response = self.client.get(reverse("main:product_edit", args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PRODUCT_LIST_CACHE_SECONDS=600)
+    def test_list_page_from_cache(self):
+        for _ in range(2):
+            response = self.client.get(reverse("main:product_list"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context["products"]), [self.product])
+
+
+class RebuildStatsWindowTest(TestCase):
+    """価格が変わらず期間の開始をまたいだ履歴行も期間集計に数えることを確認"""
+
+    def test_flat_price_counts_in_windows(self):
+        user = get_user_model().objects.create_user(
+            username="flat", email="flat@example.com", password="x")
+        product = Product.objects.create(
+            user=user, product_name="flat", product_url="https://item.rakuten.co.jp/flat/1/")
+        now = timezone.now()
+        # 60日前から1日1回、同じ価格で確認され続けている
+        PriceHistory.objects.create(
+            product=product,
+            price=Decimal("500"),
+            checked_at=now - timedelta(days=60),
+            last_checked_at=now - timedelta(hours=1),
+            sample_count=61,
+        )
+
+        rebuild_stats()
+        stats = ProductPriceStats.objects.get(product=product)
+
+        self.assertEqual(stats.count_7d, 7)
+        self.assertEqual(stats.count_30d, 30)
+        self.assertEqual(stats.count_90d, 61)
+        self.assertEqual(stats.average(7), Decimal("500"))
+
+
+class PriceChartPointsTest(TestCase):
+    """グラフ用データの粒度の選択・点のまとめ・ハートビートの扱い"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="chart", email="chart@example.com", password="x")
+        cls.now = timezone.make_aware(datetime(2026, 1, 10, 12, 0))
+
+    def make_product(self, histories):
+        product = Product.objects.create(
+            user=self.user,
+            product_name="chart",
+            product_url=f"https://item.rakuten.co.jp/chart/{Product.objects.count()}/",
+        )
+        PriceHistory.objects.bulk_create([
+            PriceHistory(product=product, price=Decimal(price), checked_at=checked_at,
+                         sample_count=count, last_checked_at=last)
+            for checked_at, price, count, last in histories
+        ])
+        return product
+
+    def test_raw_includes_heartbeat_end(self):
+        start = self.now - timedelta(days=3)
+        product = self.make_product([
+            (start, 1000, 4, start + timedelta(days=2)),
+            (self.now, 900, 1, None),
+        ])
+
+        resolution, points = get_chart_points(product.id, max_points=10, now=self.now)
+
+        self.assertEqual(resolution, "raw")
+        self.assertEqual(
+            [(p[0], p[1]) for p in points],
+            [(start, 1000), (start + timedelta(days=2), 1000), (self.now, 900)],
+        )
+
+    def test_hourly_when_span_fits(self):
+        product = self.make_product([
+            (self.now - timedelta(minutes=minutes), 1000 + minutes, 1, None)
+            for minutes in (150, 120, 90, 60, 30, 0)
+        ])
+        backfill_rollups([product.id])
+
+        resolution, points = get_chart_points(product.id, max_points=4, now=self.now)
+
+        # 生データ6点は上限超え、期間2.5時間は上限以内 → 時間足（9時〜12時の4本）
+        self.assertEqual(resolution, PriceRollup.RESOLUTION_HOUR)
+        self.assertEqual([timezone.localtime(p[0]).hour for p in points], [9, 10, 11, 12])
+
+    def test_daily_merged_to_max_points(self):
+        product = self.make_product([
+            (self.now - timedelta(days=day), 1000 + day * 10, 1, None)
+            for day in range(10)
+        ])
+        backfill_rollups([product.id])
+
+        resolution, points = get_chart_points(product.id, max_points=4, now=self.now)
+
+        # 日足10本 → 3本ずつまとめて4点（最後は1本）
+        self.assertEqual(resolution, PriceRollup.RESOLUTION_DAY)
+        self.assertEqual(len(points), 4)
+        first = points[0]
+        self.assertEqual(first[1], Decimal(1070))  # 終値はまとめた最後の日
+        self.assertEqual((first[3], first[4]), (Decimal(1070), Decimal(1090)))
+
+    def test_merge_points(self):
+        points = [(i, i, i, i - 1, i + 1) for i in range(7)]
+        self.assertEqual(_merge_points(points, 10), points)
+        self.assertEqual(
+            _merge_points(points, 3),
+            [(0, 2, 2, -1, 3), (3, 5, 5, 2, 6), (6, 6, 6, 5, 7)],
+        )
+
+    def test_backfill_counts_heartbeat_samples(self):
+        start = self.now - timedelta(days=2)
+        product = self.make_product([(start, 1000, 5, self.now)])
+
+        backfill_rollups([product.id])
+
+        days = dict(
+            PriceRollup.objects.filter(
+                product=product, resolution=PriceRollup.RESOLUTION_DAY)
+            .values_list("bucket_start", "sample_count")
+        )
+        self.assertEqual(sorted(days.values()), [1, 4])
+        self.assertEqual(days[bucket_start(self.now, PriceRollup.RESOLUTION_DAY)], 4)
+
+
+class NotificationHubTest(SimpleTestCase):
+    """プロセス内ハブの配信先・送信待ちの上限と SSE の書式を確認"""
+
+    def test_fan_out_to_each_connection_of_user(self):
+        async def scenario():
+            hub = LocalHub(queue_size=10)
+            first = hub.subscribe(1)
+            second = hub.subscribe(1)
+            other = hub.subscribe(2)
+
+            # publish は別スレッド（バッチ・シグナル）から呼ばれる
+            thread = threading.Thread(target=hub.publish, args=(1, {"type": "unread"}))
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0)
+
+            received = [queue.get_nowait() for _, queue in (first, second)]
+            hub.unsubscribe(1, first)
+            hub.unsubscribe(1, second)
+            return received, other[1].empty(), hub.has_subscribers(1), hub.connection_count()
+
+        received, other_empty, still_subscribed, connections = asyncio.run(scenario())
+
+        self.assertEqual(received, [{"type": "unread"}, {"type": "unread"}])
+        self.assertTrue(other_empty)
+        self.assertFalse(still_subscribed)
+        self.assertEqual(connections, 1)
+
+    def test_full_queue_drops_oldest(self):
+        async def scenario():
+            hub = LocalHub(queue_size=2)
+            _, queue = hub.subscribe(1)
+            for n in range(3):
+                hub.publish(1, {"n": n})
+            await asyncio.sleep(0)
+            return [queue.get_nowait()["n"] for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(scenario()), [1, 2])
+
+    def test_format_sse(self):
+        self.assertEqual(
+            format_sse("unread", {"unread_count": 3, "message": "値下げ"}, event_id=7),
+            'id: 7\nevent: unread\ndata: {"unread_count": 3, "message": "値下げ"}\n\n',
+        )
+        self.assertEqual(
+            format_sse("unread", {"unread_count": None}),
+            'event: unread\ndata: {"unread_count": null}\n\n',
+        )
+
+
+class NotificationStreamViewTest(TestCase):
+    """SSE は ASGI でのみ配信し、WSGI では 503 でポーリングへ切り替えさせる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="stream", email="stream@example.com", password="x")
+
+    def test_wsgi_returns_503(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("main:notification_stream"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["fallback"], "polling")
+
+    async def test_asgi_streams_initial_unread_count(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("main:notification_stream"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        chunks = response.streaming_content.__aiter__()
+        self.assertEqual(await chunks.__anext__(), b"retry: 5000\n\n")
+        self.assertEqual(
+            await chunks.__anext__(),
+            b'event: unread\ndata: {"type": "unread", "unread_count": 0}\n\n',
+        )
+        await chunks.aclose()
+
+
+class ProductSearchTest(TestCase):
+    """n-gram 索引によるキーワード検索（正規化・1文字・gram の並び順の確認）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username="search", email="search@example.com", password="x")
+        names = ["ＡＢＣ ワイヤレスイヤホン", "イヤホンケース", "ヤホンイヤ"]
+        cls.products = [
+            Product.objects.create(
+                user=user,
+                product_name=name,
+                shop_name="楽天ショップ" if i == 0 else "",
+                product_url=f"https://item.rakuten.co.jp/search/{i}/",
+            )
+            for i, name in enumerate(names)
+        ]
+        index_products(cls.products)
+
+    def search(self, keyword):
+        return set(search_product_ids(keyword))
+
+    def test_normalized_match(self):
+        first, second, _ = self.products
+        self.assertEqual(self.search("abc"), {first.id})
+        self.assertEqual(self.search("ｲﾔﾎﾝ"), {first.id, second.id})
+
+    def test_single_character(self):
+        self.assertEqual(self.search("ホ"), {p.id for p in self.products})
+
+    def test_grams_out_of_order_do_not_match(self):
+        # 「ヤホンイヤ」は「イヤ」「ヤホ」「ホン」をすべて持つが、続けては含まない
+        _, _, shuffled = self.products
+        self.assertNotIn(shuffled.id, self.search("イヤホン"))
+
+    def test_shop_name_and_scope(self):
+        first = self.products[0]
+        self.assertEqual(self.search("楽天"), {first.id})
+        scoped = filter_by_keyword(Product.objects.exclude(id=first.id), "楽天")
+        self.assertFalse(scoped.exists())
+
+
+class PriceBatchListCacheTest(TestCase):
+    """価格バッチは一覧に関係する値が変わった商品の所有ユーザーだけ一覧キャッシュを無効にする"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="batch", email="batch@example.com", password="x")
+        cls.product = Product.objects.create(
+            user=cls.user,
+            product_name="batch",
+            product_url="https://item.rakuten.co.jp/batch/1/",
+            latest_price=Decimal("1000"),
+            latest_stock_count=10,
+            is_in_stock=True,
+        )
+
+    def write(self, price):
+        writer = PriceBatchWriter(chunk_size=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.add(self.product, {"initial_price": price, "stock_status": "在庫あり"})
+            writer.flush()
+        return cache_keys(self.user.id, QueryDict())
+
+    def test_bump_only_when_price_or_stock_changes(self):
+        before = cache_keys(self.user.id, QueryDict())
+        # 履歴が無いため "ok" になるが、一覧に使う値は変わらない
+        self.assertEqual(self.write(1000), before)
+        self.assertNotEqual(self.write(900), before)
+
+
+def _response(status, headers=None):
+    return mock.Mock(status_code=status, headers=headers or {})
+
+
+@override_settings(RAKUTEN_MAX_RETRIES=2)
+class SearchItemsRateLimitTest(SimpleTestCase):
+    """429 は urllib3 ではなく search_items がレート制限を取り直してから再送する"""
+
+    def setUp(self):
+        self.tokens = []
+        self.acquire = lambda: self.tokens.append(1)
+
+    def call(self, *responses):
+        session = mock.Mock()
+        session.get.side_effect = list(responses)
+        with mock.patch("main.utils.rakuten_client.get_session", return_value=session), \
+                mock.patch("main.utils.rakuten_client.time.sleep") as sleep:
+            res = search_items({"keyword": "x"}, acquire=self.acquire)
+        return res, session.get.call_count, sleep
+
+    def test_429_not_retried_by_urllib3(self):
+        self.assertNotIn(429, RETRY_STATUS_CODES)
+
+    def test_retry_reacquires_token_and_honors_retry_after(self):
+        res, calls, sleep = self.call(_response(429, {"Retry-After": "3"}), _response(200))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(calls, 2)
+        self.assertEqual(len(self.tokens), 2)
+        sleep.assert_called_once_with(3.0)
+
+    def test_gives_up_after_max_retries(self):
+        res, calls, _ = self.call(*[_response(429)] * 5)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(calls, 3)
+        self.assertEqual(len(self.tokens), 3)
+
+
+class KeysetPaginateTest(TestCase):
+    """キーセット方式のページ分割（NULL・同値・前後移動・不正なカーソル）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username="keyset", email="keyset@example.com", password="x")
+        # NULL と同じ価格を混ぜ、ページの境目で同値が分かれるようにする
+        prices = [500, None, 300, 500, None, 300, 500, 100, None, 300, 500]
+        for i, price in enumerate(prices):
+            Product.objects.create(
+                user=user,
+                product_name=f"keyset-{i}",
+                product_url=f"https://item.rakuten.co.jp/keyset/{i}/",
+                latest_price=price,
+            )
+        cls.rows = list(Product.objects.values_list("id", "latest_price"))
+
+    def paginate(self, ordering, query="", per_page=3):
+        request = RequestFactory().get("/", QueryDict(query))
+        return keyset_paginate(
+            request, Product.objects.all(), ordering, per_page=per_page, count_limit=None)
+
+    def expected(self, descending):
+        # NULL は昇順・降順どちらでも末尾、同値は主キー順（降順指定なら主キーも降順）
+        present = sorted(
+            (row for row in self.rows if row[1] is not None),
+            key=lambda row: (row[1], row[0]), reverse=descending)
+        missing = sorted(
+            (row[0] for row in self.rows if row[1] is None), reverse=descending)
+        return [row[0] for row in present] + missing
+
+    def walk(self, ordering):
+        """先頭から next で最後まで進み、previous で先頭まで戻る → (進んだ順, 戻った順)"""
+        forward, pages = [], []
+        page = self.paginate(ordering)
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append([p.id for p in page])
+            forward.extend(pages[-1])
+            if not page.has_next:
+                break
+            page = self.paginate(ordering, page.next_query)
+            self.assertTrue(page.has_previous)
+
+        backward = [pages[-1]]
+        while page.has_previous:
+            page = self.paginate(ordering, page.previous_query)
+            backward.append([p.id for p in page])
+        self.assertEqual(backward, pages[::-1])
+        return forward
+
+    def test_ascending_with_nulls_and_ties(self):
+        self.assertEqual(self.walk(["latest_price"]), self.expected(descending=False))
+
+    def test_descending_with_nulls_and_ties(self):
+        self.assertEqual(self.walk(["-latest_price"]), self.expected(descending=True))
+
+    def test_per_page_is_capped(self):
+        page = self.paginate(["latest_price"], "per_page=100000", per_page=3)
+        self.assertEqual(len(page), len(self.rows))
+
+    def test_invalid_cursor_shows_first_page(self):
+        first = [p.id for p in self.paginate(["latest_price"])]
+        for cursor in ("not-base64!", "e30", "WzFd", ""):
+            with self.subTest(cursor=cursor):
+                page = self.paginate(["latest_price"], f"after={cursor}")
+                self.assertEqual([p.id for p in page], first)
+                self.assertFalse(page.has_previous)
+
+
+class UnreadCounterTest(TestCase):
+    """未読件数：共有キャッシュが無ければ毎回数え、あれば増減をキャッシュに反映する"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="unread", email="unread@example.com", password="x")
+        cls.product = Product.objects.create(
+            user=cls.user, product_name="unread", product_url="https://item.rakuten.co.jp/unread/1/")
+
+    def create_event(self):
+        # bulk_create ではシグナルが出ない（別プロセスのバッチと同じく増加がキャッシュに届かない）
+        NotificationEvent.objects.bulk_create([NotificationEvent(
+            user=self.user, product=self.product, event_type="threshold_hit", message="m")])
+
+    @override_settings(UNREAD_COUNT_CACHE_SECONDS=0)
+    def test_without_cache_counts_every_time(self):
+        self.assertEqual(get_unread_count(self.user.id), 0)
+        self.create_event()
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+    @override_settings(UNREAD_COUNT_CACHE_SECONDS=300)
+    def test_with_cache_applies_deltas(self):
+        cache.delete(f"unread_count:{self.user.id}")
+        self.assertEqual(get_unread_count(self.user.id), 0)
+        self.create_event()
+        self.assertEqual(get_unread_count(self.user.id), 0)
+        adjust_unread_count(self.user.id, 1)
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+    def test_notification_payload_omits_missing_id(self):
+        event = NotificationEvent(
+            user=self.user, product=self.product, event_type="threshold_hit", message="m")
+        with mock.patch("main.utils.unread_counter.publish_to_user") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                record_new_events([event])
+        payload = publish.call_args_list[0].args[1]
+        self.assertEqual(payload["type"], "notification")
+        self.assertNotIn("id", payload)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+class ClaimBatchTest(TestCase):
+    """送信中のまま期限切れになった行は上限回数まで再確保し、超えたら送信失敗にする"""
+
+    def create(self, key, attempts):
+        return EmailOutbox.objects.create(
+            idempotency_key=key,
+            to_email="to@example.com",
+            subject="s",
+            body="b",
+            status=EmailOutbox.STATUS_SENDING,
+            attempts=attempts,
+            next_attempt_at=timezone.now() - timedelta(minutes=1),
+        )
+
+    def test_expired_lease_is_reclaimed_until_max_attempts(self):
+        retry = self.create("retry", attempts=2)
+        stuck = self.create("stuck", attempts=3)
+
+        claimed = claim_batch(10)
+
+        self.assertEqual([row.id for row in claimed], [retry.id])
+        self.assertEqual(claimed[0].attempts, 3)
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.status, EmailOutbox.STATUS_FAILED)
+        self.assertEqual(claim_batch(10), [])
+
+
+class NotificationSummaryTest(TestCase):
+    """まとめメールは送信待ちに1通だけ登録し、イベントを送信済みにする"""
+
+    def test_enqueues_once_and_marks_events_sent(self):
+        user = get_user_model().objects.create_user(
+            username="summary", email="summary@example.com", password="x")
+        UserNotificationSetting.objects.update_or_create(
+            user=user, defaults={"enabled": True, "email": "summary@example.com"})
+        product = Product.objects.create(
+            user=user, product_name="summary", product_url="https://item.rakuten.co.jp/summary/1/")
+        NotificationEvent.objects.bulk_create([
+            NotificationEvent(user=user, product=product, event_type="threshold_hit", message="m")
+            for _ in range(2)
+        ])
+        events = NotificationEvent.objects.filter(user=user)
+
+        send_notification_summary(user, events, "price")
+        send_notification_summary(user, NotificationEvent.objects.filter(user=user), "price")
+
+        outbox = EmailOutbox.objects.get()
+        self.assertEqual(outbox.to_email, "summary@example.com")
+        self.assertTrue(outbox.html_body)
+        self.assertFalse(events.filter(Q(is_read=False) | Q(sent_flag=False)).exists())
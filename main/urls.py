@@ -124,6 +124,8 @@ urlpatterns = [
 
     # ✅ 通知API
     path("api/unread_count/", views_notification.unread_count_api, name="unread_count"),
+    path("api/notifications/stream/", views_notification.notification_stream,
+         name="notification_stream"),
 
     # ============================================================
     # ダッシュボード
@@ -0,0 +1,73 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\email_render.py
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+
+# ======================================================
+# メール本文の描画（1バッチで1つ作って使い回す）
+# ======================================================
+PRODUCT_ROW_TEMPLATE = "emails/_product_row.html"
+PRICE_DROP_ITEM_TEMPLATE = "emails/_price_drop_item.txt"
+
+
+class EmailRenderer:
+    """
+    通知メールの描画をまとめて行う。
+    - テンプレートは最初に使うときに1回だけ読み込み・コンパイルし、以降は同じものを使う
+      （読み込み自体も Django の cached loader を通るため、プロセス内で再パースしない）
+    - 商品行などの断片は描画に使う値をキーに1回だけ描画し、
+      同じ商品を登録している別ユーザーのメールでも使い回す
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._fragments = {}
+
+    def template(self, name):
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = get_template(name)
+        return template
+
+    def render(self, name, context):
+        return self.template(name).render(context)
+
+    def fragment(self, name, **context):
+        """断片テンプレートを描画（同じ値なら2回目以降はキャッシュを返す）"""
+        key = (name, tuple(sorted(context.items())))
+        html = self._fragments.get(key)
+        if html is None:
+            html = self._fragments[key] = mark_safe(self.render(name, context))
+        return html
+
+    # --- 断片 ---
+    def product_row(self, product):
+        """商品画像＋商品名リンク（HTMLメールの商品行）"""
+        return self.fragment(
+            PRODUCT_ROW_TEMPLATE,
+            product_name=product.product_name,
+            product_url=product.product_url,
+            image_url=product.image_url or "",
+        )
+
+    def event_rows(self, events):
+        """通知イベントをテンプレート用の行に変換（商品行の断片付き）"""
+        return [
+            {
+                "product": event.product,
+                "product_html": self.product_row(event.product),
+                "message": event.message,
+                "occurred_at": event.occurred_at,
+            }
+            for event in events
+        ]
+
+    def price_drop_item(self, item):
+        """値下がり通知（テキスト）の1商品分"""
+        return self.fragment(
+            PRICE_DROP_ITEM_TEMPLATE,
+            product_name=item["product_name"],
+            new_price=item["new_price"],
+            old_price=item["old_price"],
+            url=item["url"],
+        )
@@ -1,33 +1,194 @@
 # --- START: main/utils/flag_checker.py ---
-from main.models import Product
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, F, Max, Min, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.lookups import LessThanOrEqual
 
+from main.models import Product, ProductPriceStats
+from main.utils.price_stats import get_stats
 
-def update_flag_status(product: Product):
+
+def flag_rule(latest_price, threshold_price, flag_type, flag_value,
+              initial_price, lowest_price=None) -> bool:
     """
-    最新価格と通知条件に基づき flag_reached を更新する。
+    買い時判定のルール本体（値だけを受け取る）。
+    1商品の evaluate_flag と全商品一括の evaluate_flags_bulk で共通に使う。
     """
-    try:
-        if not product.latest_price:
-            product.flag_reached = False
-            product.save(update_fields=["flag_reached"])
-            return
+    if not latest_price:
+        return False
+
+    if flag_type == "buy_price" and threshold_price:
+        return latest_price <= threshold_price
 
-        if product.flag_type == "buy_price" and product.threshold_price:
-            product.flag_reached = product.latest_price <= product.threshold_price
+    elif flag_type == "percent_off" and flag_value:
+        if not initial_price:
+            return False
+        discounted_price = initial_price * (1 - flag_value / 100)
+        return latest_price <= discounted_price
 
-        elif product.flag_type == "percent_off" and product.flag_value:
-            discounted_price = product.initial_price * \
-                (1 - product.flag_value / 100)
-            product.flag_reached = product.latest_price <= discounted_price
+    elif flag_type == "lowest_price":
+        limit = threshold_price or lowest_price
+        if not limit:
+            return False
+        return latest_price <= limit
 
-        elif product.flag_type == "lowest_price" and product.threshold_price:
-            product.flag_reached = product.latest_price <= product.threshold_price
+    return False
 
-        else:
-            product.flag_reached = False
 
+def evaluate_flag(product: Product, lowest_price=None) -> bool:
+    """
+    最新価格と通知条件から flag_reached の値を判定する（DB保存はしない）。
+    バッチでまとめて bulk_update する場合はこちらを使う。
+    lowest_price: 過去の最安値（ProductPriceStats.min_price）。
+                  最安値フラグで threshold_price 未設定のときの基準にする。
+    """
+    return flag_rule(
+        product.latest_price,
+        product.threshold_price,
+        product.flag_type,
+        product.flag_value,
+        product.initial_price,
+        lowest_price,
+    )
+
+
+def update_flag_status(product: Product):
+    """
+    最新価格と通知条件に基づき flag_reached を更新する。
+    """
+    try:
+        stats = get_stats(product)
+        product.flag_reached = evaluate_flag(
+            product, lowest_price=stats.min_price if stats else None)
         product.save(update_fields=["flag_reached"])
 
     except Exception as e:
         print("DEBUG flag update error:", e)
+
+
+# ======================================================
+# 全商品の一括判定（列ごとに読み込んで1パスで計算）
+# ======================================================
+FLAG_COLUMNS = (
+    "latest_price",
+    "threshold_price",
+    "flag_type",
+    "flag_value",
+    "initial_price",
+    "price_stats__min_price",
+)
+
+
+def evaluate_flags_bulk(queryset=None, chunk_size=5000):
+    """
+    商品の flag_reached をまとめて再判定する（判定ルール変更後の一括反映など）。
+    - 主キー順に chunk_size 件ずつ、判定に必要な列だけを読み込む
+    - flag_rule を列ごとに map して全件を一度に計算
+    - 値が変わった行だけを UPDATE（True / False それぞれ1文）
+    戻り値: (更新件数, 新たに買い時になった商品IDのリスト)
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset = queryset.order_by("id")
+
+    changed = 0
+    triggered = []
+    last_id = 0
+
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).values_list(
+                "id", "flag_reached", *FLAG_COLUMNS)[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        ids, current, *columns = zip(*rows)
+        reached = list(map(flag_rule, *columns))
+
+        to_true = [pid for pid, old, new in zip(ids, current, reached) if new and not old]
+        to_false = [pid for pid, old, new in zip(ids, current, reached) if old and not new]
+
+        with transaction.atomic():
+            if to_true:
+                Product.objects.filter(id__in=to_true).update(flag_reached=True)
+            if to_false:
+                Product.objects.filter(id__in=to_false).update(flag_reached=False)
+
+        changed += len(to_true) + len(to_false)
+        triggered.extend(to_true)
+
+    return changed, triggered
+
+
+# ======================================================
+# SQL側での一括再計算（UPDATE ... CASE）
+# ======================================================
+def flag_reached_expression():
+    """
+    flag_rule と同じ判定を SQL の CASE 式で表したもの。
+    割引率は小数を避けて「最新価格×100 <= 初期価格×(100-割引率)」で比較する。
+    """
+    has_latest = Q(latest_price__isnull=False) & ~Q(latest_price=0)
+    lowest_price = Subquery(
+        ProductPriceStats.objects.filter(product=OuterRef("pk")).values("min_price")[:1]
+    )
+
+    return Case(
+        When(
+            has_latest
+            & Q(flag_type="buy_price")
+            & Q(threshold_price__isnull=False) & ~Q(threshold_price=0)
+            & Q(latest_price__lte=F("threshold_price")),
+            then=Value(True),
+        ),
+        When(
+            has_latest
+            & Q(flag_type="percent_off")
+            & Q(flag_value__isnull=False) & ~Q(flag_value=0)
+            & Q(initial_price__isnull=False) & ~Q(initial_price=0)
+            & LessThanOrEqual(
+                F("latest_price") * 100,
+                F("initial_price") * (100 - F("flag_value")),
+            ),
+            then=Value(True),
+        ),
+        When(
+            has_latest
+            & Q(flag_type="lowest_price")
+            & LessThanOrEqual(
+                F("latest_price"),
+                Coalesce(NullIf(F("threshold_price"), Value(0)), lowest_price),
+            ),
+            then=Value(True),
+        ),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+
+
+def recompute_flags_sql(queryset=None, chunk_size=10000):
+    """
+    flag_reached を SQL だけで再計算する（Python にオブジェクトを読み込まない）。
+    主キーの範囲ごとに「False→True」「True→False」の2文の UPDATE を実行する。
+    戻り値: 値が変わった件数
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    bounds = queryset.aggregate(lo=Min("id"), hi=Max("id"))
+    if bounds["lo"] is None:
+        return 0
+
+    changed = 0
+    for start in range(bounds["lo"], bounds["hi"] + 1, chunk_size):
+        chunk = queryset.filter(id__gte=start, id__lt=start + chunk_size)
+        with transaction.atomic():
+            changed += chunk.filter(flag_reached=False).alias(
+                reached=flag_reached_expression()
+            ).filter(reached=True).update(flag_reached=True)
+            changed += chunk.filter(flag_reached=True).alias(
+                reached=flag_reached_expression()
+            ).filter(reached=False).update(flag_reached=False)
+    return changed
 # --- END: main/utils/flag_checker.py ---
@@ -1,21 +1,34 @@
 # main/utils/mailer.py
+import hashlib
 from main.models import NotificationEvent, UserNotificationSetting, Product
-from django.core.mail import send_mail
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.db import transaction
 from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q
+from main.utils.email_render import EmailRenderer
+from main.utils.outbox import enqueue_message, enqueue_messages, outbox_row
+from main.utils.unread_counter import adjust_unread_count
 
 
-def send_notification_summary(user, events, category):
+def summary_key(user_id, category, events):
+    """まとめメールの冪等キー（同じイベントの組み合わせは1通だけ登録される）"""
+    ids = [event.id for event in events]
+    return f"summary-{user_id}-{category}-{min(ids)}-{max(ids)}-{len(ids)}"
+
+
+def send_notification_summary(user, events, category, renderer=None):
     """
     ✅ 通知イベントまとめ送信（在庫系／買い時系どちらにも対応）
     - category: "stock" または "price"
     - 各商品画像URLをHTMLテンプレート内で表示
-    - メール送信成功時に NotificationEvent を既読にする
+    - メール送信待ち（EmailOutbox）への登録と同じトランザクションで
+      NotificationEvent を既読・送信済みにする（SMTP への送信は drain_email_outbox）
+    - renderer: 複数ユーザーへ続けて送る場合は同じ EmailRenderer を渡す
+      （テンプレートの読み込みと商品行の描画がバッチ全体で1回になる）
     """
-    if not events.exists():
+    events = list(events)  # クエリは1回だけ評価する
+    if not events:
         return
 
     # --- ユーザー設定確認 ---
@@ -30,17 +43,18 @@ def send_notification_summary(user, events, category):
     # --- カテゴリ別テンプレート設定 ---
     if category == "stock":
         subject = f"【買い時でっせ】在庫のお知らせ（{timezone.localtime().strftime('%Y-%m-%d')}）"
-        template_html = "email/stock_notification.html"
-        template_txt = "email/stock_notification.txt"
+        template_html = "emails/stock_notification.html"
+        template_txt = "emails/stock_notification.txt"
     else:
         subject = f"【買い時でっせ】本日の買い時まとめ（{timezone.localtime().strftime('%Y-%m-%d')}）"
-        template_html = "email/price_notification.html"
-        template_txt = "email/price_notification.txt"
+        template_html = "emails/price_notification.html"
+        template_txt = "emails/price_notification.txt"
 
     # --- コンテキスト生成 ---
+    renderer = renderer or EmailRenderer()
     context = {
         "user": user,
-        "events": events,
+        "rows": renderer.event_rows(events),
         "send_date": timezone.localtime().strftime("%Y-%m-%d"),
         "category": category,
         "site_name": "買い時でっせ",
@@ -48,8 +62,8 @@ def send_notification_summary(user, events, category):
     }
 
     # --- テンプレートをレンダリング ---
-    text_content = render_to_string(template_txt, context)
-    html_content = render_to_string(template_html, context)
+    text_content = renderer.render(template_txt, context)
+    html_content = renderer.render(template_html, context)
 
     # --- メール生成 ---
     msg = EmailMultiAlternatives(
@@ -61,76 +75,165 @@ def send_notification_summary(user, events, category):
     msg.attach_alternative(html_content, "text/html")
 
     try:
-        # === メール送信 ===
-        msg.send(fail_silently=False)
-
-        # === 対象イベントを送信済みに更新 ===
-        events.update(is_read=True)
+        # === 送信待ちへ登録し、対象イベントを送信済みに更新（同時に確定） ===
+        with transaction.atomic():
+            enqueue_message(msg, summary_key(user.id, category, events), user=user)
+            NotificationEvent.objects.filter(id__in=[e.id for e in events]).update(
+                is_read=True, sent_flag=True, sent_at=timezone.now())
+        adjust_unread_count(user.id, -sum(1 for e in events if not e.is_read))
 
-        print(f"📩 {user.username} へ {category} 通知メール送信完了（{events.count()}件）")
+        print(f"📩 {user.username} へ {category} 通知メールを登録（{len(events)}件）")
 
     except Exception as e:
-        print(f"⚠️ {user.username} への通知メール送信に失敗: {e}")
+        print(f"⚠️ {user.username} への通知メール登録に失敗: {e}")
+
+
+def build_daily_digest(user, to, events):
+    """
+    日次ダイジェストのメールを組み立てる（送信はしない）。
+    events: 発生日時の新しい順に並んだイベントのリスト（件数はここで1回だけ数える）
+    """
+    total = len(events)
+    subject = f"【買い時でっせ】{total}件の通知があります"
+
+    # テキストメール
+    message = f"{user.username} 様\n\n"
+    message += f"現在、{total}件の未読通知があります。\n\n"
+
+    for event in events[:DIGEST_MAX_LINES]:  # 最大10件
+        message += f"・{event.product.product_name}\n"
+        message += f"  {event.message}\n\n"
+
+    if total > DIGEST_MAX_LINES:
+        message += f"他 {total - DIGEST_MAX_LINES} 件\n\n"
+
+    message += "詳細はアプリでご確認ください。\n"
+
+    return EmailMessage(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to],
+    )
 
 
 def process_daily_notifications():
     """
     ✅ 日次通知バッチ：全ユーザーに対して未読通知をメール送信
     - メール通知ONのユーザーのみ
-    - 優先度「高」の商品の未読通知をまとめて送信
+    - 優先度「高」の商品の未読・未送信の通知をまとめて送信
     - 1日1回、設定された時刻に実行
     """
-    # 通知設定でメール通知を有効にしているユーザーを取得
-    settings_list = UserNotificationSetting.objects.filter(enabled=True)
+    result = dispatch_digests(
+        UserNotificationSetting.objects.filter(enabled=True),
+        NotificationEvent.objects.filter(
+            is_read=False,
+            sent_flag=False,
+            product__priority="高",
+        ),
+        build_daily_digest,
+    )
+    print(
+        f"✅ 日次通知: {result['users']}人に送信（{result['events']}件） / 失敗 {len(result['failed'])}人")
+    return result
 
-    for setting in settings_list:
-        user = setting.user
 
-        # 未読の通知イベントを取得（優先度「高」のみ）
-        unread_events = NotificationEvent.objects.filter(
-            user=user,
-            is_read=False,
-            product__priority="高"
-        ).order_by("-occurred_at")
+# ======================================================
+# ダイジェスト一括登録（送信はアウトボックスのワーカーが行う）
+# ======================================================
+DIGEST_CHUNK_SIZE = 500
+DIGEST_MAX_LINES = 10
 
-        if not unread_events.exists():
-            continue
 
-        # メール本文を生成
-        subject = f"【買い時でっせ】{unread_events.count()}件の通知があります"
+def iter_setting_chunks(queryset, chunk_size=DIGEST_CHUNK_SIZE):
+    """通知設定を主キー順に chunk_size 件ずつ返す（全ユーザーをメモリに載せない）"""
+    queryset = queryset.select_related("user").order_by("id")
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        yield chunk
 
-        # テキストメール
-        message = f"{user.username} 様\n\n"
-        message += f"現在、{unread_events.count()}件の未読通知があります。\n\n"
 
-        for event in unread_events[:10]:  # 最大10件
-            message += f"・{event.product.product_name}\n"
-            message += f"  {event.message}\n\n"
+def load_events_by_user(events_queryset, user_ids):
+    """チャンク内ユーザーの対象イベントを1クエリで読み込み → {user_id: [event, ...]}"""
+    grouped = {}
+    events = (
+        events_queryset.filter(user_id__in=user_ids)
+        .select_related("product")
+        .only("id", "user_id", "message", "occurred_at", "product__product_name")
+        .order_by("user_id", "-occurred_at")
+    )
+    for event in events:
+        grouped.setdefault(event.user_id, []).append(event)
+    return grouped
 
-        if unread_events.count() > 10:
-            message += f"他 {unread_events.count() - 10} 件\n\n"
 
-        message += "詳細はアプリでご確認ください。\n"
+def digest_key(user_id, events):
+    """ダイジェストの冪等キー（同じイベントの組み合わせは1通だけ登録される）"""
+    ids = [event.id for event in events]
+    return f"digest-{user_id}-{min(ids)}-{max(ids)}-{len(ids)}"
 
-        # メール送信
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[setting.email or user.email],
-                fail_silently=False,
-            )
-            print(f"✅ {user.username} にメール送信完了（{unread_events.count()}件）")
-        except Exception as e:
-            print(f"❌ {user.username} へのメール送信失敗: {e}")
-        except Exception as e:
-            print(f"❌ {user.username} へのメール送信失敗: {e}")
 
+def dispatch_digests(settings_queryset, events_queryset, build_message,
+                     chunk_size=DIGEST_CHUNK_SIZE, after_chunk=None):
+    """
+    通知設定をチャンクごとに流し読みし、ユーザーごとに1通のダイジェストを
+    メール送信待ち（EmailOutbox）へ登録する。SMTP への送信は drain_email_outbox が行う。
+    - イベントはチャンクごとに1クエリで先読み
+    - 送信待ちの登録（bulk_create）とイベントの送信済み更新（UPDATE 1文）を
+      チャンクごとに1トランザクションで確定する
+    build_message(user, to, events) -> EmailMessage
+    after_chunk(settings, failed_user_ids): チャンク処理後に呼ぶ（次回予定の更新など）
+    戻り値: {"users": 登録人数, "events": 対象イベント数, "failed": [username, ...]}
+    """
+    result = {"users": 0, "events": 0, "failed": []}
+
+    for chunk in iter_setting_chunks(settings_queryset, chunk_size):
+        events_by_user = load_events_by_user(
+            events_queryset, [s.user_id for s in chunk])
 
-def send_notification_email(user, product, message):
+        rows = []
+        event_ids = []
+        failed_user_ids = set()
+        for setting in chunk:
+            events = events_by_user.get(setting.user_id)
+            to = setting.email or setting.user.email
+            if not events or not to:
+                continue
+            try:
+                message = build_message(setting.user, to, events)
+            except Exception as e:
+                print(f"❌ {setting.user.username} のメール作成失敗: {e}")
+                result["failed"].append(setting.user.username)
+                failed_user_ids.add(setting.user_id)
+                continue
+            rows.append(outbox_row(
+                message, digest_key(setting.user_id, events), user=setting.user))
+            event_ids.extend(event.id for event in events)
+
+        if rows:
+            with transaction.atomic():
+                enqueue_messages(rows)
+                NotificationEvent.objects.filter(id__in=event_ids).update(
+                    sent_flag=True, sent_at=timezone.now())
+            result["users"] += len(rows)
+            result["events"] += len(event_ids)
+
+        if after_chunk:
+            after_chunk(chunk, failed_user_ids)
+
+    return result
+
+
+def send_notification_email(user, product, message, event=None):
     """
     ✅ 個別通知メール送信（買い時検知時）
+    メール送信待ち（EmailOutbox）へ登録する。
+    event（NotificationEvent）を渡すと冪等キーはイベント単位、
+    無ければ同じ商品・同じ内容の通知を1日1通にまとめる。
     """
     try:
         setting = UserNotificationSetting.objects.get(user=user)
@@ -144,13 +247,22 @@ def send_notification_email(user, product, message):
         email_message += f"{message}\n\n"
         # email_message += f"詳細: {settings.SITE_URL}/main/product/detail/{product.id}/\n"  # SITE_URLが未定義のため一時的にコメントアウト
 
-        send_mail(
-            subject=subject,
-            message=email_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[setting.email or user.email],
-            fail_silently=False,
+        # 送信は drain_email_outbox に任せる（再実行で同じ通知が二重に登録されないよう冪等キーを付ける）
+        if event is not None:
+            key = f"notify-{user.id}-{product.id}-event-{event.id}"
+        else:
+            digest = hashlib.sha1(message.encode("utf-8")).hexdigest()[:16]
+            key = f"notify-{user.id}-{product.id}-{timezone.localdate():%Y%m%d}-{digest}"
+        enqueue_message(
+            EmailMessage(
+                subject=subject,
+                body=email_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[setting.email or user.email],
+            ),
+            key,
+            user=user,
         )
-        print(f"✅ {user.username} に通知メール送信完了: {product.product_name}")
+        print(f"✅ {user.username} に通知メールを登録: {product.product_name}")
     except Exception as e:
         print(f"❌ 通知メール送信失敗: {e}")
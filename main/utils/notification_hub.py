@@ -0,0 +1,148 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\notification_hub.py
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# ======================================================
+# 通知のプッシュ配信（SSE 接続へのファンアウト）
+# ======================================================
+# 1ユーザーが複数タブを開いていれば、その全接続へ同じ内容を配る。
+# - LocalHub: プロセス内だけで配信（Redis 不要・1台構成用）
+# - RedisRelayHub: 送信を Redis の Pub/Sub 経由にし、各プロセスの LocalHub へ中継する
+#   （バッチやワーカーが別プロセスでも、Web プロセスの接続へ届く）
+class LocalHub:
+    """プロセス内のファンアウト。publish はどのスレッドから呼んでもよい"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> {(loop, queue), ...}
+
+    def subscribe(self, user_id):
+        """接続を登録し、受信用の asyncio.Queue を返す（イベントループ内で呼ぶ）"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, user_id, payload):
+        """user_id の全接続へ payload（dict）を配る。接続が無ければ何もしない"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, payload)
+            except RuntimeError:
+                # 接続側のループが既に閉じている（切断処理中）
+                pass
+
+
+def _offer(queue, payload):
+    """受信が追いつかない接続は古いものから捨てる（件数は最新の値だけ届けばよい）"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(payload)
+
+
+class RedisRelayHub(LocalHub):
+    """
+    publish を Redis へ送り、プロセスごとに1本の購読スレッドで受けて LocalHub に流す。
+    Redis への接続は接続数に関係なく1プロセス2本（送信・購読）。
+    """
+
+    CHANNEL_PREFIX = "kaidoki:notify:"
+
+    def __init__(self, url, queue_size=100):
+        super().__init__(queue_size)
+        import redis  # REDIS_URL を使う場合のみ必要
+
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, payload):
+        try:
+            self._redis.publish(f"{self.CHANNEL_PREFIX}{user_id}", json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"[notification_hub] Redis publish 失敗: {e}")
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name="notification-hub", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+        for message in pubsub.listen():
+            try:
+                channel = message["channel"].decode()
+                user_id = int(channel[len(self.CHANNEL_PREFIX):])
+                super().publish(user_id, json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"[notification_hub] 受信メッセージを処理できません: {e}")
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """プロセス共通のハブ（REDIS_URL があれば Redis 中継、無ければプロセス内のみ）"""
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                queue_size = settings.NOTIFY_STREAM_QUEUE_SIZE
+                if settings.REDIS_URL:
+                    _hub = RedisRelayHub(settings.REDIS_URL, queue_size)
+                else:
+                    _hub = LocalHub(queue_size)
+    return _hub
+
+
+def publish_to_user(user_id, payload):
+    """通知・未読件数の変化を接続中のタブへ送る（失敗しても呼び出し元は止めない）"""
+    try:
+        get_hub().publish(user_id, payload)
+    except Exception as e:
+        logger.warning(f"[notification_hub] 配信失敗 user={user_id}: {e}")
+
+
+def format_sse(event, payload, event_id=None):
+    """Server-Sent Events の1メッセージ分の文字列"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(payload, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
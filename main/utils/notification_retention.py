@@ -0,0 +1,82 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\notification_retention.py
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from main.models import NotificationEvent, UserNotificationSetting
+from main.utils.unread_counter import reconcile_unread_counts
+
+
+# ======================================================
+# 通知の保持期間処理（自動既読・古い通知の削除）
+# ======================================================
+UNLIMITED_RETENTION_DAYS = 365  # 「無制限」の選択肢
+DELETE_AFTER_DAYS = 30
+DELETE_CHUNK_SIZE = 5000
+
+
+def retention_tiers():
+    """ユーザーが設定している保持期間（日）の一覧。無制限は含めない"""
+    return sorted(
+        UserNotificationSetting.objects.filter(
+            notification_retention_days__lt=UNLIMITED_RETENTION_DAYS)
+        .values_list("notification_retention_days", flat=True)
+        .distinct()
+    )
+
+
+def mark_expired_as_read(now=None):
+    """
+    保持期間を過ぎた未読通知を既読にする。
+    ユーザーごとではなく保持期間（7日／30日）ごとに UPDATE を1文ずつ実行する。
+    （対象ユーザーはサブクエリで絞り込むため、ユーザー数に関係なく文の数は一定）
+    戻り値: {保持期間: 既読にした件数}
+    """
+    now = now or timezone.now()
+    result = {}
+    for days in retention_tiers():
+        tier_users = UserNotificationSetting.objects.filter(
+            notification_retention_days=days).values("user_id")
+        result[days] = NotificationEvent.objects.filter(
+            is_read=False,
+            occurred_at__lt=now - timedelta(days=days),
+            user_id__in=tier_users,
+        ).update(is_read=True)
+
+    # 誰の件数が変わったかは分からないため、未読件数キャッシュを実件数で上書きする
+    if any(result.values()):
+        reconcile_unread_counts()
+    return result
+
+
+def delete_old_events(days=DELETE_AFTER_DAYS, chunk_size=DELETE_CHUNK_SIZE, now=None):
+    """
+    既読のまま days 日を過ぎた通知を削除する。
+    対象の主キー範囲を chunk_size ごとに区切り、範囲ごとに DELETE を1文ずつ
+    （1トランザクションずつ）実行するため、1回のロック時間は chunk_size 件分に収まる。
+    戻り値: 削除件数
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    expired = NotificationEvent.objects.filter(is_read=True, occurred_at__lt=cutoff)
+
+    bounds = expired.aggregate(lo=Min("id"), hi=Max("id"))
+    if bounds["lo"] is None:
+        return 0
+
+    deleted = 0
+    for start in range(bounds["lo"], bounds["hi"] + 1, chunk_size):
+        with transaction.atomic():
+            count, _ = expired.filter(
+                id__gte=start, id__lt=start + chunk_size).delete()
+        deleted += count
+    return deleted
+
+
+def apply_retention(delete_after_days=DELETE_AFTER_DAYS, chunk_size=DELETE_CHUNK_SIZE):
+    """自動既読 → 古い既読通知の削除 の順に実行（日次バッチ用）"""
+    now = timezone.now()
+    marked = mark_expired_as_read(now=now)
+    deleted = delete_old_events(delete_after_days, chunk_size=chunk_size, now=now)
+    return {"marked": marked, "deleted": deleted}
@@ -1,15 +1,17 @@
 # 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\notifications.py
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.timezone import now
 from django.urls import reverse
+from main.utils.email_render import EmailRenderer
 
 
-def send_price_drop_email(user, items, request=None):
+def send_price_drop_email(user, items, request=None, renderer=None):
     """
     値下がり通知メールを送信
     - items: [{"product_name": str, "new_price": int, "old_price": int, "url": str, "time": str}, ...]
+    - renderer: バッチで複数ユーザーに送る場合は同じ EmailRenderer を渡す
+      （テンプレートは1回だけ読み込み、同じ商品の行は1回だけ描画する）
     """
     try:
         # 通知設定ページのURL
@@ -17,15 +19,17 @@ def send_price_drop_email(user, items, request=None):
             reverse("main:notification_settings")) if request else "#"
 
         # テンプレートに渡す変数
+        renderer = renderer or EmailRenderer()
         context = {
             "user": user.username,
             "items": items,
+            "item_texts": [renderer.price_drop_item(item) for item in items],
             "time": now().strftime("%Y-%m-%d %H:%M:%S"),
             "settings_url": settings_url,
         }
 
         # メール本文生成
-        message = render_to_string(
+        message = renderer.render(
             "emails/price_drop_notification.txt", context)
 
         # メール送信
@@ -1,5 +1,25 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
 from django.utils import timezone
 from main.models import NotificationEvent
+from main.utils.unread_counter import record_new_events
+
+
+def build_restock_event(product, user):
+    """
+    在庫復活イベントを未保存のまま生成する（bulk_create 用）
+    """
+    return NotificationEvent(
+        product=product,
+        user=user,
+        event_type="stock_restore",  # モデル内の選択肢に合わせて
+        message=f"「{product.product_name}」が再入荷しました！",
+        occurred_at=timezone.now(),
+        is_read=False,
+    )
 
 
 def create_restock_event(product, user):
@@ -7,15 +27,84 @@ def create_restock_event(product, user):
     ✅ 在庫復活時に通知イベントを作成
     """
     try:
-        NotificationEvent.objects.create(
-            product=product,
-            user=user,
-            event_type="stock_restore",  # モデル内の選択肢に合わせて
-            message=f"「{product.product_name}」が再入荷しました！",
-            occurred_at=timezone.now(),
-            is_read=False,
-        )
+        build_restock_event(product, user).save()
         return True
     except Exception as e:
         print(f"[notify_events] Error creating restock event: {e}")
         return False
+
+
+# ======================================================
+# 通知イベントのまとめて重複判定・一括作成
+# ======================================================
+# 同じ商品・同じ種別のイベントを再作成しない期間
+DEDUP_WINDOWS = {
+    "stock_few": timedelta(hours=1),
+    "stock_restore": timedelta(hours=24),
+    "threshold_hit": timedelta(hours=24),
+    "discount_over": timedelta(hours=24),
+}
+
+
+def load_recent_pairs(product_ids, windows, now=None):
+    """
+    期間内に作成済みの (product_id, event_type) を1クエリでまとめて取得する。
+    windows: {event_type: timedelta}
+    """
+    if not product_ids or not windows:
+        return set()
+    now = now or timezone.now()
+    condition = reduce(or_, (
+        Q(event_type=event_type, occurred_at__gte=now - window)
+        for event_type, window in windows.items()
+    ))
+    return set(
+        NotificationEvent.objects.filter(product_id__in=product_ids)
+        .filter(condition)
+        .values_list("product_id", "event_type")
+        .distinct()
+    )
+
+
+class EventCollector:
+    """
+    バッチ中に発生した通知イベントを溜めておき、flush() でまとめて作成する。
+    - 商品ごとの exists() の代わりに、作成済みの組み合わせを1クエリで読み込んで判定
+    - 同じバッチ内での重複も除外
+    - 作成は bulk_create 1回
+    DEDUP_WINDOWS に無い種別（最安値更新など）は重複判定しない。
+    """
+
+    def __init__(self, windows=None):
+        self.windows = DEDUP_WINDOWS if windows is None else windows
+        self._pending = {}
+
+    def add(self, product, event_type, message):
+        """イベントを追加（同じ商品・種別はバッチ内で1件のみ）"""
+        key = (product.id, event_type)
+        if key not in self._pending:
+            self._pending[key] = NotificationEvent(
+                product=product,
+                user_id=product.user_id,
+                event_type=event_type,
+                message=message,
+            )
+
+    def flush(self, now=None):
+        """重複を除いて一括作成し、作成したイベントのリストを返す"""
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, {}
+        now = now or timezone.now()
+
+        product_ids = {product_id for product_id, _ in pending}
+        windows = {
+            event_type: window for event_type, window in self.windows.items()
+            if any(t == event_type for _, t in pending)
+        }
+        recent = load_recent_pairs(product_ids, windows, now=now)
+
+        events = [event for key, event in pending.items() if key not in recent]
+        created = NotificationEvent.objects.bulk_create(events)
+        record_new_events(created)
+        return created
@@ -0,0 +1,196 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\outbox.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from main.models import EmailOutbox
+
+
+# ======================================================
+# 登録（通知処理側：SMTP を待たずに書き込むだけ）
+# ======================================================
+def outbox_row(message, idempotency_key, user=None):
+    """EmailMessage / EmailMultiAlternatives を未保存の EmailOutbox 行に変換"""
+    html_body = ""
+    for content, mimetype in getattr(message, "alternatives", []):
+        if mimetype == "text/html":
+            html_body = content
+            break
+
+    return EmailOutbox(
+        idempotency_key=idempotency_key,
+        user=user,
+        to_email=message.to[0],
+        from_email=message.from_email or "",
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+    )
+
+
+def enqueue_messages(rows):
+    """
+    EmailOutbox 行をまとめて登録する。
+    同じ冪等キーが既にあれば登録しない（再実行しても二重送信にならない）。
+    呼び出し側のトランザクション内で実行すれば、通知の送信済み更新と同時に確定する。
+    """
+    return EmailOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def enqueue_message(message, idempotency_key, user=None):
+    """1通だけ登録する"""
+    return enqueue_messages([outbox_row(message, idempotency_key, user=user)])
+
+
+# ======================================================
+# 送信ワーカー
+# ======================================================
+def backoff_delay(attempts):
+    """attempts 回目の失敗後、次に送るまでの待ち時間（指数バックオフ・上限あり）"""
+    seconds = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def claim_batch(limit, now=None):
+    """
+    送信可能なメールを最大 limit 件確保し、送信中（期限付き）にする。
+    - 送信待ちで次回送信日時を過ぎたもの
+    - 送信中のまま期限切れになったもの（ワーカーが落ちた場合）
+    送信中のまま期限切れになり、確保回数が上限（EMAIL_OUTBOX_MAX_ATTEMPTS）に
+    達したものは「送信失敗」にして確保しない（ワーカーを落とすメールを繰り返さない）。
+    複数ワーカーが同時に動いても同じ行を取り合わないよう SKIP LOCKED で確保する
+    （対応していない SQLite では書き込みロックで直列化される）。
+    """
+    now = now or timezone.now()
+    lease_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+
+    with transaction.atomic():
+        EmailOutbox.objects.filter(
+            status=EmailOutbox.STATUS_SENDING,
+            next_attempt_at__lte=now,
+            attempts__gte=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+        ).update(
+            status=EmailOutbox.STATUS_FAILED,
+            last_error="送信中のまま期限切れ（上限回数に達したため送信失敗）",
+        )
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING],
+                next_attempt_at__lte=now,
+            )
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(id__in=ids).update(
+            status=EmailOutbox.STATUS_SENDING,
+            next_attempt_at=lease_until,
+            attempts=F("attempts") + 1,
+        )
+    return list(EmailOutbox.objects.filter(id__in=ids))
+
+
+def _build_message(row, connection):
+    message = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email or None,
+        to=[row.to_email],
+        connection=connection,
+        headers={
+            # 受信側でも重複を判別できるよう冪等キーから Message-ID を固定する
+            "Message-ID": f"<{row.idempotency_key}@kaidoki-desse>",
+        },
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, "text/html")
+    return message
+
+
+def _send_rows(rows):
+    """
+    ワーカースレッド内の処理：1つの SMTP 接続で rows を順に送る。
+    戻り値: (送信できたID, {失敗したID: エラー内容})
+    """
+    sent, failed = [], {}
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        return sent, {row.id: f"SMTP接続エラー: {e}" for row in rows}
+
+    try:
+        for row in rows:
+            try:
+                connection.send_messages([_build_message(row, connection)])
+                sent.append(row.id)
+            except Exception as e:
+                failed[row.id] = str(e)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _record_results(rows, sent, failed, now=None):
+    """送信結果をまとめて反映（送信済み1文＋失敗分の再送日時更新）"""
+    now = now or timezone.now()
+    if sent:
+        EmailOutbox.objects.filter(id__in=sent).update(
+            status=EmailOutbox.STATUS_SENT, sent_at=now, last_error="")
+
+    if not failed:
+        return
+
+    max_attempts = settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    updates = []
+    for row in rows:
+        if row.id not in failed:
+            continue
+        row.last_error = failed[row.id][:2000]
+        if row.attempts >= max_attempts:
+            row.status = EmailOutbox.STATUS_FAILED
+        else:
+            row.status = EmailOutbox.STATUS_PENDING
+            row.next_attempt_at = now + backoff_delay(row.attempts)
+        updates.append(row)
+    EmailOutbox.objects.bulk_update(
+        updates, ["status", "next_attempt_at", "last_error"])
+
+
+def drain_outbox(batch_size=None, workers=None):
+    """
+    アウトボックスを1バッチ分送信する。
+    batch_size 件を確保し、workers 本のスレッドに分けて並列に送信する
+    （各スレッドは SMTP 接続を1本だけ開いて使い回す）。
+    戻り値: {"claimed", "sent", "failed"}
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    workers = workers or settings.EMAIL_OUTBOX_WORKERS
+
+    rows = claim_batch(batch_size)
+    if not rows:
+        return {"claimed": 0, "sent": 0, "failed": 0}
+
+    slices = [rows[i::workers] for i in range(workers) if rows[i::workers]]
+    sent, failed = [], {}
+    with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+        for slice_sent, slice_failed in executor.map(_send_rows, slices):
+            sent.extend(slice_sent)
+            failed.update(slice_failed)
+
+    _record_results(rows, sent, failed)
+    return {"claimed": len(rows), "sent": len(sent), "failed": len(failed)}
+
+
+def pending_count():
+    """送信待ち（送信中を含む）の件数"""
+    return EmailOutbox.objects.filter(
+        Q(status=EmailOutbox.STATUS_PENDING) | Q(status=EmailOutbox.STATUS_SENDING)
+    ).count()
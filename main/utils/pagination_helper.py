@@ -1,5 +1,13 @@
 # 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\pagination_helper.py
+import base64
+import datetime
+import json
+from functools import reduce
+from operator import and_, or_
+
 from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
 
 
 def paginate_queryset(request, queryset, per_page=20, context_name="page_obj"):
@@ -16,3 +24,219 @@ def paginate_queryset(request, queryset, per_page=20, context_name="page_obj"):
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
     return page_obj, paginator
+
+
+# ======================================================
+# キーセット（カーソル）方式のページネーション
+# ======================================================
+# OFFSET と COUNT(*) を使わず「前ページ最後の行の並び順の値より後ろ」を WHERE で取る。
+# 何ページ目でも、並び順のインデックスを per_page+1 件読むだけで済む。
+# ページ番号の代わりに ?after=<カーソル> / ?before=<カーソル> で前後に移動する。
+KEYSET_MAX_PER_PAGE = 100
+KEYSET_COUNT_LIMIT = 10000
+
+
+def _parse_ordering(model, ordering):
+    """["-created_at", "latest_price"] → [(フィールド, 降順か), ...]（末尾に主キーを補う）"""
+    keys = []
+    for name in ordering:
+        desc = name.startswith("-")
+        keys.append((model._meta.get_field(name.lstrip("-")), desc))
+    pk = model._meta.pk
+    if not any(field == pk for field, _ in keys):
+        keys.append((pk, keys[-1][1] if keys else False))
+    return keys
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    """日時はマイクロ秒まで残す（DjangoJSONEncoder はミリ秒に丸めるため一致しなくなる）"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, cls=_CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, keys):
+    """カーソル文字列 → 各キーの値（不正なら None）"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(keys):
+            return None
+        return [
+            None if value is None else field.to_python(value)
+            for (field, _), value in zip(keys, values)
+        ]
+    except Exception:
+        return None
+
+
+def _after(name, value, desc, nulls_last):
+    """並び順で value より「後ろ」にある行の条件（NULL の位置も考慮）"""
+    if value is None:
+        # NULL が末尾なら NULL より後ろは無い／先頭なら NULL 以外がすべて後ろ
+        return Q(pk__in=[]) if nulls_last else Q(**{f"{name}__isnull": False})
+    condition = Q(**{f"{name}__lt" if desc else f"{name}__gt": value})
+    if nulls_last:
+        condition |= Q(**{f"{name}__isnull": True})
+    return condition
+
+
+def _equal(name, value):
+    return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+
+
+def _keyset_filter(keys, values, reverse=False):
+    """
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... の形の条件。
+    reverse=True のときは逆順（前のページ方向）で「後ろ」を取る。
+    """
+    conditions = []
+    for i, ((field, desc), value) in enumerate(zip(keys, values)):
+        equals = [_equal(f.attname, v) for (f, _), v in zip(keys[:i], values[:i])]
+        after = _after(field.attname, value, desc != reverse, nulls_last=not reverse)
+        conditions.append(reduce(and_, equals + [after]))
+    return reduce(or_, conditions)
+
+
+def _order_expressions(keys, reverse=False):
+    """NULL は常に末尾（逆順で読むときは先頭）に固定し、DB ごとの差をなくす"""
+    nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+    return [
+        F(field.attname).desc(**nulls) if desc != reverse else F(field.attname).asc(**nulls)
+        for field, desc in keys
+    ]
+
+
+def capped_count(queryset, limit=KEYSET_COUNT_LIMIT):
+    """件数を最大 limit+1 件まで数える（概数表示用）。戻り値: (件数, 上限を超えたか)"""
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count > limit
+
+
+class KeysetPage:
+    """キーセット方式の1ページ分（テンプレートからは通常のページと同様に反復できる）"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, has_next, has_previous, first_cursor, last_cursor,
+                 query_params, count=None, count_capped=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+        self.count_capped = count_capped
+        self._first_cursor = first_cursor
+        self._last_cursor = last_cursor
+        self._query_params = query_params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _query(self, **cursor):
+        params = self._query_params.copy()
+        for key in ("page", "after", "before"):
+            params.pop(key, None)
+        for key, value in cursor.items():
+            params[key] = value
+        return params.urlencode()
+
+    @property
+    def first_query(self):
+        """先頭ページへのクエリ文字列（絞り込み条件は引き継ぐ）"""
+        return self._query()
+
+    @property
+    def next_query(self):
+        return self._query(after=self._last_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query(before=self._first_cursor)
+
+    def state(self):
+        """行以外のページ情報（キャッシュ保存用）"""
+        return {
+            "has_next": self.has_next,
+            "has_previous": self.has_previous,
+            "first_cursor": self._first_cursor,
+            "last_cursor": self._last_cursor,
+            "count": self.count,
+            "count_capped": self.count_capped,
+        }
+
+    @classmethod
+    def from_state(cls, object_list, state, query_params):
+        """state() で保存したページ情報と読み直した行からページを組み立てる"""
+        return cls(object_list, query_params=query_params, **state)
+
+
+def keyset_paginate(request, queryset, ordering, per_page=20,
+                    max_per_page=KEYSET_MAX_PER_PAGE, count_limit=KEYSET_COUNT_LIMIT):
+    """
+    クエリセットをキーセット方式でページ分割する。
+    - ordering: 並び順（例: ["-occurred_at"]、["latest_price", "initial_price"]）。
+      主キーは自動で末尾に補い、NULL は常に末尾に並べる
+    - per_page: ?per_page= があれば優先（max_per_page で頭打ち）
+    - count_limit: 件数は最大この件数まで数える（None なら数えない）
+    戻り値: KeysetPage
+    """
+    try:
+        per_page = int(request.GET.get("per_page", per_page))
+    except (TypeError, ValueError):
+        pass
+    per_page = max(1, min(per_page, max_per_page))
+
+    keys = _parse_ordering(queryset.model, ordering)
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    cursor = after or before
+    values = _decode_cursor(cursor, keys) if cursor else None
+    # カーソルが不正な場合は先頭ページを表示する
+    backward = values is not None and not after
+
+    page_qs = queryset
+    if values is not None:
+        page_qs = page_qs.filter(_keyset_filter(keys, values, reverse=backward))
+    rows = list(page_qs.order_by(*_order_expressions(keys, reverse=backward))[:per_page + 1])
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    def cursor_of(obj):
+        return _encode_cursor([getattr(obj, field.attname) for field, _ in keys])
+
+    count, capped = (None, False)
+    if count_limit:
+        count, capped = capped_count(queryset, count_limit)
+
+    return KeysetPage(
+        rows,
+        has_next=has_next,
+        has_previous=has_previous,
+        first_cursor=cursor_of(rows[0]) if rows else "",
+        last_cursor=cursor_of(rows[-1]) if rows else "",
+        query_params=request.GET,
+        count=count,
+        count_capped=capped,
+    )
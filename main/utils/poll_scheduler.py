@@ -0,0 +1,137 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\poll_scheduler.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Q, StdDev
+from django.utils import timezone
+
+from main.models import PriceHistory, Product
+
+
+# ======================================================
+# 商品ごとの価格チェック間隔（適応型スケジューラ）
+# ======================================================
+# 基本間隔に以下の係数を掛けて next_check_at を決める。
+# - 優先度「高」                        → 短く
+# - 直近の価格変動が大きい商品           → 短く
+# - 買い時価格の手前まで下がっている商品 → 短く
+# - 何日も価格が動いていない商品         → 長く（バックオフ）
+# 取得に失敗した商品は、連続失敗回数に応じて基本間隔を倍々に延ばす（上限あり）。
+
+VOLATILE_CV = 0.05      # 変動係数（標準偏差 / 平均）がこれ以上なら「よく動く」
+SOMEWHAT_VOLATILE_CV = 0.02
+NEAR_THRESHOLD_RATE = 0.05  # 買い時価格の +5% 以内なら「手前」
+FLAT_DAYS = 3
+VERY_FLAT_DAYS = 7
+
+
+def due_products(queryset=None, now=None):
+    """次回チェック日時を過ぎた（または未設定の）商品"""
+    now = now or timezone.now()
+    queryset = Product.objects.all() if queryset is None else queryset
+    return queryset.filter(
+        Q(next_check_at__isnull=True) | Q(next_check_at__lte=now)
+    )
+
+
+def load_volatility(product_ids, days=None):
+    """
+    直近 days 日の価格の変動係数を商品ごとに1クエリで集計 → {product_id: cv}
+    """
+    days = days or settings.POLL_VOLATILITY_DAYS
+    since = timezone.now() - timedelta(days=days)
+    rows = (
+        PriceHistory.objects.filter(
+            product_id__in=product_ids, checked_at__gte=since)
+        .values("product_id")
+        .annotate(avg=Avg("price"), sd=StdDev("price"), n=Count("id"))
+    )
+
+    volatility = {}
+    for row in rows:
+        if row["n"] < 2 or not row["avg"]:
+            continue
+        volatility[row["product_id"]] = float(row["sd"] or 0) / float(row["avg"])
+    return volatility
+
+
+def _target_price(product):
+    """買い時と判定される価格（買い時価格／割引後価格）"""
+    if product.flag_type == "percent_off" and product.flag_value and product.initial_price:
+        return float(product.initial_price) * (1 - float(product.flag_value) / 100)
+    if product.threshold_price:
+        return float(product.threshold_price)
+    return None
+
+
+def is_near_threshold(product):
+    """買い時価格の少し上まで下がってきているか"""
+    target = _target_price(product)
+    if not target or not product.latest_price or product.flag_reached:
+        return False
+    return float(product.latest_price) <= target * (1 + NEAR_THRESHOLD_RATE)
+
+
+def compute_interval(product, volatility=0.0, last_changed_at=None, now=None):
+    """商品1件の次回チェックまでの間隔（timedelta）"""
+    now = now or timezone.now()
+    minutes = float(settings.POLL_BASE_INTERVAL_MINUTES)
+
+    if product.priority == "高":
+        minutes *= 0.5
+
+    if volatility >= VOLATILE_CV:
+        minutes *= 0.5
+    elif volatility >= SOMEWHAT_VOLATILE_CV:
+        minutes *= 0.75
+
+    if is_near_threshold(product):
+        minutes *= 0.5
+
+    if last_changed_at:
+        flat_days = (now - last_changed_at).days
+        if flat_days >= VERY_FLAT_DAYS:
+            minutes *= 4
+        elif flat_days >= FLAT_DAYS:
+            minutes *= 2
+
+    minutes = max(settings.POLL_MIN_INTERVAL_MINUTES,
+                  min(settings.POLL_MAX_INTERVAL_MINUTES, minutes))
+    return timedelta(minutes=minutes)
+
+
+def schedule_next_checks(products, last_changed=None, now=None):
+    """
+    商品リストの next_check_at をまとめて計算してセットする（保存は呼び出し側）。
+    last_changed: {product_id: 最後に価格・在庫が変わった日時}
+    """
+    now = now or timezone.now()
+    last_changed = last_changed or {}
+    volatility = load_volatility([p.id for p in products])
+
+    for product in products:
+        interval = compute_interval(
+            product,
+            volatility=volatility.get(product.id, 0.0),
+            last_changed_at=last_changed.get(product.id),
+            now=now,
+        )
+        product.next_check_at = now + interval
+    return products
+
+
+def schedule_error_retries(products, now=None):
+    """
+    取得に失敗した商品の連続失敗回数を増やし、next_check_at を延ばす（保存は呼び出し側）。
+    間隔は 基本間隔 × 2^(失敗回数-1)、上限は POLL_MAX_INTERVAL_MINUTES。
+    販売終了・URL誤りの商品が毎回のチェックで取得され続けないようにする。
+    """
+    now = now or timezone.now()
+    for product in products:
+        product.fetch_error_count += 1
+        # 2の累乗が大きくなりすぎないよう、上限を超える回数では打ち止め
+        exponent = min(product.fetch_error_count - 1, 16)
+        minutes = min(settings.POLL_MAX_INTERVAL_MINUTES,
+                      settings.POLL_BASE_INTERVAL_MINUTES * 2 ** exponent)
+        product.next_check_at = now + timedelta(minutes=minutes)
+    return products
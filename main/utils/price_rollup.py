@@ -0,0 +1,260 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\price_rollup.py
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from main.models import PriceHistory, PriceRollup
+
+
+# ======================================================
+# 集計単位（時間足・日足）
+# ======================================================
+RESOLUTIONS = (PriceRollup.RESOLUTION_HOUR, PriceRollup.RESOLUTION_DAY)
+
+
+def bucket_start(dt, resolution):
+    """dt が属する集計区間の開始日時（日足は日本時間の0時で区切る）"""
+    if resolution == PriceRollup.RESOLUTION_HOUR:
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return timezone.localtime(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _new_bucket(product_id, resolution, start, price, stock, sampled_at):
+    return PriceRollup(
+        product_id=product_id,
+        resolution=resolution,
+        bucket_start=start,
+        open_price=price,
+        high_price=price,
+        low_price=price,
+        close_price=price,
+        close_stock=stock,
+        sample_count=0,
+        last_sampled_at=sampled_at,
+    )
+
+
+def _add_to_bucket(rollup, price, stock, sampled_at, count=1):
+    rollup.high_price = max(rollup.high_price, price)
+    rollup.low_price = min(rollup.low_price, price)
+    rollup.close_price = price
+    rollup.close_stock = stock
+    rollup.sample_count += count
+    rollup.last_sampled_at = sampled_at
+
+
+ROLLUP_FIELDS = ["high_price", "low_price", "close_price",
+                 "close_stock", "sample_count", "last_sampled_at"]
+
+
+# ======================================================
+# 価格取得ごとの差分更新（PriceBatchWriter から呼ぶ）
+# ======================================================
+def record_rollups(samples, now=None):
+    """
+    同じ時刻に取得したサンプルを時間足・日足へまとめて反映する。
+    samples: [(product_id, price, stock), ...]
+    粒度ごとに「既存バケットの読み込み1クエリ＋一括書き込み」で済む。
+    """
+    if not samples:
+        return
+    now = now or timezone.now()
+    product_ids = [product_id for product_id, _, _ in samples]
+
+    for resolution in RESOLUTIONS:
+        start = bucket_start(now, resolution)
+        existing = {
+            rollup.product_id: rollup
+            for rollup in PriceRollup.objects.filter(
+                product_id__in=product_ids,
+                resolution=resolution,
+                bucket_start=start,
+            )
+        }
+
+        created = []
+        for product_id, price, stock in samples:
+            rollup = existing.get(product_id)
+            if rollup is None:
+                rollup = _new_bucket(product_id, resolution, start, price, stock, now)
+                existing[product_id] = rollup
+                created.append(rollup)
+            _add_to_bucket(rollup, price, stock, now)
+
+        created_ids = {r.product_id for r in created}
+        PriceRollup.objects.bulk_update(
+            [r for pid, r in existing.items() if pid not in created_ids],
+            ROLLUP_FIELDS,
+        )
+        # 別ワーカーが同じバケットを先に作っていた場合はそちらを優先する
+        PriceRollup.objects.bulk_create(created, ignore_conflicts=True)
+
+
+# ======================================================
+# 既存の価格履歴からの作成（初回・作り直し用）
+# ======================================================
+def backfill_rollups(product_ids=None, chunk_size=2000):
+    """
+    価格履歴から時間足・日足を作り直す。戻り値: 作成したバケット数
+    商品ID・取得日時順に1回だけ流し読みし、chunk_size 件ごとに書き込む。
+    ハートビート（sample_count > 1）は最初の1回を checked_at、
+    残りを last_checked_at の区間に数える。
+    """
+    history = PriceHistory.objects.all()
+    if product_ids is not None:
+        history = history.filter(product_id__in=product_ids)
+
+    rows = history.order_by("product_id", "checked_at").values_list(
+        "product_id", "checked_at", "price", "stock_count",
+        "sample_count", "last_checked_at",
+    )
+
+    total = 0
+    pending = {}
+    current_product = None
+
+    def add(product_id, sampled_at, price, stock, count):
+        for resolution in RESOLUTIONS:
+            start = bucket_start(sampled_at, resolution)
+            key = (product_id, resolution, start)
+            rollup = pending.get(key)
+            if rollup is None:
+                rollup = _new_bucket(
+                    product_id, resolution, start, price, stock, sampled_at)
+                pending[key] = rollup
+            _add_to_bucket(rollup, price, stock, sampled_at, count)
+
+    for product_id, checked_at, price, stock, sample_count, last_checked_at in rows.iterator(
+        chunk_size=chunk_size
+    ):
+        # 商品の切れ目でのみ書き込む（1商品のバケットを分割しない）
+        if product_id != current_product:
+            if len(pending) >= chunk_size:
+                total += _write_backfill(pending)
+                pending = {}
+            current_product = product_id
+
+        add(product_id, checked_at, price, stock, 1)
+        if sample_count > 1:
+            add(product_id, last_checked_at or checked_at,
+                price, stock, sample_count - 1)
+
+    if pending:
+        total += _write_backfill(pending)
+    return total
+
+
+def _write_backfill(pending):
+    rollups = list(pending.values())
+    product_ids = {r.product_id for r in rollups}
+    with transaction.atomic():
+        PriceRollup.objects.filter(product_id__in=product_ids).delete()
+        PriceRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+# ======================================================
+# グラフ用データ（期間に応じて粒度を選び、点数を上限以内に収める）
+# ======================================================
+def _merge_points(points, max_points):
+    """
+    点数が上限を超える場合、連続する k 点を1点にまとめる。
+    point: (日時, 終値, 在庫数, 安値, 高値)
+    """
+    if len(points) <= max_points:
+        return points
+    k = math.ceil(len(points) / max_points)
+    merged = []
+    for i in range(0, len(points), k):
+        group = points[i:i + k]
+        merged.append((
+            group[0][0],
+            group[-1][1],
+            group[-1][2],
+            min(p[3] for p in group),
+            max(p[4] for p in group),
+        ))
+    return merged
+
+
+def _raw_points(raw):
+    """
+    生データの点。価格が変わらず確認が続いた行（ハートビート）は
+    最終確認日時（last_checked_at）にも同じ価格の点を置き、横ばいの期間を線で表す。
+    """
+    rows = raw.order_by("checked_at").values_list(
+        "checked_at", "price", "stock_count", "sample_count", "last_checked_at")
+    for checked_at, price, stock, sample_count, last_checked_at in rows.iterator():
+        yield (checked_at, price, stock, price, price)
+        if sample_count > 1 and last_checked_at and last_checked_at > checked_at:
+            yield (last_checked_at, price, stock, price, price)
+
+
+def get_chart_points(product_id, days=None, max_points=None, now=None):
+    """
+    グラフ用の価格推移を (粒度, points) で返す。
+    - 生データ（ハートビートの最終確認の点を含む）が上限以内ならそのまま（粒度 "raw"）
+    - 期間が上限時間以内なら時間足、それより長ければ日足
+    - それでも上限を超える場合は連続する点をまとめる
+    points: [(日時, 終値, 在庫数, 安値, 高値), ...]（昇順）
+    """
+    max_points = max_points or settings.CHART_MAX_POINTS
+    now = now or timezone.now()
+    since = now - timedelta(days=days) if days else None
+
+    raw = PriceHistory.objects.filter(product_id=product_id)
+    if since:
+        raw = raw.filter(checked_at__gte=since)
+
+    counts = raw.aggregate(
+        rows=Count("id"),
+        heartbeats=Count("id", filter=Q(
+            sample_count__gt=1, last_checked_at__gt=F("checked_at"))),
+    )
+    if counts["rows"] + counts["heartbeats"] <= max_points:
+        return "raw", list(_raw_points(raw))
+
+    first = since or raw.order_by("checked_at").values_list(
+        "checked_at", flat=True).first()
+    span_hours = (now - first).total_seconds() / 3600
+    resolution = (
+        PriceRollup.RESOLUTION_HOUR if span_hours <= max_points
+        else PriceRollup.RESOLUTION_DAY
+    )
+
+    rollups = PriceRollup.objects.filter(
+        product_id=product_id, resolution=resolution)
+    if since:
+        rollups = rollups.filter(bucket_start__gte=bucket_start(since, resolution))
+    points = list(
+        rollups.order_by("bucket_start").values_list(
+            "bucket_start", "close_price", "close_stock", "low_price", "high_price")
+    )
+
+    # ロールアップ未作成（backfill 前）の場合は生データを間引いて返す
+    if not points:
+        points = list(_raw_points(raw))
+        resolution = "raw"
+
+    return resolution, _merge_points(points, max_points)
+
+
+def format_point_date(dt, resolution):
+    """グラフのラベル（日足は日付のみ、それ以外は時刻まで）"""
+    local = timezone.localtime(dt)
+    if resolution == PriceRollup.RESOLUTION_DAY:
+        return local.strftime("%Y-%m-%d")
+    return local.strftime("%Y-%m-%d %H:%M")
+
+
+def parse_days(value):
+    """?days= の値（未指定・不正値は None ＝ 全期間）"""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return None
+    return days if days > 0 else None
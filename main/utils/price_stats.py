@@ -0,0 +1,196 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\price_stats.py
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import DecimalField, F, Max, Min, Sum
+from django.utils import timezone
+
+from main.models import PriceHistory, ProductPriceStats
+
+
+# ======================================================
+# 価格統計の差分更新
+# ======================================================
+def load_stats(product_ids):
+    """商品IDリストの価格統計をまとめて取得 → {product_id: ProductPriceStats}"""
+    return {
+        stats.product_id: stats
+        for stats in ProductPriceStats.objects.filter(product_id__in=product_ids)
+    }
+
+
+def apply_sample(stats, price, changed, now):
+    """
+    1回分の価格取得を統計に加算する（保存はしない）。
+    changed: 前回から価格・在庫が変わったか
+    """
+    price = Decimal(price)
+
+    if stats.min_price is None or price < stats.min_price:
+        stats.min_price = price
+    if stats.max_price is None or price > stats.max_price:
+        stats.max_price = price
+    if changed or stats.last_changed_at is None:
+        stats.last_changed_at = now
+    stats.last_price = price
+
+    for days in ProductPriceStats.WINDOWS:
+        setattr(stats, f"sum_{days}d", getattr(stats, f"sum_{days}d") + price)
+        setattr(stats, f"count_{days}d", getattr(stats, f"count_{days}d") + 1)
+    return stats
+
+
+STATS_FIELDS = [
+    "min_price", "max_price", "last_price", "last_changed_at",
+    "sum_7d", "count_7d", "sum_30d", "count_30d", "sum_90d", "count_90d",
+    "updated_at",
+]
+
+
+def record_samples(samples, stats_map=None, now=None):
+    """
+    価格取得結果をまとめて統計に反映する。
+    samples: [(product_id, price, changed), ...]
+    stats_map: load_stats() 済みならそれを渡す（クエリ削減）
+    """
+    if not samples:
+        return {}
+
+    now = now or timezone.now()
+    if stats_map is None:
+        stats_map = load_stats([product_id for product_id, _, _ in samples])
+
+    created = []
+    for product_id, price, changed in samples:
+        stats = stats_map.get(product_id)
+        if stats is None:
+            stats = ProductPriceStats(product_id=product_id)
+            stats_map[product_id] = stats
+            created.append(stats)
+        apply_sample(stats, price, changed, now)
+        stats.updated_at = now
+
+    created_ids = {s.product_id for s in created}
+    ProductPriceStats.objects.bulk_create(created)
+    ProductPriceStats.objects.bulk_update(
+        [s for pid, s in stats_map.items() if pid not in created_ids],
+        STATS_FIELDS,
+    )
+    return stats_map
+
+
+def get_stats(product):
+    """商品の価格統計（未作成なら None）"""
+    try:
+        return product.price_stats
+    except ProductPriceStats.DoesNotExist:
+        return None
+
+
+# ======================================================
+# 期間集計の再計算（日次）
+# ======================================================
+def rebuild_stats(product_ids=None, chunk_size=1000):
+    """
+    価格履歴から統計を作り直す。
+    ローリング期間（7/30/90日）から外れたサンプルを落とすため日次で実行する。
+    取得回数（sample_count）の分だけ同じ価格を数える。
+    戻り値: 更新した商品数
+    """
+    now = timezone.now()
+    history = PriceHistory.objects.all()
+    if product_ids is not None:
+        history = history.filter(product_id__in=product_ids)
+
+    totals = {
+        row["product_id"]: row
+        for row in history.values("product_id").annotate(
+            min_price=Min("price"),
+            max_price=Max("price"),
+            last_changed_at=Max("checked_at"),
+        )
+    }
+    if not totals:
+        return 0
+
+    windows = {}
+    for days in ProductPriceStats.WINDOWS:
+        since = now - timedelta(days=days)
+        windows[days] = {
+            row["product_id"]: row
+            for row in history.filter(checked_at__gte=since)
+            .values("product_id")
+            .annotate(
+                total=Sum(F("price") * F("sample_count"),
+                          output_field=DecimalField(max_digits=16, decimal_places=0)),
+                count=Sum("sample_count"),
+            )
+        }
+        _add_straddling_samples(windows[days], history, since)
+
+    last_prices = _last_prices(history)
+
+    rows = []
+    for product_id, total in totals.items():
+        stats = ProductPriceStats(
+            product_id=product_id,
+            min_price=total["min_price"],
+            max_price=total["max_price"],
+            last_price=last_prices.get(product_id),
+            last_changed_at=total["last_changed_at"],
+            rebuilt_at=now,
+            updated_at=now,
+        )
+        for days in ProductPriceStats.WINDOWS:
+            row = windows[days].get(product_id)
+            setattr(stats, f"sum_{days}d", (row and row["total"]) or 0)
+            setattr(stats, f"count_{days}d", (row and row["count"]) or 0)
+        rows.append(stats)
+
+    # MySQL の ON DUPLICATE KEY UPDATE は対象の列を指定できない（指定すると NotSupportedError）
+    conflict_target = (
+        {"unique_fields": ["product"]}
+        if connection.features.supports_update_conflicts_with_target else {}
+    )
+    ProductPriceStats.objects.bulk_create(
+        rows,
+        batch_size=chunk_size,
+        update_conflicts=True,
+        update_fields=STATS_FIELDS + ["rebuilt_at"],
+        **conflict_target,
+    )
+    return len(rows)
+
+
+def _add_straddling_samples(window, history, since):
+    """
+    期間の開始をまたぐ履歴行（期間前に記録され、期間内も価格が変わらず確認され続けた行）の
+    取得回数のうち、期間内の分を window に加える。
+    取得は checked_at〜last_checked_at にほぼ等間隔とみなして按分する。
+    期間の開始時点で有効な行は商品ごとに最大1行のため、読み込む行数は商品数以下。
+    """
+    straddling = history.filter(
+        checked_at__lt=since, last_checked_at__gte=since,
+    ).values_list("product_id", "price", "sample_count", "checked_at", "last_checked_at")
+
+    for product_id, price, sample_count, checked_at, last_checked_at in straddling:
+        ratio = (last_checked_at - since) / (last_checked_at - checked_at)
+        # 最終確認（last_checked_at）は必ず期間内なので最低1回
+        count = max(1, round(sample_count * ratio))
+        row = window.setdefault(product_id, {"total": 0, "count": 0})
+        row["total"] = (row["total"] or 0) + price * count
+        row["count"] = (row["count"] or 0) + count
+
+
+def _last_prices(history):
+    """商品ごとの直近の価格 → {product_id: price}（古い順に上書きして最後の値を残す）"""
+    latest = history.values("product_id").annotate(latest=Max("checked_at"))
+    result = {}
+    for product_id, price in (
+        history.filter(checked_at__in=latest.values("latest"))
+        .order_by("checked_at")
+        .values_list("product_id", "price")
+    ):
+        result[product_id] = price
+    return result
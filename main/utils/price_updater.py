@@ -0,0 +1,328 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\price_updater.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from main.models import NotificationEvent, PriceHistory, Product
+from main.utils.flag_checker import evaluate_flag
+from main.utils.notify_events import build_restock_event
+from main.utils.poll_scheduler import schedule_error_retries, schedule_next_checks
+from main.utils.price_rollup import record_rollups
+from main.utils.price_stats import load_stats, record_samples
+from main.utils.product_list_cache import bump_list_version
+from main.utils.rakuten_api import fetch_rakuten_item, parse_item_code
+from main.utils.unread_counter import record_new_events
+
+
+# ======================================================
+# レート制限（トークンバケット）
+# ======================================================
+class TokenBucket:
+    """
+    全ワーカーで共有するトークンバケット。
+    rate: 1秒あたりに補充されるトークン数（＝許可するリクエスト数）
+    capacity: 瞬間的に許可するリクエスト数の上限
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate は正の値で指定してください")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得できるまで待機する"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate,
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# ======================================================
+# 在庫テキスト → 数値
+# ======================================================
+def parse_stock_status(stock_status):
+    """在庫状態のテキストを数値に変換"""
+    stock_status = str(stock_status).lower()
+
+    if "売り切れ" in stock_status or "在庫なし" in stock_status:
+        return 0
+    elif "わずか" in stock_status or "残り少" in stock_status:
+        return 2
+    elif "在庫あり" in stock_status:
+        return 10
+    else:
+        return 5  # デフォルト
+
+
+def is_test_product(product):
+    """テストデータ（example.com 等）かどうか"""
+    url = product.product_url or ""
+    return "example.com" in url or "test" in url.lower()
+
+
+# ======================================================
+# 並列取得エンジン
+# ======================================================
+def _fetch_with_limit(bucket, url):
+    """
+    ワーカースレッド内の処理：レート制限を待ってから楽天APIを呼ぶ。
+    フォールバック検索や 429 の再送も含め、リクエストごとにトークンを取る。
+    fetch_rakuten_item はエラー時に ErrorLog を書くため、
+    スレッドごとのDB接続は処理後に閉じておく。
+    """
+    try:
+        return fetch_rakuten_item(url, acquire=bucket.acquire)
+    finally:
+        connection.close()
+
+
+def item_key(product):
+    """
+    重複取得をまとめるためのキー。
+    楽天URLなら "shopCode:itemCode"、解析できなければURLそのもの。
+    """
+    try:
+        return parse_item_code(product.product_url)
+    except ValueError:
+        return product.product_url
+
+
+def group_by_item(products):
+    """商品を item_key ごとにまとめる（ユーザーをまたいで同じ商品を1回だけ取得するため）"""
+    groups = {}
+    for product in products:
+        groups.setdefault(item_key(product), []).append(product)
+    return groups
+
+
+def fetch_concurrently(products, workers=None, rate=None):
+    """
+    商品リストを並列で楽天APIに問い合わせ、完了した順に (product, data) を返す。
+    - 同じ shopCode:itemCode の商品は1回だけ取得し、結果を全商品に配る
+    - workers: 同時実行スレッド数（既定: settings.PRICE_FETCH_WORKERS）
+    - rate:    1秒あたりのリクエスト上限（既定: settings.RAKUTEN_RATE_LIMIT_PER_SEC）
+    DB書き込みは呼び出し側（メインスレッド）で行う。
+    """
+    workers = workers or settings.PRICE_FETCH_WORKERS
+    rate = rate or settings.RAKUTEN_RATE_LIMIT_PER_SEC
+    bucket = TokenBucket(rate)
+    groups = group_by_item(products)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_fetch_with_limit, bucket, group[0].product_url): group
+            for group in groups.values()
+        }
+        for future in as_completed(futures):
+            try:
+                data = future.result()
+            except Exception as e:
+                data = {"error": str(e)}
+            for product in futures[future]:
+                yield product, data
+
+
+# ======================================================
+# 取得結果の反映（チャンク単位の一括書き込み）
+# ======================================================
+def is_unchanged(product, new_price, new_stock):
+    """前回保存した価格・在庫から変化がないか"""
+    return (
+        product.latest_price is not None
+        and product.latest_price == new_price
+        and product.latest_stock_count == new_stock
+    )
+
+
+def parse_fetch_result(data):
+    """
+    楽天APIの取得結果から (価格, 在庫数, エラーメッセージ) を取り出す。
+    エラー時は価格・在庫数が None。
+    """
+    if data.get("error"):
+        return None, None, f"API取得失敗: {data['error']}"
+
+    new_price = data.get("initial_price", 0)
+    new_stock = parse_stock_status(data.get("stock_status", "在庫あり"))
+
+    if not new_price or new_price == 0:
+        return None, None, "価格情報が取得できませんでした"
+
+    return new_price, new_stock, None
+
+
+def _latest_histories(product_ids):
+    """商品ごとの直近の PriceHistory を1クエリでまとめて取得 → {product_id: PriceHistory}"""
+    latest_id = PriceHistory.objects.filter(
+        product=OuterRef("pk")
+    ).order_by("-checked_at").values("id")[:1]
+
+    rows = PriceHistory.objects.filter(
+        id__in=Product.objects.all_with_deleted()
+        .filter(id__in=product_ids)
+        .annotate(latest_history_id=Subquery(latest_id))
+        .values("latest_history_id")
+    ).only("id", "product_id", "stock_count", "sample_count", "checked_at")
+
+    return {row.product_id: row for row in rows}
+
+
+class PriceBatchWriter:
+    """
+    取得結果をバッファし、chunk_size 件ごとに1トランザクションでまとめて書き込む。
+    - 直近の履歴（前回在庫）は1クエリで先読み
+    - PriceHistory は bulk_create、Product は bulk_update（flag_reached 含む）
+    - 変化なしの商品は直近履歴の取得回数を bulk_update
+    - 在庫復活イベントは bulk_create
+    - 価格統計（ProductPriceStats）・グラフ用ロールアップ（PriceRollup）に今回のサンプルを加算
+    - 全商品の次回チェック日時（next_check_at）を適応的に再計算
+    - 取得に失敗した商品は連続失敗回数に応じて次回チェックを延ばす（バックオフ）
+    add() / flush() は確定した (product, result) のリストを返す。
+    result: {"status": "ok" | "unchanged" | "error", "message", "price", "stock", "restocked"}
+    """
+
+    PRODUCT_FIELDS = ["latest_price", "latest_stock_count",
+                      "is_in_stock", "flag_reached", "next_check_at", "fetch_error_count"]
+    ERROR_FIELDS = ["fetch_error_count", "next_check_at"]
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.PRICE_WRITE_CHUNK_SIZE
+        self._buffer = []
+        self._errors = []
+
+    def add(self, product, data):
+        new_price, new_stock, error = parse_fetch_result(data)
+        if error:
+            # 失敗した商品も次回チェックを延ばす（flush でまとめて保存）
+            self._errors.append(product)
+            return [(product, {"status": "error", "message": error})]
+
+        self._buffer.append((product, new_price, new_stock))
+        if len(self._buffer) >= self.chunk_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        now = timezone.now()
+        self._flush_errors(now)
+        if not self._buffer:
+            return []
+
+        buffer, self._buffer = self._buffer, []
+        results = []
+
+        new_histories = []
+        heartbeats = []
+        restock_events = []
+        last_changed = {}
+        samples = []
+        list_changed_users = set()
+
+        with transaction.atomic():
+            product_ids = [p.id for p, _, _ in buffer]
+            latest = _latest_histories(product_ids)
+            stats_map = load_stats(product_ids)
+
+            for product, new_price, new_stock in buffer:
+                previous_history = latest.get(product.id)
+                previous_stock = previous_history.stock_count if previous_history else 0
+
+                # ✅ 変化なし：履歴行を増やさず、直近行にハートビートを記録
+                if previous_history and is_unchanged(product, new_price, new_stock):
+                    last_changed[product.id] = previous_history.checked_at
+                    previous_history.sample_count += 1
+                    previous_history.last_checked_at = now
+                    heartbeats.append(previous_history)
+                    samples.append((product.id, new_price, False))
+                    results.append((product, {
+                        "status": "unchanged",
+                        "price": new_price,
+                        "stock": new_stock,
+                        "restocked": False,
+                    }))
+                    continue
+
+                new_histories.append(PriceHistory(
+                    product=product,
+                    price=new_price,
+                    stock_count=new_stock,
+                    checked_at=now,
+                    last_checked_at=now,
+                ))
+
+                # 一覧の絞り込み・並び順に使う値が変わった場合だけ一覧キャッシュを無効にする
+                if (product.latest_price, product.latest_stock_count, product.is_in_stock) != (
+                        new_price, new_stock, new_stock > 0):
+                    list_changed_users.add(product.user_id)
+
+                # 最新価格・在庫・買い時フラグを更新
+                product.latest_price = new_price
+                product.latest_stock_count = new_stock
+                product.is_in_stock = new_stock > 0
+                # 最安値フラグは今回の値を加える前の最安値と比べる
+                stats = stats_map.get(product.id)
+                product.flag_reached = evaluate_flag(
+                    product, lowest_price=stats.min_price if stats else None)
+                last_changed[product.id] = now
+                samples.append((product.id, new_price, True))
+
+                # 在庫復活通知（優先度「高」のみ）
+                restocked = product.priority == "高" and previous_stock == 0 and new_stock > 0
+                if restocked:
+                    restock_events.append(
+                        build_restock_event(product, product.user))
+
+                results.append((product, {
+                    "status": "ok",
+                    "price": new_price,
+                    "stock": new_stock,
+                    "restocked": restocked,
+                }))
+
+            products = [p for p, _, _ in buffer]
+            schedule_next_checks(products, last_changed=last_changed, now=now)
+            for product in products:
+                product.fetch_error_count = 0
+
+            PriceHistory.objects.bulk_create(new_histories)
+            Product.objects.bulk_update(products, self.PRODUCT_FIELDS)
+            PriceHistory.objects.bulk_update(
+                heartbeats, ["sample_count", "last_checked_at"])
+            record_new_events(NotificationEvent.objects.bulk_create(restock_events))
+            record_samples(samples, stats_map=stats_map, now=now)
+            record_rollups(
+                [(p.id, price, stock) for p, price, stock in buffer], now=now)
+
+            # 最新価格・在庫が変わった商品の所有ユーザーだけ一覧キャッシュを無効にする（コミット後）
+            bump_list_version(list_changed_users)
+
+        return results
+
+    def _flush_errors(self, now):
+        """取得に失敗した商品の連続失敗回数と次回チェック日時（バックオフ）を保存"""
+        if not self._errors:
+            return
+        errors, self._errors = self._errors, []
+        schedule_error_retries(errors, now=now)
+        Product.objects.bulk_update(errors, self.ERROR_FIELDS)
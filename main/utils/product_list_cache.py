@@ -0,0 +1,103 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\product_list_cache.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# ======================================================
+# 商品一覧の結果キャッシュ（ユーザーごとの版番号で無効化）
+# ======================================================
+# - 一覧の結果（絞り込み条件 → そのページの商品IDの並び＋ページ情報）と
+#   サイドバーのカテゴリ一覧をキャッシュする
+# - キーにはユーザーごとの版番号（と共通カテゴリ用の全体の版番号）を含める。
+#   商品・カテゴリが変わったら版番号を上げるだけで、古いキーは参照されなくなり期限で消える
+# - 商品の中身（価格・在庫など）はキャッシュせず、表示のたびに ID で読み直す
+GLOBAL_SCOPE = "global"
+
+# 一覧の絞り込み・並び順・表示に使う項目。これ以外だけの保存では版番号を上げない
+LIST_FIELDS = frozenset({
+    "user", "user_id", "product_name", "shop_name", "is_deleted", "created_at",
+    "latest_price", "initial_price", "latest_stock_count", "is_in_stock", "priority",
+})
+
+
+def _version_key(scope):
+    return f"product_list_version:{scope}"
+
+
+def _versions(user_id):
+    """(ユーザーの版番号, 全体の版番号)。未設定なら現在時刻から作る"""
+    keys = [_version_key(user_id), _version_key(GLOBAL_SCOPE)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # 期限切れ・追い出し後も過去の版番号と重ならないよう時刻を初期値にする
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return found[keys[0]], found[keys[1]]
+
+
+def _bump(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        # 未設定なら次回の読み出しで新しい版番号が作られる
+        pass
+
+
+def bump_list_version(user_ids):
+    """
+    ユーザーの一覧キャッシュを無効にする。
+    トランザクション内で呼ばれた場合はコミット後に反映する
+    （コミット前の状態が新しい版番号でキャッシュされないように）。
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def apply():
+        for user_id in user_ids:
+            _bump(user_id)
+
+    transaction.on_commit(apply)
+
+
+def bump_global_version():
+    """全ユーザーの一覧キャッシュを無効にする（共通カテゴリの変更時）"""
+    transaction.on_commit(lambda: _bump(GLOBAL_SCOPE))
+
+
+def _params_digest(params):
+    items = sorted((key, value) for key in params for value in params.getlist(key))
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+def cache_keys(user_id, params):
+    """(一覧結果のキー, サイドバーのキー)。一覧結果は絞り込み条件（GETパラメータ）ごと"""
+    user_version, global_version = _versions(user_id)
+    prefix = f"{user_id}:{user_version}:{global_version}"
+    return (
+        f"product_list:{prefix}:{_params_digest(params)}",
+        f"product_list_sidebar:{prefix}",
+    )
+
+
+def is_enabled():
+    """PRODUCT_LIST_CACHE_SECONDS が 0 ならキャッシュしない（共有キャッシュが無い構成）"""
+    return settings.PRODUCT_LIST_CACHE_SECONDS > 0
+
+
+def get_cached(*keys):
+    """キーごとのキャッシュ値（無ければ None）"""
+    if not is_enabled():
+        return [None] * len(keys)
+    found = cache.get_many(keys)
+    return [found.get(key) for key in keys]
+
+
+def set_cached(key, value):
+    if is_enabled():
+        cache.set(key, value, settings.PRODUCT_LIST_CACHE_SECONDS)
@@ -0,0 +1,127 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\product_search.py
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from main.models import Product, ProductSearchGram, ProductSearchText
+
+
+# ======================================================
+# 正規化と n-gram 生成
+# ======================================================
+def normalize(text):
+    """全角英数・半角カナ・大文字小文字の違いをなくし、連続する空白を1つにする"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def make_grams(text):
+    """
+    正規化済みの文字列 → 2文字ずつの gram の集合。
+    1文字のキーワードも前方一致で引けるよう、末尾の1文字も1件として含める。
+    """
+    if not text:
+        return set()
+    grams = {text[i:i + 2] for i in range(len(text) - 1)}
+    grams.add(text[-1])
+    return grams
+
+
+def _product_grams(product):
+    rows = []
+    for field, value in (
+        (ProductSearchGram.FIELD_PRODUCT_NAME, product.product_name),
+        (ProductSearchGram.FIELD_SHOP_NAME, product.shop_name),
+    ):
+        for gram in make_grams(normalize(value)):
+            rows.append(ProductSearchGram(product_id=product.id, field=field, gram=gram))
+    return rows
+
+
+# ======================================================
+# 索引の更新
+# ======================================================
+def _product_text(product):
+    return ProductSearchText(
+        product_id=product.id,
+        product_name=normalize(product.product_name),
+        shop_name=normalize(product.shop_name),
+    )
+
+
+def index_products(products):
+    """商品の索引（gram・正規化済み文字列）を作り直す（既存分を削除して一括登録）"""
+    products = list(products)
+    if not products:
+        return 0
+    product_ids = [p.id for p in products]
+    rows = [row for product in products for row in _product_grams(product)]
+    with transaction.atomic():
+        ProductSearchGram.objects.filter(product_id__in=product_ids).delete()
+        # 照合順序によっては別の文字が同じ gram とみなされるため、重複は無視する
+        ProductSearchGram.objects.bulk_create(rows, ignore_conflicts=True)
+        ProductSearchText.objects.filter(product_id__in=product_ids).delete()
+        ProductSearchText.objects.bulk_create([_product_text(p) for p in products])
+    return len(rows)
+
+
+def rebuild_index(chunk_size=1000):
+    """全商品（論理削除分を含む）の索引を主キー順に作り直す。戻り値: 商品数"""
+    queryset = (
+        Product.objects.all_with_deleted()
+        .only("id", "product_name", "shop_name")
+        .order_by("id")
+    )
+    total = 0
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return total
+        last_id = chunk[-1].id
+        index_products(chunk)
+        total += len(chunk)
+
+
+# ======================================================
+# 検索
+# ======================================================
+def search_product_ids(keyword, queryset=None):
+    """
+    商品名またはショップ名に keyword を含む商品IDのクエリセット（id__in のサブクエリに使う）。
+    1. 索引から keyword の gram をすべて持つ（商品, 項目）に絞り込む
+    2. 候補の正規化済み文字列が keyword を含むかを確認する（gram の並び順の確認）
+    どちらも SQL 内で行い、候補の ID を Python に読み込まない。
+    queryset を渡すとその範囲の商品だけを対象にする。
+    """
+    keyword = normalize(keyword)
+    if not keyword:
+        return ProductSearchText.objects.none().values_list("product_id", flat=True)
+
+    grams = ProductSearchGram.objects.all()
+    if queryset is not None:
+        grams = grams.filter(product_id__in=queryset.order_by().values("id"))
+
+    if len(keyword) == 1:
+        # 1文字は gram の前方一致だけで確定する（確認は不要）
+        return grams.filter(gram__startswith=keyword).values_list(
+            "product_id", flat=True).distinct()
+
+    keyword_grams = make_grams(keyword)
+    keyword_grams.discard(keyword[-1])  # 末尾1文字は2文字の gram に含まれる
+    candidates = (
+        grams.filter(gram__in=keyword_grams)
+        .values("product_id", "field")
+        .annotate(matched=Count("gram"))
+        .filter(matched=len(keyword_grams))
+        .values("product_id")
+    )
+    return ProductSearchText.objects.filter(
+        Q(product_name__contains=keyword) | Q(shop_name__contains=keyword),
+        product_id__in=candidates,
+    ).values_list("product_id", flat=True)
+
+
+def filter_by_keyword(queryset, keyword):
+    """クエリセットをキーワード（商品名・ショップ名）で絞り込む"""
+    return queryset.filter(id__in=search_product_ids(keyword, queryset))
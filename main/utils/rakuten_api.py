@@ -1,44 +1,51 @@
 # 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\rakuten_api.py
-import requests
 from urllib.parse import urlparse
 from main.utils.error_logger import log_error
+from main.utils.rakuten_client import search_items
 
 
-def fetch_rakuten_item(url: str):
+def parse_item_code(url: str) -> str:
+    """
+    楽天商品URLを "shopCode:itemCode" 形式に正規化する
+    例: https://item.rakuten.co.jp/darkangel/tp2308-3754v2/ → "darkangel:tp2308-3754v2"
+    解析できない場合は ValueError
+    """
+    parsed = urlparse(url)
+    if not parsed.netloc.endswith("rakuten.co.jp"):
+        raise ValueError("楽天市場のURLではありません")
+
+    path_parts = parsed.path.strip("/").split("/")
+    if len(path_parts) < 2:
+        raise ValueError("URL形式が不正です（shopCode, itemCode 解析不可）")
+
+    shop_code = path_parts[1] if path_parts[0] == "item.rakuten.co.jp" else path_parts[0]
+    item_code = path_parts[1]
+    return f"{shop_code}:{item_code}"
+
+
+def fetch_rakuten_item(url: str, acquire=None):
     """
     楽天商品URLから商品情報を取得
     - URL解析 → ショップコード・商品コード抽出
     - 楽天APIで検索
     - 商品名・価格・画像URLなどを返却
+    - acquire: APIを呼ぶたびに通すレート制限（search_items に渡す）
     """
     print(f"[View] Fetching Rakuten item for URL: {url}")
     try:
-        parsed = urlparse(url)
-        if not parsed.netloc.endswith("rakuten.co.jp"):
-            raise ValueError("楽天市場のURLではありません")
-
         # --- URLからshopCode / itemCode抽出 ---
-        # 例: https://item.rakuten.co.jp/darkangel/tp2308-3754v2/
-        path_parts = parsed.path.strip("/").split("/")
-        if len(path_parts) < 2:
-            raise ValueError("URL形式が不正です（shopCode, itemCode 解析不可）")
-
-        shop_code = path_parts[1] if path_parts[0] == "item.rakuten.co.jp" else path_parts[0]
-        item_code = path_parts[1]
-        full_code = f"{shop_code}:{item_code}"
+        full_code = parse_item_code(url)
+        item_code = full_code.split(":", 1)[1]
 
         print(f"[RakutenAPI] Try itemCode: {full_code}")
 
-        # --- APIリクエスト ---
-        endpoint = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
+        # --- APIリクエスト（共通クライアント：keep-alive・タイムアウト・リトライ） ---
         params = {
-            "applicationId": "1016082687225252652",  # 公開用テストアプリID
             "itemCode": full_code,
-            "format": "json",
             "hits": 1,
         }
 
-        res = requests.get(endpoint, params=params)
+        res = search_items(params, acquire=acquire)
         data = res.json()
 
         # --- API異常応答 ---
@@ -48,12 +55,10 @@ def fetch_rakuten_item(url: str):
 
             # --- Fallback: itemNameから検索 ---
             params_fallback = {
-                "applicationId": "1016082687225252652",
                 "keyword": item_code,
-                "format": "json",
                 "hits": 1,
             }
-            res = requests.get(endpoint, params=params_fallback)
+            res = search_items(params_fallback, acquire=acquire)
             data = res.json()
 
             if res.status_code != 200 or "Items" not in data or len(data["Items"]) == 0:
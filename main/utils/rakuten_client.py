@@ -0,0 +1,105 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\rakuten_client.py
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+
+# ======================================================
+# 楽天API 共通クライアント
+# ======================================================
+# - requests.Session を使い回して TCP/TLS 接続を keep-alive で再利用する
+# - 接続／読み込みタイムアウトを必ず指定する
+# - 5xx はバックオフ付きで自動リトライ（urllib3 の Retry）
+# - 429 は urllib3 に任せず search_items 側でリトライする。
+#   Retry-After を待ったうえで、呼び出し側のレート制限（acquire）を取り直してから再送する
+# - gzip 圧縮レスポンスを要求する
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+RATE_LIMITED_STATUS = 429
+MAX_RETRY_AFTER_SECONDS = 60  # Retry-After が極端に長くてもワーカーを止めすぎない
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.RAKUTEN_MAX_RETRIES,
+        backoff_factor=settings.RAKUTEN_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # 最終レスポンスは呼び出し側で判定する
+    )
+    # バッチの同時実行数ぶんは接続をプールしておく
+    pool_size = max(settings.PRICE_FETCH_WORKERS, 10)
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "User-Agent": "KaidokiDesse/1.0",
+    })
+    return session
+
+
+def get_session():
+    """プロセス内で共有する Session を返す（初回のみ生成）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_timeout():
+    """(接続タイムアウト, 読み込みタイムアウト)"""
+    return (settings.RAKUTEN_CONNECT_TIMEOUT, settings.RAKUTEN_READ_TIMEOUT)
+
+
+def _retry_after_seconds(response, attempt):
+    """429 の待ち時間。Retry-After（秒）があれば優先し、無ければ指数バックオフ"""
+    try:
+        seconds = float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        seconds = settings.RAKUTEN_BACKOFF_FACTOR * (2 ** attempt)
+    return max(0, min(seconds, MAX_RETRY_AFTER_SECONDS))
+
+
+def search_items(params, timeout=None, acquire=None):
+    """
+    楽天市場商品検索APIを呼び出し、Response を返す。
+    applicationId / format が未指定なら settings の値を補完する。
+    ステータスコードの判定は呼び出し側で行う（リトライ後の最終レスポンス）。
+    - acquire: 送信のたびに呼ぶレート制限の待ち関数（例: TokenBucket.acquire）。
+      429 のリトライも毎回ここを通すので、再送がレート制限の外に出ない
+    """
+    query = {
+        "applicationId": settings.RAKUTEN_APP_ID,
+        "format": "json",
+    }
+    query.update(params)
+
+    for attempt in range(settings.RAKUTEN_MAX_RETRIES + 1):
+        if acquire:
+            acquire()
+        response = get_session().get(
+            settings.RAKUTEN_BASE_URL,
+            params=query,
+            timeout=timeout or get_timeout(),
+        )
+        if response.status_code != RATE_LIMITED_STATUS or attempt == settings.RAKUTEN_MAX_RETRIES:
+            return response
+        time.sleep(_retry_after_seconds(response, attempt))
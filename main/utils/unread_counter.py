@@ -0,0 +1,126 @@
+# 実行ディレクトリ: I:\school\kaidoki-desse\main\utils\unread_counter.py
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from main.models import NotificationEvent
+from main.utils.notification_hub import publish_to_user
+
+
+# ======================================================
+# 未読通知数のキャッシュ（ベルアイコンのポーリング用）
+# ======================================================
+# - 読み出しはキャッシュのみ。キャッシュに無いときだけ COUNT を実行して保存する
+# - 通知の作成で増やし、既読化・削除で減らす
+# - 有効期限（UNREAD_COUNT_CACHE_SECONDS）で切れたら数え直すため、
+#   増減の取りこぼしがあっても期限内に実件数へ戻る
+# - 有効期限が 0（共有キャッシュが無い構成）なら毎回 COUNT する
+def _key(user_id):
+    return f"unread_count:{user_id}"
+
+
+def is_enabled():
+    """UNREAD_COUNT_CACHE_SECONDS が 0 ならキャッシュしない"""
+    return settings.UNREAD_COUNT_CACHE_SECONDS > 0
+
+
+def count_unread(user_id):
+    """DB上の未読件数（キャッシュを通さない）"""
+    return NotificationEvent.objects.filter(user_id=user_id, is_read=False).count()
+
+
+def get_unread_count(user_id):
+    """未読件数（キャッシュに無ければ数えて保存）"""
+    if not is_enabled():
+        return count_unread(user_id)
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = count_unread(user_id)
+        # 同時に増減が入った場合はそちらを優先する（add は未設定時のみ保存）
+        cache.add(_key(user_id), count, settings.UNREAD_COUNT_CACHE_SECONDS)
+    return count
+
+
+def adjust_unread_count(user_id, delta):
+    """
+    未読件数を delta だけ増減し、接続中のタブへ新しい件数を送る。
+    キャッシュに無いユーザーは数え直さず、件数なし（null）を送る
+    （受け取ったタブが必要なときだけ API で取り直す）。
+    """
+    if not delta:
+        return
+    value = None
+    if is_enabled():
+        try:
+            value = cache.incr(_key(user_id), delta)
+        except ValueError:
+            pass
+    if value is not None and value < 0:
+        # 取りこぼしで負になった場合は捨てて数え直させる
+        cache.delete(_key(user_id))
+        value = None
+    publish_to_user(user_id, {"type": "unread", "unread_count": value})
+
+
+def record_new_events(events):
+    """
+    作成した通知イベント（bulk_create の戻り値など）の分だけ未読件数を増やし、
+    接続中のタブへ通知内容を送る。
+    トランザクション内で呼ばれた場合はコミット後に反映する。
+    """
+    events = [event for event in events if not event.is_read]
+    if not events:
+        return
+    counts = Counter(event.user_id for event in events)
+
+    def apply():
+        for event in events:
+            payload = {
+                "type": "notification",
+                "event_type": event.event_type,
+                "message": event.message,
+                "product_id": event.product_id,
+            }
+            # bulk_create の戻り値は DB によって（MySQL など）主キーが入らない
+            if event.id is not None:
+                payload["id"] = event.id
+            publish_to_user(event.user_id, payload)
+        for user_id, delta in counts.items():
+            adjust_unread_count(user_id, delta)
+
+    transaction.on_commit(apply)
+
+
+def reconcile_unread_counts(chunk_size=2000):
+    """
+    全ユーザーの未読件数を実件数で上書きする（一括既読などの後・定期実行用）。
+    ユーザーを chunk_size 人ずつに分け、件数は GROUP BY 1クエリで数える。
+    戻り値: 処理したユーザー数
+    """
+    if not is_enabled():
+        return 0
+    User = get_user_model()
+    user_ids = User.objects.order_by("id").values_list("id", flat=True)
+    total = 0
+    last_id = 0
+    while True:
+        chunk = list(user_ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return total
+        last_id = chunk[-1]
+
+        counts = dict(
+            NotificationEvent.objects.filter(user_id__in=chunk, is_read=False)
+            .order_by()
+            .values_list("user_id")
+            .annotate(n=Count("id"))
+        )
+        cache.set_many(
+            {_key(user_id): counts.get(user_id, 0) for user_id in chunk},
+            settings.UNREAD_COUNT_CACHE_SECONDS,
+        )
+        total += len(chunk)
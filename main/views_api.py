@@ -9,9 +9,10 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 import requests
 import re
-import time
 from main.utils.error_logger import log_error
-from main.models import Product, Category, PriceHistory
+from main.utils.rakuten_client import search_items
+from main.utils.price_rollup import format_point_date, get_chart_points, parse_days
+from main.models import Product, Category
 
 
 # ======================================================
@@ -41,20 +42,14 @@ def fetch_rakuten_item(request):
 
         shop_code, item_code = parts[-2], parts[-1]
         item_code = re.sub(r"[\?#/].*$", "", item_code).strip()
-        endpoint = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
 
+        # 429 / 5xx のリトライは共通クライアント側で行う
         params = {
             "applicationId": app_id,
             "hits": 1,
             "itemCode": f"{shop_code}:{item_code}",
         }
-
-        for retry in range(3):
-            res = requests.get(endpoint, params=params, timeout=5)
-            if res.status_code == 429:
-                time.sleep(1.5)
-                continue
-            break
+        res = search_items(params)
 
         if res.status_code == 400 or not res.ok:
             params = {
@@ -63,12 +58,7 @@ def fetch_rakuten_item(request):
                 "shopCode": shop_code,
                 "keyword": item_code,
             }
-            for retry in range(3):
-                res = requests.get(endpoint, params=params, timeout=5)
-                if res.status_code == 429:
-                    time.sleep(1.5)
-                    continue
-                break
+            res = search_items(params)
 
         res.raise_for_status()
         data = res.json()
@@ -167,19 +157,20 @@ class ProductPriceHistoryView(APIView):
 
     def get(self, request, product_id):
         try:
-            # 指定商品の価格履歴を昇順で取得
-            history_qs = PriceHistory.objects.filter(
-                product_id=product_id
-            ).order_by("checked_at")
+            # 指定商品の価格履歴を昇順で取得（?days= の期間に応じて時間足・日足にまとめる）
+            resolution, points = get_chart_points(
+                product_id, days=parse_days(request.query_params.get("days")))
 
             data = [
                 {
-                    "date": h.checked_at.strftime("%Y-%m-%d"),
-                    "price": float(h.price) if h.price is not None else None,
-                    "stock_count": min(int(h.stock_count or 0), 10)
-                    if h.stock_count is not None else None,
+                    "date": format_point_date(checked_at, resolution),
+                    "price": float(price) if price is not None else None,
+                    "low": float(low) if low is not None else None,
+                    "high": float(high) if high is not None else None,
+                    "stock_count": min(int(stock_count or 0), 10)
+                    if stock_count is not None else None,
                 }
-                for h in history_qs
+                for checked_at, price, stock_count, low, high in points
             ]
 
             return Response(data)
@@ -6,11 +6,13 @@ from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count
+from django.db.models import Case, CharField, Count, F, Value, When, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from datetime import timedelta
 
 from .models import Product, PriceHistory, NotificationEvent, UserNotificationSetting
+from .utils.unread_counter import adjust_unread_count, get_unread_count
 
 
 # ======================================================
@@ -31,9 +33,7 @@ def dashboard_view(request):
     )
 
     # --- 通知未送信・送信済み数 ---
-    unread_count = NotificationEvent.objects.filter(
-        user=user, is_read=False
-    ).count()
+    unread_count = get_unread_count(user.id)
 
     sent_count = NotificationEvent.objects.filter(
         user=user, is_read=True
@@ -72,6 +72,11 @@ def dashboard_view(request):
 # ======================================================
 # 通知履歴一覧
 # ======================================================
+# 商品ごとの「最新の通知」はこの2種類を別々に数える
+BUY_TIME_EVENT_TYPES = ["threshold_hit", "discount_over", "lowest_price"]
+STOCK_EVENT_TYPES = ["stock_restore", "stock_few"]
+
+
 @login_required
 def notification_history(request):
     """通知履歴ページ（優先度「高」の商品のみ）"""
@@ -95,26 +100,26 @@ def notification_history(request):
         logs = logs.none()
 
     # ✅ 通知のまとめ方：商品ごとに最新の通知のみ（買い時通知と在庫通知は区別）
-    from django.db.models import OuterRef, Subquery, Q
-
-    # 買い時通知の最新
-    latest_buy_time = NotificationEvent.objects.filter(
-        product=OuterRef('product'),
-        event_type__in=["threshold_hit", "discount_over", "lowest_price"],
-        is_read=False
-    ).order_by('-occurred_at').values('id')[:1]
-
-    # 在庫通知の最新
-    latest_stock = NotificationEvent.objects.filter(
-        product=OuterRef('product'),
-        event_type__in=["stock_restore", "stock_few"],
-        is_read=False
-    ).order_by('-occurred_at').values('id')[:1]
-
-    # 最新の通知のみを取得
-    logs = logs.filter(
-        Q(id__in=Subquery(latest_buy_time)) | Q(id__in=Subquery(latest_stock))
-    ).order_by("-occurred_at")
+    #    ROW_NUMBER() OVER (PARTITION BY 商品, 通知の種類 ORDER BY 発生日時 DESC) = 1 の行だけを
+    #    1クエリで取得する（イベント件数が増えてもクエリ数は一定）
+    event_group = Case(
+        When(event_type__in=BUY_TIME_EVENT_TYPES, then=Value("buy_time")),
+        When(event_type__in=STOCK_EVENT_TYPES, then=Value("stock")),
+        output_field=CharField(),
+    )
+    logs = (
+        logs.filter(event_type__in=BUY_TIME_EVENT_TYPES + STOCK_EVENT_TYPES)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("product_id"), event_group],
+                order_by=[F("occurred_at").desc(), F("id").desc()],
+            )
+        )
+        .filter(rank=1)
+        .select_related("product")
+        .order_by("-occurred_at")
+    )
 
     products = Product.objects.filter(user=user)
 
@@ -133,8 +138,10 @@ def mark_notification_read(request, pk):
     """通知を既読にする"""
     try:
         notif = NotificationEvent.objects.get(pk=pk, user=request.user)
-        notif.is_read = True
-        notif.save()
+        if not notif.is_read:
+            changed = NotificationEvent.objects.filter(
+                pk=notif.pk, is_read=False).update(is_read=True)
+            adjust_unread_count(request.user.id, -changed)
         messages.success(request, "通知を既読にしました。")
     except NotificationEvent.DoesNotExist:
         messages.error(request, "指定された通知が存在しません。")
@@ -155,8 +162,9 @@ def notification_redirect(request, pk):
 
         # ✅ 削除ではなく既読化
         if not notif.is_read:
-            notif.is_read = True
-            notif.save(update_fields=["is_read"])
+            changed = NotificationEvent.objects.filter(
+                pk=notif.pk, is_read=False).update(is_read=True)
+            adjust_unread_count(request.user.id, -changed)
 
         # ✅ ユーザー側では既読を一覧に表示しないようにするため、
         #     notifications.html 側で「{% if not n.is_read %}」条件を使う
@@ -176,9 +184,7 @@ def notification_redirect(request, pk):
 @login_required
 def unread_notification_count(request):
     """未読通知件数を返すAPI"""
-    count = NotificationEvent.objects.filter(
-        user=request.user, is_read=False).count()
-    return JsonResponse({"unread_count": count})
+    return JsonResponse({"unread_count": get_unread_count(request.user.id)})
 
 
 # 一括既読APIを追加する関数
@@ -191,10 +197,12 @@ def mark_all_read_api(request):
         data = json.loads(request.body)
         notification_ids = data.get('notification_ids', [])
 
-        NotificationEvent.objects.filter(
+        changed = NotificationEvent.objects.filter(
             id__in=notification_ids,
-            user=request.user
+            user=request.user,
+            is_read=False,
         ).update(is_read=True)
+        adjust_unread_count(request.user.id, -changed)
 
         return JsonResponse({'success': True})
     return JsonResponse({'success': False}, status=400)
@@ -1,8 +1,16 @@
 # 実行ディレクトリ: I:\school\kaidoki-desse\main\views_notification.py
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from main.models import NotificationEvent
+from main.utils.notification_hub import format_sse, get_hub
+from main.utils.unread_counter import adjust_unread_count, get_unread_count
 
 
 # =============================
@@ -41,10 +49,11 @@ def notification_redirect(request, pk):
     notification = get_object_or_404(
         NotificationEvent, id=pk, user=request.user)
 
-    # ✅ 未読なら既読に変更
+    # ✅ 未読なら既読に変更（実際に変わった件数だけ未読数を減らす）
     if not notification.is_read:
-        notification.is_read = True
-        notification.save(update_fields=["is_read"])
+        changed = NotificationEvent.objects.filter(
+            pk=notification.pk, is_read=False).update(is_read=True)
+        adjust_unread_count(request.user.id, -changed)
 
     # 商品が紐づいていれば詳細ページへ
     product = notification.product
@@ -58,10 +67,10 @@ def notification_redirect(request, pk):
 @login_required
 def mark_notification_read(request, pk):
     """通知を既読にする"""
-    notification = get_object_or_404(
-        NotificationEvent, pk=pk, user=request.user)
-    notification.is_read = True
-    notification.save()
+    get_object_or_404(NotificationEvent, pk=pk, user=request.user)
+    changed = NotificationEvent.objects.filter(
+        pk=pk, is_read=False).update(is_read=True)
+    adjust_unread_count(request.user.id, -changed)
     return redirect("main:notifications")
 
 
@@ -70,15 +79,17 @@ def delete_notification(request, pk):
     """通知を削除する"""
     notification = get_object_or_404(
         NotificationEvent, pk=pk, user=request.user)
+    was_unread = not notification.is_read
     notification.delete()
+    if was_unread:
+        adjust_unread_count(request.user.id, -1)
     return redirect("main:notifications")
 
 
 @login_required
 def unread_count_api(request):
     """未読通知の数を返すAPI"""
-    count = NotificationEvent.objects.filter(
-        user=request.user, is_read=False).count()
+    count = get_unread_count(request.user.id)  # キャッシュ（無ければ1回だけ COUNT）
 
     # ✅ デバッグログ
     print(f"[DEBUG] unread_count_api called")
@@ -86,3 +97,54 @@ def unread_count_api(request):
     print(f"[DEBUG] Unread count: {count}")
 
     return JsonResponse({"unread_count": count})
+
+
+# =============================
+#  通知のプッシュ配信（Server-Sent Events）
+# =============================
+async def notification_stream(request):
+    """
+    未読件数・新着通知を SSE で送り続ける（ポーリングの代わり）。
+    - 接続直後に現在の未読件数を1回送る
+    - 以降はハブから届いた分だけ送る（event: unread / notification）
+    - 無通信が続く間は一定間隔でコメント行を送り、プロキシに切られないようにする
+    - 一定時間で接続を閉じる（EventSource が retry 後に自動で再接続する）
+    ASGI サーバーでのみ配信する。WSGI（runserver・gunicorn 等）では応答全体を
+    読み切ってから送るため、何も届かないまま1接続がワーカーを占有する。
+    その場合は 503 を返し、クライアント側をポーリングに切り替えさせる。
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "streaming unavailable", "fallback": "polling"}, status=503)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "login required"}, status=401)
+
+    heartbeat = settings.NOTIFY_STREAM_HEARTBEAT_SECONDS
+    max_seconds = settings.NOTIFY_STREAM_MAX_SECONDS
+
+    async def stream():
+        hub = get_hub()
+        subscriber = hub.subscribe(user.id)
+        _, queue = subscriber
+        try:
+            count = await sync_to_async(get_unread_count)(user.id)
+            yield "retry: 5000\n\n"
+            yield format_sse("unread", {"type": "unread", "unread_count": count})
+
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(payload.get("type", "unread"), payload, payload.get("id"))
+        finally:
+            hub.unsubscribe(user.id, subscriber)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx のバッファリングを無効化
+    return response
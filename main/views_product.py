@@ -7,7 +7,9 @@ from datetime import timedelta, datetime
 from django.db.models import Min, Max, F
 from django.shortcuts import render, get_object_or_404
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator
+from main.utils.pagination_helper import KeysetPage, keyset_paginate
+from main.utils.product_list_cache import cache_keys, get_cached, set_cached
+from main.utils.product_search import filter_by_keyword
 from django.db.models import Q, Prefetch
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -16,6 +18,8 @@ from main.forms import ProductForm
 from main.models import Product, Category, PriceHistory
 from main.utils.error_logger import log_error
 from main.utils.flag_checker import update_flag_status
+from main.utils.price_rollup import format_point_date, get_chart_points, parse_days
+from main.utils.price_stats import get_stats
 import decimal
 import json
 from django.http import JsonResponse
@@ -46,6 +50,133 @@ def _has_filter(keyword, selected_cats, stock, priority, sort):
 # ======================================================
 # 商品一覧
 # ======================================================
+def _build_product_page(request, user, keyword, selected_cats, stock, priority, sort):
+    """絞り込み・並び替え・ページ分割を実行する。戻り値: (page_obj, filter_tags)"""
+    # --- ベースクエリ ---
+    qs = Product.objects.filter(user=user).prefetch_related(
+        Prefetch("categories", queryset=Category.objects.all().order_by("id"))
+    )
+
+    # --- キーワード検索（n-gram 索引で絞り込み） ---
+    if keyword:
+        qs = filter_by_keyword(qs, keyword)
+
+    # --- カテゴリ絞り込み ---
+    if selected_cats:
+        try:
+            ids = [int(c) for c in selected_cats]
+            global_ids = [i - 100 for i in ids if i >= 100]  # 共通カテゴリ
+            user_ids = [i for i in ids if i < 100]           # 独自カテゴリ
+
+            q_filter = Q()
+
+            # 共通カテゴリを実際の Category に変換
+            if global_ids:
+                common_cats = Category.objects.filter(
+                    id__in=global_ids)
+                cat_names = [c.category_name for c in common_cats]
+                q_filter |= Q(
+                    categories__category_name__in=cat_names,
+                    categories__is_global=True,
+                    categories__user__isnull=True
+                )
+
+            # 独自カテゴリ（ユーザー紐づき）
+            if user_ids:
+                q_filter |= Q(
+                    categories__id__in=user_ids,
+                    categories__user=user,
+                    categories__is_global=False
+                )
+
+            if q_filter:
+                qs = qs.filter(q_filter).distinct()
+
+        except ValueError:
+            pass
+
+    # --- 在庫フィルタ ---
+    if stock == "low":
+        qs = qs.filter(latest_stock_count__lte=3, latest_stock_count__gt=0)
+    elif stock == "none":
+        qs = qs.filter(is_in_stock=False)
+
+    # --- 優先度フィルタ ---
+    if priority in ["高", "普通"]:
+        qs = qs.filter(priority=priority)
+
+    # --- 並び替え（ページ分割はこの並び順のキーセットで行う） ---
+    if sort == "newest":
+        ordering = ["-created_at"]
+    elif sort == "oldest":
+        ordering = ["created_at"]
+    elif sort == "price_asc":
+        ordering = ["latest_price", "initial_price"]
+    elif sort == "price_desc":
+        ordering = ["-latest_price", "-initial_price"]
+    else:
+        ordering = ["-created_at"]
+
+    # --- フィルタタグ生成 ---
+    filter_tags = []
+    if keyword:
+        filter_tags.append(
+            ("keyword", f"キーワード：{keyword}", "filter-tag-sort"))
+
+    if selected_cats:
+        try:
+            ids = [int(c) for c in selected_cats]
+            global_ids = [i - 100 for i in ids if i >= 100]
+            user_ids = [i for i in ids if i < 100]
+
+            category_cats = Category.objects.filter(
+                id__in=global_ids, is_global=True)
+            for c in category_cats:
+                filter_tags.append(
+                    ("cat", f"{c.category_name}", "filter-tag-common"))
+
+            user_cats = Category.objects.filter(id__in=user_ids, user=user)
+            for c in user_cats:
+                filter_tags.append(
+                    ("cat", f"{c.category_name}", "filter-tag-user"))
+        except ValueError:
+            pass
+
+    if stock in ["low", "none"]:
+        label = "わずか" if stock == "low" else "なし"
+        filter_tags.append(("stock", f"在庫：{label}", "filter-tag-stock"))
+
+    if priority in ["高", "普通"]:
+        filter_tags.append(
+            ("priority", f"優先度：{priority}", "filter-tag-priority"))
+
+    sort_labels = {
+        "newest": "新しい順",
+        "oldest": "古い順",
+        "price_asc": "価格が安い順",
+        "price_desc": "価格が高い順",
+    }
+
+    if sort in sort_labels:
+        filter_tags.append(
+            ("sort", f"並び順：{sort_labels[sort]}", "filter-tag-sort"))
+
+    # --- ページネーション（キーセット方式：OFFSET / COUNT(*) を使わない） ---
+    page_obj = keyset_paginate(request, qs, ordering, per_page=20)
+
+    return page_obj, filter_tags
+
+
+def _products_by_ids(user, ids):
+    """キャッシュした商品IDの並び順どおりに商品を読み直す（主キーの IN 1クエリ＋カテゴリ）"""
+    products = Product.objects.filter(user=user, id__in=ids).prefetch_related(
+        Prefetch("categories", queryset=Category.objects.all().order_by("id"))
+    )
+    by_id = {p.id: p for p in products}
+    # キャッシュ後に削除された商品は除く
+    return [by_id[i] for i in ids if i in by_id]
+
+
 @login_required
 def product_list(request: HttpRequest) -> HttpResponse:
     """商品一覧ページ"""
@@ -67,73 +198,34 @@ def product_list(request: HttpRequest) -> HttpResponse:
         priority = request.GET.get("priority", "all")
         sort = request.GET.get("sort", "newest")
 
-        # --- ベースクエリ ---
-        qs = Product.objects.filter(user=user).prefetch_related(
-            Prefetch("categories", queryset=Category.objects.all().order_by("id"))
-        )
-
-        # --- キーワード検索 ---
-        if keyword:
-            qs = qs.filter(
-                Q(product_name__icontains=keyword) |
-                Q(shop_name__icontains=keyword)
-            )
-
-        # --- カテゴリ絞り込み ---
-        if selected_cats:
-            try:
-                ids = [int(c) for c in selected_cats]
-                global_ids = [i - 100 for i in ids if i >= 100]  # 共通カテゴリ
-                user_ids = [i for i in ids if i < 100]           # 独自カテゴリ
-
-                q_filter = Q()
-
-                # 共通カテゴリを実際の Category に変換
-                if global_ids:
-                    common_cats = Category.objects.filter(
-                        id__in=global_ids)
-                    cat_names = [c.category_name for c in common_cats]
-                    q_filter |= Q(
-                        categories__category_name__in=cat_names,
-                        categories__is_global=True,
-                        categories__user__isnull=True
-                    )
-
-                # 独自カテゴリ（ユーザー紐づき）
-                if user_ids:
-                    q_filter |= Q(
-                        categories__id__in=user_ids,
-                        categories__user=user,
-                        categories__is_global=False
-                    )
+        # --- 一覧結果（絞り込み条件ごとにキャッシュ。あれば主キーで商品を読み直すだけ） ---
+        result_key, sidebar_key = cache_keys(user.id, request.GET)
+        cached, sidebar = get_cached(result_key, sidebar_key)
 
-                if q_filter:
-                    qs = qs.filter(q_filter).distinct()
-
-            except ValueError:
-                pass
-
-        # --- 在庫フィルタ ---
-        if stock == "low":
-            qs = qs.filter(latest_stock_count__lte=3, latest_stock_count__gt=0)
-        elif stock == "none":
-            qs = qs.filter(is_in_stock=False)
-
-        # --- 優先度フィルタ ---
-        if priority in ["高", "普通"]:
-            qs = qs.filter(priority=priority)
-
-        # --- 並び替え ---
-        if sort == "newest":
-            qs = qs.order_by("-created_at")
-        elif sort == "oldest":
-            qs = qs.order_by("created_at")
-        elif sort == "price_asc":
-            qs = qs.order_by("latest_price", "initial_price")
-        elif sort == "price_desc":
-            qs = qs.order_by("-latest_price", "-initial_price")
+        if cached is None:
+            page_obj, filter_tags = _build_product_page(
+                request, user, keyword, selected_cats, stock, priority, sort)
+            set_cached(result_key, {
+                "ids": [p.id for p in page_obj],
+                "page": page_obj.state(),
+                "filter_tags": filter_tags,
+            })
         else:
-            qs = qs.order_by("-created_at")
+            page_obj = KeysetPage.from_state(
+                _products_by_ids(user, cached["ids"]), cached["page"], request.GET)
+            filter_tags = cached["filter_tags"]
+
+        # --- カテゴリ情報（商品登録と同じ構成に統一） ---
+        if sidebar is None:
+            sidebar = {
+                "global_categories": list(Category.objects.filter(
+                    is_global=True, user__isnull=True
+                ).order_by("id")),
+                "user_categories": list(Category.objects.filter(
+                    user=user, is_global=False
+                )),
+            }
+            set_cached(sidebar_key, sidebar)
 
         # --- 並び順オプション ---
         sort_options = [
@@ -143,64 +235,6 @@ def product_list(request: HttpRequest) -> HttpResponse:
             ("price_desc", "価格が高い順"),
         ]
 
-        # --- フィルタタグ生成 ---
-        filter_tags = []
-        if keyword:
-            filter_tags.append(
-                ("keyword", f"キーワード：{keyword}", "filter-tag-sort"))
-
-        if selected_cats:
-            try:
-                ids = [int(c) for c in selected_cats]
-                global_ids = [i - 100 for i in ids if i >= 100]
-                user_ids = [i for i in ids if i < 100]
-
-                category_cats = Category.objects.filter(
-                    id__in=global_ids, is_global=True)
-                for c in category_cats:
-                    filter_tags.append(
-                        ("cat", f"{c.category_name}", "filter-tag-common"))
-
-                user_cats = Category.objects.filter(id__in=user_ids, user=user)
-                for c in user_cats:
-                    filter_tags.append(
-                        ("cat", f"{c.category_name}", "filter-tag-user"))
-            except ValueError:
-                pass
-
-        if stock in ["low", "none"]:
-            label = "わずか" if stock == "low" else "なし"
-            filter_tags.append(("stock", f"在庫：{label}", "filter-tag-stock"))
-
-        if priority in ["高", "普通"]:
-            filter_tags.append(
-                ("priority", f"優先度：{priority}", "filter-tag-priority"))
-
-        sort_labels = {
-            "newest": "新しい順",
-            "oldest": "古い順",
-            "price_asc": "価格が安い順",
-            "price_desc": "価格が高い順",
-        }
-
-        if sort in sort_labels:
-            filter_tags.append(
-                ("sort", f"並び順：{sort_labels[sort]}", "filter-tag-sort"))
-
-        # --- ページネーション ---
-        paginator = Paginator(qs, 20)
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
-
-        # --- カテゴリ情報（商品登録と同じ構成に統一） ---
-        global_categories = Category.objects.filter(
-            is_global=True, user__isnull=True
-        ).order_by("id")
-
-        user_categories = Category.objects.filter(
-            user=request.user, is_global=False
-        )
-
         # 一覧画面では特定の商品は選択されていないため空でOK
         selected_category_ids = []
 
@@ -211,9 +245,8 @@ def product_list(request: HttpRequest) -> HttpResponse:
             {
                 "products": page_obj.object_list,
                 "page_obj": page_obj,
-                "paginator": paginator,
-                "global_categories": global_categories,
-                "user_categories": user_categories,
+                "global_categories": sidebar["global_categories"],
+                "user_categories": sidebar["user_categories"],
                 "selected_cats": selected_cats,
                 "keyword": keyword,
                 "stock": stock,
@@ -242,12 +275,10 @@ def product_detail(request, pk):
     product = get_object_or_404(Product, pk=pk, user=request.user)
 
     # ======================================================
-    # 価格履歴データ取得（過去180日分・昇順）
+    # 価格履歴データ取得（期間に応じて時間足・日足にまとめ、点数を上限以内に）
     # ======================================================
-    histories = (
-        PriceHistory.objects.filter(product=product)
-        .order_by("checked_at")[:180]
-    )
+    resolution, histories = get_chart_points(
+        product.id, days=parse_days(request.GET.get("days")))
 
     # ======================================================
     # 閾値ライン計算（通知条件に応じて）
@@ -260,20 +291,25 @@ def product_detail(request, pk):
             threshold_value = float(product.initial_price) * \
                 (1 - float(product.threshold_price) / 100)
     elif product.flag_type == "lowest_price":
-        threshold_value = None
+        # 過去最安値は集計テーブルから読む（履歴を走査しない）
+        stats = get_stats(product)
+        if stats and stats.min_price is not None:
+            threshold_value = float(stats.min_price)
 
     # ======================================================
     # 価格履歴データの整形
     # ======================================================
     price_data = []
-    for h in histories:
+    for checked_at, price, stock_count, low, high in histories:
         # 価格と在庫のデータを整形と補完
-        price = float(h.price) if h.price is not None else 0.0
-        stock = int(h.stock_count) if h.stock_count is not None else 0
+        price = float(price) if price is not None else 0.0
+        stock = int(stock_count) if stock_count is not None else 0
 
         price_data.append({
-            "date": h.checked_at.strftime("%Y-%m-%d"),
+            "date": format_point_date(checked_at, resolution),
             "price": price,
+            "low": float(low),
+            "high": float(high),
             "stock": stock,
             "threshold_value": threshold_value,
         })
@@ -309,11 +345,11 @@ def product_detail(request, pk):
 def get_price_data(request, product_id):
     try:
         # 商品情報を取得
-        product = Product.objects.get(id=product_id)
+        product = Product.objects.only("id", "threshold_price").get(id=product_id)
 
-        # 価格履歴データの取得（チェック日順で並べ替え）
-        price_history = PriceHistory.objects.filter(
-            product=product).order_by('checked_at')
+        # 価格履歴データの取得（?days= の期間に応じて粒度を選び、点数を上限以内に）
+        resolution, price_history = get_chart_points(
+            product.id, days=parse_days(request.GET.get("days")))
 
         # threshold_price が None の場合は 0 を設定
         threshold_price = float(
@@ -322,13 +358,15 @@ def get_price_data(request, product_id):
         # 価格データを整形
         price_data = [
             {
-                # 日付を 'YYYY-MM-DD' 形式に変換
-                'date': record.checked_at.strftime('%Y-%m-%d'),
-                'price': float(record.price),  # 価格を数値に変換
-                'stock': record.stock_count,  # 在庫数を取得
+                # 日足は 'YYYY-MM-DD'、それ以外は 'YYYY-MM-DD HH:MM'
+                'date': format_point_date(checked_at, resolution),
+                'price': float(price),  # 価格を数値に変換（区間の終値）
+                'low': float(low),  # 区間の安値
+                'high': float(high),  # 区間の高値
+                'stock': stock_count,  # 在庫数を取得
                 'threshold_price': threshold_price  # 閾値を設定
             }
-            for record in price_history
+            for checked_at, price, stock_count, low, high in price_history
         ]
 
         # 価格データが空であればエラーレスポンスを返す
@@ -336,7 +374,7 @@ def get_price_data(request, product_id):
             return JsonResponse({"error": "価格データがありません"}, status=404)
 
         # 価格データが正しく取得できた場合はそれを返す
-        return JsonResponse({"price_data": price_data})
+        return JsonResponse({"price_data": price_data, "resolution": resolution})
 
     except Product.DoesNotExist:
         # 商品が見つからない場合はエラーレスポンスを返す
@@ -1,6 +1,8 @@
 // =============================
 // 🔔 未読通知バッジ自動更新
 // =============================
+// サーバーからのプッシュ（SSE）で更新する。
+// EventSource が使えない・接続できない場合だけ 30秒ごとのポーリングに切り替える。
 document.addEventListener("DOMContentLoaded", () => {
     const badge = document.getElementById("unread-badge");
 
@@ -9,35 +11,70 @@ document.addEventListener("DOMContentLoaded", () => {
         return;
     }
 
+    const STREAM_URL = "/main/api/notifications/stream/";
+    const COUNT_URL = "/main/api/unread_count/";
+    let pollTimer = null;
+
+    function renderBadge(count) {
+        if (count > 0) {
+            badge.style.display = "inline-block";
+            badge.textContent = count;
+        } else {
+            badge.style.display = "none";
+        }
+    }
+
     async function updateUnreadCount() {
         try {
-            console.log("📡 未読件数を取得中...");
-            const res = await fetch("/main/api/unread_count/");
+            const res = await fetch(COUNT_URL);
 
             if (!res.ok) {
                 throw new Error("HTTPエラー: " + res.status);
             }
 
             const data = await res.json();
-            console.log("✅ API Response:", data);
-
-            const count = data.unread_count || 0;
-            console.log("📊 未読件数:", count);
-
-            if (count > 0) {
-                badge.style.display = "inline-block";
-                badge.textContent = count;
-                console.log("✅ バッジ更新完了:", count);
-            } else {
-                badge.style.display = "none";
-                console.log("ℹ️ 未読なし - バッジ非表示");
-            }
+            renderBadge(data.unread_count || 0);
         } catch (err) {
             console.error("❌ 未読件数取得エラー:", err);
         }
     }
 
-    // 初回実行 + 30秒ごとに更新
-    updateUnreadCount();
-    setInterval(updateUnreadCount, 30000);
+    function startPolling() {
+        if (pollTimer) return;
+        updateUnreadCount();
+        pollTimer = setInterval(updateUnreadCount, 30000);
+    }
+
+    if (!("EventSource" in window)) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource(STREAM_URL);
+
+    source.addEventListener("unread", (e) => {
+        const data = JSON.parse(e.data);
+        if (data.unread_count === null) {
+            // サーバー側で件数が分からない場合だけ取り直す
+            updateUnreadCount();
+        } else {
+            renderBadge(data.unread_count);
+        }
+    });
+
+    source.addEventListener("notification", (e) => {
+        // 新着通知：他のスクリプトでも使えるようにイベントとして流す
+        document.dispatchEvent(
+            new CustomEvent("kaidoki:notification", { detail: JSON.parse(e.data) })
+        );
+    });
+
+    source.addEventListener("error", () => {
+        // 自動再接続を諦めた（CLOSED）場合のみポーリングへ
+        // （WSGI で動いている場合、サーバーは 503 を返すのでここに来る）
+        if (source.readyState === EventSource.CLOSED) {
+            console.warn("⚠️ 通知ストリームに接続できません。ポーリングに切り替えます");
+            startPolling();
+        }
+    });
 });